@@ -2,15 +2,21 @@ import os
 import importlib
 import inspect
 import sys
+import multiprocessing
 import config_super
 import main
 
-def all_factor_pipeline(CONFIG):
-    # 获取当前工作目录的父目录
-    parent_dir = os.path.dirname(os.getcwd())
-    # 创建一个字典来保存所有的结果
-    cal_metric_results = {}
-    merged_result = {}
+def discover_pipelines(parent_dir):
+    """
+    预先遍历目录，找出所有需要运行的 pipeline 文件
+
+    参数:
+    parent_dir: str, 遍历的根目录
+
+    返回值:
+    pipelines: list, 每个元素为 (pipeline 文件路径, 所在目录, 结果树中的路径层级)
+    """
+    pipelines = []
     # 遍历父目录及其所有子目录
     for root, dirs, files in os.walk(parent_dir):
         for file in files:
@@ -18,64 +24,135 @@ def all_factor_pipeline(CONFIG):
             if file.endswith('pipeline.py') and not file.endswith('all_pipeline.py'):
                 # 获取文件的完整路径
                 file_path = os.path.join(root, file)
-
                 # 解析文件的路径层级
                 path_components = file_path.split(os.sep)
                 path_key = path_components[path_components.index(parent_dir.split(os.sep)[-1]):][1:-1]
+                pipelines.append((file_path, root, path_key))
+    return pipelines
+
+# pipeline 配置中按工作目录解析的相对路径
+PATH_KEYS_CUSTOM = ["data_dir", "incremental_dir"]
+PATH_KEYS_CONFIG = ["output_dir", "cal_model_dir", "output_model_dir"]
+
+def resolve_paths(config, keys, work_dir):
+    """
+    将配置中的相对路径按工作目录转换为绝对路径，绝对路径保持不变
+
+    参数:
+    config: dict, 配置字典，直接修改
+    keys: list, 需要转换的配置项
+    work_dir: str, 工作目录
+    """
+    for key in keys:
+        if isinstance(config.get(key), str):
+            config[key] = os.path.normpath(os.path.join(work_dir, config[key]))
+
+def get_entry_function(pipeline, file_path):
+    """
+    取 pipeline 的入口函数：模块中定义了 PIPELINE_ENTRY 时使用该名称，否则使用与文件同名的函数
+
+    参数:
+    pipeline: module, 已导入的 pipeline 模块
+    file_path: str, pipeline 文件路径
+
+    返回值:
+    entry_function: function, 入口函数；不存在时为 None
+    """
+    default_name = os.path.splitext(os.path.basename(file_path))[0]
+    entry_function = getattr(pipeline, getattr(pipeline, 'PIPELINE_ENTRY', default_name), None)
+    return entry_function if inspect.isfunction(entry_function) else None
+
+def run_pipeline(file_path, work_dir, CONFIG):
+    """
+    以指定工作目录运行单个 pipeline，并行时在各自的子进程中执行；不切换进程的当前目录，配置中的相对路径按工作目录解析
+
+    参数:
+    file_path: str, pipeline 文件路径
+    work_dir: str, pipeline 的工作目录，pipeline 配置中的相对路径均以此为准
+    CONFIG: dict, 全局配置，会覆盖 pipeline 所在目录 config.py 中的同名配置
+
+    返回值:
+    result: dict, pipeline 的计算结果；没有入口函数时为 None
+    """
+    # 导入 'config.py' 文件，并在导入 pipeline 期间作为 config 模块，使 pipeline 中的 from config import 取到同目录的配置
+    spec = importlib.util.spec_from_file_location('config', os.path.join(work_dir, 'config.py'))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    previous_config = sys.modules.get('config')
+    sys.modules['config'] = config
+    try:
+        # 导入 'pipeline.py' 文件
+        spec = importlib.util.spec_from_file_location('pipeline', file_path)
+        pipeline = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(pipeline)
+    finally:
+        if previous_config is None:
+            sys.modules.pop('config', None)
+        else:
+            sys.modules['config'] = previous_config
+
+    # 合并 'config' 和 'config_super'，相对路径按 pipeline 的工作目录解析
+    config.CONFIG.update(CONFIG)
+    resolve_paths(config.CONFIG, PATH_KEYS_CONFIG, work_dir)
+    resolve_paths(config.config_custom, PATH_KEYS_CUSTOM, work_dir)
+
+    # 调用 'pipeline.py' 文件中与文件同名的入口函数
+    entry_function = get_entry_function(pipeline, file_path)
+    if entry_function is None:
+        return None
+    return entry_function(config.config_custom, config.CONFIG)
+
+def all_factor_pipeline(CONFIG):
+    # 获取当前工作目录的父目录
+    parent_dir = os.path.dirname(os.getcwd())
+    # 创建一个字典来保存所有的结果
+    cal_metric_results = {}
+    merged_result = {}
+    # 预先找出所有 pipeline
+    pipelines = discover_pipelines(parent_dir)
+
+    # 根据全局配置决定是否并行运行各个 pipeline，兼容布尔值和字符串两种写法
+    if CONFIG["multiProcess_all_factor"] in (True, "True"):
+        # 子进程不能再创建进程池，pipeline 内部（包括 Alpha 的并行模式）改为顺序计算
+        pipeline_config = dict(CONFIG, multiProcess_all_factor=False, multiProcess_alpha=False)
+        max_workers = CONFIG["max_workers"] or multiprocessing.cpu_count()
+        max_workers = max(1, min(max_workers, len(pipelines)))
+        # 每个子进程只运行一个 pipeline，避免不同 pipeline 之间的模块缓存和路径互相影响
+        with multiprocessing.Pool(processes=max_workers, maxtasksperchild=1) as pool:
+            async_results = [pool.apply_async(run_pipeline, (file_path, work_dir, pipeline_config)) for file_path, work_dir, path_key in pipelines]
+            results = [async_result.get() for async_result in async_results]
+    else:
+        results = [run_pipeline(file_path, work_dir, CONFIG) for file_path, work_dir, path_key in pipelines]
 
-                # 导入 'pipeline.py' 文件
-                spec = importlib.util.spec_from_file_location('pipeline', file_path)
-                pipeline = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(pipeline)
-
-                # 切换到 'pipeline.py' 文件所在的目录
-                os.chdir(root)
-
-                # 导入 'config.py' 文件
-                spec = importlib.util.spec_from_file_location('config', os.path.join(root, 'config.py'))
-                config = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(config)
-
-                # 合并 'config' 和 'config_super'
-                config.CONFIG.update(CONFIG)
-
-                # 获取 'pipeline.py' 文件中最外层的函数
-                outer_function = None
-                for name, obj in inspect.getmembers(pipeline):
-                    if inspect.isfunction(obj):
-                        outer_function = obj
-                        break
-
-                # 调用 'pipeline.py' 文件中的函数
-                if outer_function is not None:
-                    result = outer_function(config.config_custom, config.CONFIG)
-                    for key, value in result.items():
-                        # 将键值对添加到新字典中
-                        merged_result[key] = value
-                    print(merged_result)
-                    # 将结果保存在字典中
-                    current_level = cal_metric_results
-                    for component in path_key[:]:
-                        if component not in current_level:
-                            current_level[component] = {}
-                        current_level = current_level[component]
-                    current_level[path_key[-1]] = result
-                # 切换回父目录
-                os.chdir(parent_dir)
+    # 按发现顺序合并结果
+    for (file_path, work_dir, path_key), result in zip(pipelines, results):
+        if result is None:
+            continue
+        for key, value in result.items():
+            # 将键值对添加到新字典中
+            merged_result[key] = value
+        print(merged_result)
+        # 将结果保存在字典中
+        current_level = cal_metric_results
+        for component in path_key[:]:
+            if component not in current_level:
+                current_level[component] = {}
+            current_level = current_level[component]
+        current_level[path_key[-1]] = result
     # 生成汇总表
     import merge_perfomance
     cal_metric_results['performance_total'] = merge_perfomance.merged_performance(merged_result)
     print(cal_metric_results)
 
     # ------------输出-------------
-    # 获取当前脚本所在的目录路径
-    script_directory = os.path.dirname(__file__)
-    # 将当前工作目录更改为当前脚本所在的目录
-    os.chdir(script_directory)
-    sys.path.append(CONFIG["output_model_dir"])
+    # 输出相关的相对路径按当前脚本所在的目录解析
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    output_config = dict(CONFIG)
+    resolve_paths(output_config, ["output_dir", "output_model_dir"], script_directory)
+    sys.path.append(output_config["output_model_dir"])
     import output_file
-    output_file_path = os.path.join(CONFIG['output_dir'], "cal_metric_indicator.pkl")
-    cal_metric_results = output_file.output_func(cal_metric_results, output_file_path)
+    output_file_path = os.path.join(output_config['output_dir'], "cal_metric_indicator.pkl")
+    cal_metric_results = output_file.output_func(cal_metric_results, output_file_path, CONFIG["output_format"])
 
     return cal_metric_results
 
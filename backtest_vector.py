@@ -72,6 +72,42 @@ def transform_frequency(FREQUENCY_INTERVAL, date_range_src, freq_position='start
         date_range_src.index = date_range_src.values
     return date_range_src
 
+def get_position_code_by_factor(position_tb_original):
+    """
+    根据因子数据批量获取截面排序后的持仓编码
+
+    参数:
+    position_tb_original: DataFrame, 原始的持仓数据表，交易日期，列为资产名称
+
+    返回值:
+    position_code_tb: DataFrame, 持仓编码表，交易日期，列为从 1 开始的排序序号，值为资产在 asset_columns 中的整数位置
+    asset_columns: Index, 资产编码对照表，asset_columns[code] 即为对应的资产名称
+    """
+    asset_columns = position_tb_original.columns
+    values = position_tb_original.to_numpy(dtype=float)
+    # 取负后做一次整体的稳定升序排序，等价于逐行 sort_values(ascending=False, kind='mergesort')：
+    # 并列值保持原列顺序，NaN 按原列顺序排在最后
+    position_code = np.argsort(-values, axis=1, kind='mergesort')
+    position_code_tb = pd.DataFrame(position_code, index=position_tb_original.index, columns=range(1, len(asset_columns) + 1))
+    return position_code_tb, asset_columns
+
+def decode_position_code(position_code_tb, asset_columns):
+    """
+    将持仓编码表还原为以资产名称表示的持仓数据表
+
+    参数:
+    position_code_tb: DataFrame, 持仓编码表，值为资产在 asset_columns 中的整数位置，-1 表示无持仓
+    asset_columns: Index, 资产编码对照表
+
+    返回值:
+    DataFrame, 持仓数据表，值为资产名称，无持仓处为 NaN
+    """
+    position_code = position_code_tb.to_numpy()
+    # 在对照表末尾追加一个 NaN，使编码 -1 直接映射为空值
+    lookup = np.append(np.asarray(asset_columns, dtype=object), np.nan)
+    position_tb = pd.DataFrame(lookup[position_code], index=position_code_tb.index, columns=position_code_tb.columns)
+    return position_tb
+
 def get_position_by_factor(position_tb_original, time_label=False):
     """
     根据因子数据获取持仓数据
@@ -95,13 +131,9 @@ def get_position_by_factor(position_tb_original, time_label=False):
         # 添加一个 'total' 列，如果原始数据的任何一列不为空，则值为原始数据中最大值的列名，否则为 None
         position_tb['total'] = np.where(position_tb_original.notnull().any(axis=1), position_tb_original.idxmax(axis=1),None)
     else:
-        # 创建一个空的 DataFrame，用于存储持仓数据，列名为从 1 到原始数据列数的整数
-        position_tb = pd.DataFrame(index=position_tb_original.index, columns=range(1, len(position_tb_original.columns) + 1))
-        for date, row in position_tb_original.iterrows():
-            # 对每一行，按值降序排序，然后将索引（即资产名）添加到新的 DataFrame 中
-            sorted_assets = list(row.sort_values(ascending=False, kind='mergesort').index)
-            for i, asset in enumerate(sorted_assets, start=1):
-                position_tb.loc[date, i] = asset
+        # 一次性对整张因子矩阵做截面排序，得到整数编码后再还原为资产名，列名为从 1 到原始数据列数的整数
+        position_code_tb, asset_columns = get_position_code_by_factor(position_tb_original)
+        position_tb = decode_position_code(position_code_tb, asset_columns)
     return position_tb
 
 def rebuild_tb_by_position(position_tb, tb, lag=0):
@@ -126,12 +158,43 @@ def rebuild_tb_by_position(position_tb, tb, lag=0):
         except KeyError as e:
             print(f"KeyError: {e}. Skipping this iteration.")
     return rebuilt_tb.astype(float)
+
 '''
 
 def rebuild_tb_by_position(position_tb, tb, lag=0):
     return position_tb.apply(lambda series: series.apply(lambda x: None if pd.isnull(x) else tb.shift(-lag).loc[series.name, x]))
 '''
 
+def rebuild_tb_by_position_code(position_code_tb, asset_columns, tbs, lag=0):
+    """
+    根据持仓编码一次性重构多张数据表（gather 模式）
+    参数:
+    position_code_tb: DataFrame, 持仓编码表，行为日期，列为序号，值为资产在 asset_columns 中的整数位置，-1 表示无持仓
+    asset_columns: Index, 资产编码对照表
+    tbs: list of DataFrame, 需要重构的数据表（如因子、收益率、价格），行为日期，列为资产
+    lag: int, 可选，数据的滞后期，默认为0
+    返回值:
+    list of DataFrame, 与 tbs 一一对应的重构后数据表，行为日期，列为序号
+    """
+    dates = position_code_tb.index
+    rows = []
+    for tb in tbs:
+        values = tb.reindex(columns=asset_columns).to_numpy(dtype=float)
+        # 滞后处理等价于 tb.shift(-lag)：直接在行号上做偏移，越界或缺失日期的行置为空值
+        row_idx = tb.index.get_indexer(dates)
+        valid_row = row_idx >= 0
+        row_idx = row_idx + lag
+        valid_row &= (row_idx >= 0) & (row_idx < len(values))
+        gathered = values[np.where(valid_row, row_idx, 0)]
+        gathered[~valid_row] = np.nan
+        rows.append(gathered)
+    # 堆叠为 (表 × 日期 × 资产) 的三维数组，用持仓编码一次性取出所有表的值
+    panel = np.stack(rows) if rows else np.empty((0, len(dates), len(asset_columns)))
+    position_code = position_code_tb.to_numpy(dtype=int)
+    rebuilt = np.take_along_axis(panel, np.clip(position_code, 0, None)[np.newaxis, :, :], axis=2)
+    rebuilt[:, position_code < 0] = np.nan
+    return [pd.DataFrame(rebuilt_values, index=dates, columns=position_code_tb.columns) for rebuilt_values in rebuilt]
+
 def backtest(factor_tb_original, price_tb_original, date_range_src, start_date, end_date,FREQUENCY_INTERVAL,period,freq_position):
     """
         进行回测
@@ -161,13 +224,20 @@ def backtest(factor_tb_original, price_tb_original, date_range_src, start_date,
     # 转换频率
     frequency_interval = transform_frequency(FREQUENCY_INTERVAL, date_range_src, freq_position).drop_duplicates()
     position_tb_original = factor_tb_original.reindex(frequency_interval)
-    position_tb = get_position_by_factor(position_tb_original)
-    position_tb = position_tb.reindex(date_range_src, method='ffill')
-
-    #factor_tb = position_tb.applymap(lambda positions: None if pd.isnull(positions) else factor_tb_original.loc[position_tb.index, positions].shift(0))
-    factor_tb = rebuild_tb_by_position(position_tb, factor_tb_original, lag=0)
-    ret_tb = rebuild_tb_by_position(position_tb, ret_tb_original, lag=0)
-    price_tb = rebuild_tb_by_position(position_tb, price_tb_original, lag=0)
+    if len(position_tb_original.columns) == 1:
+        position_tb = get_position_by_factor(position_tb_original)
+        position_tb = position_tb.reindex(date_range_src, method='ffill')
+
+        #factor_tb = position_tb.applymap(lambda positions: None if pd.isnull(positions) else factor_tb_original.loc[position_tb.index, positions].shift(0))
+        factor_tb = rebuild_tb_by_position(position_tb, factor_tb_original, lag=0)
+        ret_tb = rebuild_tb_by_position(position_tb, ret_tb_original, lag=0)
+        price_tb = rebuild_tb_by_position(position_tb, price_tb_original, lag=0)
+    else:
+        # 多资产时以整数编码表示持仓，前向填充后一次性 gather 出因子、收益率和价格，最后再还原为资产名
+        position_code_tb, asset_columns = get_position_code_by_factor(position_tb_original)
+        position_code_tb = position_code_tb.reindex(date_range_src, method='ffill').fillna(-1).astype(int)
+        factor_tb, ret_tb, price_tb = rebuild_tb_by_position_code(position_code_tb, asset_columns, [factor_tb_original, ret_tb_original, price_tb_original], lag=0)
+        position_tb = decode_position_code(position_code_tb, asset_columns)
 
     return ret_tb_original, factor_tb_original,price_tb,ret_tb,factor_tb,position_tb,date_range_src,period
 
@@ -1,8 +1,35 @@
 import pandas as pd
 import numpy as np
 import copy
-from scipy.stats import spearmanr, pearsonr
-from cal_metric_model import ffn_metric,quantstats_metric,empyrical_metric,pyfinance_metric,alphalens_metric
+from cal_metric_model import ffn_metric,quantstats_metric,empyrical_metric,pyfinance_metric,alphalens_metric,native_metric
+
+def get_group_label(tb, subportfolio_num):
+    """
+    根据截面排序获取分组标签矩阵
+
+    参数:
+    tb: DataFrame, 排序依据的数据表，交易日期，列为标的名称
+    subportfolio_num: int, 子投资组合的数量
+
+    返回值:
+    group_label_tb: DataFrame, 分组标签数据表，与 tb 形状一致，值为 1 到 subportfolio_num 的组别
+    """
+    values = tb.to_numpy(dtype=float)
+    n_rows, n_cols = values.shape
+    # 每行降序稳定排序，并列值保持原列顺序，NaN 排在最后，与逐行 sort_values(ascending=False, kind='mergesort') 一致
+    order = np.argsort(-values, axis=1, kind='mergesort')
+    # 将排序结果还原为每个标的在本行中的排名位置
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.broadcast_to(np.arange(n_cols), (n_rows, n_cols)), axis=1)
+    group_size = n_cols // subportfolio_num
+    if group_size == 0:
+        # 标的数量少于分组数时，前面的组为空，全部标的都归入最后一组
+        label = np.full((n_rows, n_cols), subportfolio_num)
+    else:
+        # 按排名位置切分，多余的标的都放在最后一组
+        label = np.minimum(rank // group_size, subportfolio_num - 1) + 1
+    group_label_tb = pd.DataFrame(label, index=tb.index, columns=tb.columns)
+    return group_label_tb
 
 def portfolio_by_ret(ret_tb, subportfolio_num):
     """
@@ -17,18 +44,69 @@ def portfolio_by_ret(ret_tb, subportfolio_num):
     """
     portfolio_tb = pd.DataFrame(index=ret_tb.index)
     portfolio_tb['total'] = ret_tb.mean(axis=1)
-    for date, row in ret_tb.iterrows():
-        sorted_factor = row.sort_values(ascending=False, kind='mergesort')
-        group_size = len(sorted_factor) // subportfolio_num
-        for i in range(subportfolio_num):
-            if i == subportfolio_num - 1:  # 如果是最后一组
-                group_factor = sorted_factor[i * group_size:]  # 将剩余的基金都放在最后一组
-            else:
-                group_factor = sorted_factor[i * group_size:(i + 1) * group_size]
-            portfolio_tb.loc[date, f'group_{i + 1}'] = group_factor.mean()
+    values = ret_tb.to_numpy(dtype=float)
+    label = get_group_label(ret_tb, subportfolio_num).to_numpy()
+    valid = ~np.isnan(values)
+    # 以 (行号, 组别) 作为桶编号，用 bincount 一次性求出所有日期、所有组的和与个数
+    bucket = (np.arange(len(values))[:, np.newaxis] * subportfolio_num + label - 1)[valid]
+    n_bucket = len(values) * subportfolio_num
+    group_sum = np.bincount(bucket, weights=values[valid], minlength=n_bucket).reshape(-1, subportfolio_num)
+    group_count = np.bincount(bucket, minlength=n_bucket).reshape(-1, subportfolio_num)
+    # 没有有效数据的组均值为空值
+    with np.errstate(invalid='ignore', divide='ignore'):
+        group_mean = np.where(group_count > 0, group_sum / group_count, np.nan)
+    for i in range(subportfolio_num):
+        portfolio_tb[f'group_{i + 1}'] = group_mean[:, i]
     portfolio_tb['long_short'] = portfolio_tb['group_1'] - portfolio_tb[f'group_{subportfolio_num}']
     return portfolio_tb
 
+def rowwise_corr(x, y):
+    """
+    按行计算两个矩阵的 Pearson 相关系数，空值位置不参与计算
+
+    参数:
+    x: ndarray, 二维数组，行为样本截面
+    y: ndarray, 与 x 形状相同的二维数组，空值位置须与 x 一致
+
+    返回值:
+    ndarray, 每行的相关系数，有效样本少于 2 个或方差为 0 时为空值
+    """
+    n = np.sum(~np.isnan(x), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 先对每行去均值，再用中心化后的矩求协方差和方差
+        x_demean = x - (np.nansum(x, axis=1) / n)[:, np.newaxis]
+        y_demean = y - (np.nansum(y, axis=1) / n)[:, np.newaxis]
+        cov = np.nansum(x_demean * y_demean, axis=1)
+        var_x = np.nansum(x_demean * x_demean, axis=1)
+        var_y = np.nansum(y_demean * y_demean, axis=1)
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(n < 2) | (var_x == 0) | (var_y == 0)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+def rowwise_ic(factor_values, ret_values, masks):
+    """
+    在多组样本掩码下批量计算 rank_ic 和 normal_ic
+
+    参数:
+    factor_values: ndarray, 因子值，形状为 (日期, 标的)，或可广播到 masks 的形状
+    ret_values: ndarray, 收益率，形状为 (日期, 标的)，或可广播到 masks 的形状（如按滞后期堆叠的三维数组）
+    masks: ndarray, 布尔掩码，形状为 (组数, 日期, 标的)，True 表示该样本参与计算
+
+    返回值:
+    rank_ic: ndarray, 形状为 (组数, 日期) 的 rank_ic
+    normal_ic: ndarray, 形状为 (组数, 日期) 的 normal_ic
+    """
+    n_mask, n_rows, n_cols = masks.shape
+    # 掩码外的位置置为空值，把所有组摊平为一张二维表，一次完成排序和相关系数计算
+    factor_masked = np.where(masks, factor_values, np.nan).reshape(-1, n_cols)
+    ret_masked = np.where(masks, ret_values, np.nan).reshape(-1, n_cols)
+    normal_ic = rowwise_corr(factor_masked, ret_masked)
+    # 与 spearmanr 一致，并列值取平均排名
+    factor_rank = pd.DataFrame(factor_masked).rank(axis=1).to_numpy()
+    ret_rank = pd.DataFrame(ret_masked).rank(axis=1).to_numpy()
+    rank_ic = rowwise_corr(factor_rank, ret_rank)
+    return rank_ic.reshape(n_mask, n_rows), normal_ic.reshape(n_mask, n_rows)
+
 def calculate_ic(factor_tb, ret_tb,subportfolio_num):
     """
     计算全样本的IC和分组IC
@@ -42,49 +120,46 @@ def calculate_ic(factor_tb, ret_tb,subportfolio_num):
     rank_ic_tb: DataFrame, rank_ic数据表
     normal_ic_tb: DataFrame, normal_ic数据表
     """
+    # 只做一次下期收益率的平移，并与因子表对齐
+    ret_fwd = ret_tb.shift(-1).reindex(index=factor_tb.index, columns=factor_tb.columns)
+    factor_values = factor_tb.to_numpy(dtype=float)
+    ret_values = ret_fwd.to_numpy(dtype=float)
+    # 因子和收益率都为有限值的样本才参与计算
+    valid = np.isfinite(factor_values) & np.isfinite(ret_values)
+
+    # 第 0 层为全样本，其余各层为按因子排序后的分组样本
+    label = get_group_label(factor_tb, subportfolio_num).to_numpy()
+    masks = np.stack([valid] + [valid & (label == i + 1) for i in range(subportfolio_num)])
+    rank_ic, normal_ic = rowwise_ic(factor_values, ret_values, masks)
+
     rank_ic_tb = pd.DataFrame(index=factor_tb.index)
     normal_ic_tb = pd.DataFrame(index=factor_tb.index)
-
-    # 计算全样本的IC
-    for date in factor_tb.index:
-        factor_values = factor_tb.loc[date]
-        returns = ret_tb.shift(-1).loc[date]
-        valid_data = pd.concat([factor_values, returns], axis=1)
-        valid_data = valid_data.replace([np.inf, -np.inf], np.nan).dropna()
-        if len(valid_data) < 2:
-            continue
-        factor_values, returns = valid_data.iloc[:, 0], valid_data.iloc[:, 1]
-        rank_ic = spearmanr(factor_values, returns)[0]
-        normal_ic = pearsonr(factor_values, returns)[0]
-        rank_ic_tb.loc[date, 'total'] = rank_ic
-        normal_ic_tb.loc[date, 'total'] = normal_ic
-
-    '''
-    rank_ic_tb['total'] = factor_tb.replace([np.inf, -np.inf], np.nan).apply(lambda x: spearmanr(x, ret_tb.replace([np.inf, -np.inf], np.nan).shift(-1).loc[x.name])[0], axis=1)
-    normal_ic_tb['total'] = factor_tb.replace([np.inf, -np.inf], np.nan).apply(lambda x: pearsonr(x, ret_tb.replace([np.inf, -np.inf], np.nan).shift(-1).loc[x.name])[0], axis=1)
-    '''
-
-    # 分组计算IC
-    for date, row in factor_tb.iterrows():
-        sorted_factor = row.sort_values(ascending=False, kind='mergesort')
-        group_size = len(sorted_factor) // subportfolio_num
-        for i in range(subportfolio_num):
-            if i == subportfolio_num - 1:  # 如果是最后一组
-                group_factor = sorted_factor[i * group_size:]  # 将剩余的基金都放在最后一组
-            else:
-                group_factor = sorted_factor[i * group_size:(i + 1) * group_size]
-            group_returns = ret_tb.shift(-1).loc[date, group_factor.index]
-            valid_data = pd.concat([group_factor, group_returns], axis=1)
-            valid_data = valid_data.replace([np.inf, -np.inf], np.nan).dropna()
-            if len(valid_data) < 2:
-                continue
-            group_factor, group_returns = valid_data.iloc[:, 0], valid_data.iloc[:, 1]
-            rank_ic = spearmanr(group_factor, group_returns)[0]
-            normal_ic = pearsonr(group_factor, group_returns)[0]
-            rank_ic_tb.loc[date, f'rank_ic_{i + 1}'] = rank_ic
-            normal_ic_tb.loc[date, f'normal_ic_{i + 1}'] = normal_ic
+    rank_ic_tb['total'] = rank_ic[0]
+    normal_ic_tb['total'] = normal_ic[0]
+    for i in range(subportfolio_num):
+        rank_ic_tb[f'rank_ic_{i + 1}'] = rank_ic[i + 1]
+        normal_ic_tb[f'normal_ic_{i + 1}'] = normal_ic[i + 1]
     return rank_ic_tb, normal_ic_tb
 
+def positions_to_slice(pos):
+    """
+    把等差递增的位置数组转换为等价的切片，便于以视图方式取数
+
+    参数:
+    pos: ndarray, 整数位置数组
+
+    返回值:
+    index: slice 或 ndarray, 位置等差递增时为切片，否则原样返回 pos
+    """
+    if len(pos) == 0:
+        return slice(0, 0)
+    if len(pos) == 1:
+        return slice(int(pos[0]), int(pos[0]) + 1)
+    step = int(pos[1] - pos[0])
+    if step > 0 and (np.diff(pos) == step).all():
+        return slice(int(pos[0]), int(pos[-1]) + 1, step)
+    return pos
+
 def calculate_ic_lag(factor_tb, ret_tb,lag):
     """
     计算滞后期IC
@@ -92,31 +167,48 @@ def calculate_ic_lag(factor_tb, ret_tb,lag):
     参数:
     factor_tb: DataFrame, 因子数据表，交易日期，列为标的名称
     ret_tb: DataFrame, 收益率数据表，交易日期，列为标的名称
-    lag: int, 滞后期数
+    lag: int 或 list, 滞后期数
 
     返回值:
     rank_ic_lag_df: DataFrame, 滞后的排名rank_ic数据表
     normal_ic_lag_df: DataFrame, 滞后的normal_ic数据表
+
+    说明:
+    各滞后期的远期收益率取自补齐后收益率表上的滑动视图，滞后期等差且日期连续时不复制数据；
+    按有效样本掩码置空时会复制一次 (滞后期, 日期, 标的) 立方体，这一次复制无法避免
     """
-    rank_ic_lag_df = pd.DataFrame()
-    normal_ic_lag_df = pd.DataFrame()
-    for date, row in factor_tb.iterrows():
-        # 对因子值排序，采用降序排序
-        sorted_factor = row.sort_values(ascending=False, kind='mergesort')
-        if date in ret_tb.index:
-            for i in lag:
-                # 获取滞后期的收益率
-                returns = ret_tb.shift(-i).loc[date]
-                valid_data = pd.concat([sorted_factor, returns], axis=1)
-                valid_data = valid_data.replace([np.inf, -np.inf], np.nan).dropna()
-                if len(valid_data) < 2:
-                    continue
-                factor, returns = valid_data.iloc[:, 0], valid_data.iloc[:, 1]
-                rank_ic = spearmanr(factor, returns)[0]
-                normal_ic = pearsonr(factor, returns)[0]
-                rank_ic_lag_df.loc[date, f'rank_ic_{i}'] = rank_ic
-                normal_ic_lag_df.loc[date, f'normal_ic_{i}'] = normal_ic
-    return rank_ic_lag_df, normal_ic_lag_df
+    if isinstance(lag, (int, np.integer)):
+        lag = [lag]
+    lags = np.asarray(list(lag), dtype=int)
+    # 只计算收益率表中存在的日期
+    row_pos = ret_tb.index.get_indexer(factor_tb.index)
+    dates = factor_tb.index[row_pos >= 0]
+    row_pos = row_pos[row_pos >= 0]
+    factor_values = factor_tb.loc[dates].to_numpy(dtype=float)
+    ret_values = ret_tb.reindex(columns=factor_tb.columns).to_numpy(dtype=float)
+    n_cols = ret_values.shape[1]
+
+    # 前后补齐空值行，使任意滞后期越界时取到空值，等价于 ret_tb.shift(-i)
+    pad_front = max(0, -int(lags.min())) if len(lags) else 0
+    pad_back = max(0, int(lags.max())) if len(lags) else 0
+    ret_padded = np.concatenate([np.full((pad_front, n_cols), np.nan), ret_values, np.full((pad_back, n_cols), np.nan)])
+    # 用 as_strided 构造 (偏移, 日期, 标的) 的滑动视图，第 k 层即 ret_tb.shift(-(k - pad_front))，不复制数据
+    window = pad_front + pad_back + 1
+    ret_window = np.lib.stride_tricks.as_strided(ret_padded, shape=(window, ret_values.shape[0], n_cols), strides=(ret_padded.strides[0], ret_padded.strides[0], ret_padded.strides[1]), writeable=False)
+    # 滞后期等差、日期连续（常见情形）时按切片取出，立方体仍是视图；否则只能按位置取出需要的 (滞后期, 日期) 行
+    lag_index, row_index = positions_to_slice(lags + pad_front), positions_to_slice(row_pos)
+    if not isinstance(lag_index, slice) and not isinstance(row_index, slice):
+        lag_index = lag_index[:, np.newaxis]
+    ret_cube = ret_window[lag_index, row_index]
+    # 唯一无法避免的复制发生在 rowwise_ic 中按有效样本掩码置空时
+    masks = np.isfinite(factor_values)[np.newaxis, :, :] & np.isfinite(ret_cube)
+    rank_ic, normal_ic = rowwise_ic(factor_values, ret_cube, masks)
+
+    rank_ic_lag_df = pd.DataFrame(rank_ic.T, index=dates, columns=[f'rank_ic_{i}' for i in lags])
+    normal_ic_lag_df = pd.DataFrame(normal_ic.T, index=dates, columns=[f'normal_ic_{i}' for i in lags])
+    # 所有滞后期有效样本都少于 2 个的日期不保留
+    has_sample = (masks.sum(axis=2) >= 2).any(axis=0)
+    return rank_ic_lag_df[has_sample], normal_ic_lag_df[has_sample]
 
 def calculate_ic_statistics(df):
     """
@@ -199,25 +291,38 @@ def cal_turnoverRate(position_df, price_tb, group_df, subportfolio_num):
     返回值:
     turnover_tb: DataFrame, 换手率数据表
     """
-    turnover_tb = pd.DataFrame(index=position_df.index, columns=['total_turnover_rate'] + [f'group_{i}_turnover_rate' for i in range(1, subportfolio_num + 1)])
-    for date_idx in range(1, len(position_df.index)):
-        date = position_df.index[date_idx]
-        prev_date = position_df.index[date_idx - 1]
-        if date in price_tb.index and prev_date in price_tb.index:
-            changed_stocks = group_df.loc[date] != group_df.loc[prev_date]
-            turnover_value = price_tb.loc[date, changed_stocks].sum()
-            total_value = price_tb.loc[date].sum()
-            total_turnover_rate = turnover_value / total_value if total_value != 0 else 0
-            turnover_tb.loc[date, 'total_turnover_rate'] = total_turnover_rate
-            for group in range(1, subportfolio_num + 1):
-                group_changed_stocks = (group_df.loc[date] == group) & (group_df.loc[prev_date] == group)
-                group_turnover_value = price_tb.loc[date, group_changed_stocks].sum()
-                group_total_value = price_tb.loc[date, group_changed_stocks].sum()
-                group_turnover_rate = group_turnover_value / group_total_value if group_total_value != 0 else 0
-                turnover_tb.loc[date, f'group_{group}_turnover_rate'] = group_turnover_rate
+    columns = ['total_turnover_rate'] + [f'group_{i}_turnover_rate' for i in range(1, subportfolio_num + 1)]
+    turnover = np.full((len(position_df.index), len(columns)), np.nan)
+    # 持仓日期在价格表中的行号，当日和前一日都存在时才计算换手率
+    row_pos = price_tb.index.get_indexer(position_df.index)
+    valid = (row_pos[1:] >= 0) & (row_pos[:-1] >= 0)
+    cur_pos, prev_pos = row_pos[1:][valid], row_pos[:-1][valid]
+    group_values = group_df.reindex(index=price_tb.index, columns=price_tb.columns).to_numpy(dtype=float)
+    price_values = price_tb.to_numpy(dtype=float)
+    group_now, group_prev, price_now = group_values[cur_pos], group_values[prev_pos], price_values[cur_pos]
+
+    # 全样本：组别发生变化的标的按当日价格加权，占当日全部标的价格的比例
+    changed = group_now != group_prev
+    turnover_value = np.nansum(np.where(changed, price_now, 0), axis=1)
+    total_value = np.nansum(price_now, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total_turnover_rate = np.where(total_value != 0, turnover_value / total_value, 0)
+
+    # 分组：当日新进入该组的标的价格，占当日该组全部标的价格的比例
+    groups = np.arange(1, subportfolio_num + 1)[:, np.newaxis, np.newaxis]
+    in_group = group_now[np.newaxis, :, :] == groups
+    entered = in_group & (group_prev[np.newaxis, :, :] != groups)
+    group_turnover_value = np.nansum(np.where(entered, price_now, 0), axis=2)
+    group_total_value = np.nansum(np.where(in_group, price_now, 0), axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        group_turnover_rate = np.where(group_total_value != 0, group_turnover_value / group_total_value, 0)
+
+    rows = np.arange(1, len(position_df.index))[valid]
+    turnover[rows, 0] = total_turnover_rate
+    turnover[rows, 1:] = group_turnover_rate.T
+    turnover_tb = pd.DataFrame(turnover, index=position_df.index, columns=columns)
     return turnover_tb
 
-
 def cal_netValue_statistics(nav_tb, period):
     """
         计算并返回基本金融量化指标。
@@ -331,7 +436,33 @@ def cal_performance(ret_tb, benchmark, period, winlen):
 
     return ffn_performance, empyrical_performance, empyrical_performance_with_factors, qs_performance, pyf_performance, pyf_performance_other
 
-def cal_portfolio_metric(price_tb_original, ret_tb, factor_tb, position_tb,benchmark,subportfolio_num,IC_lag_n,period, winlen,avgretplot=(5, 15)):
+def cal_performance_native(ret_tb, period):
+    """
+    使用原生向量化指标计算逐年和全区间的绩效
+
+    参数:
+    ret_tb: DataFrame, 组合收益率数据表，交易日期，列为组合名称
+    period: str or int, 数据频率
+
+    返回值:
+    native_performance: dict, 键为年份或 'alltime'，值为绩效数据表
+    """
+    native_performance = {}
+    years = ret_tb.index.year
+    # 按年份展开为 (年内序号, 组合 x 年份) 的宽表，所有年份、所有组合一次计算；年内数据不足一年的尾部补空值，不影响指标
+    yearly_tb = ret_tb.copy()
+    yearly_tb.index = pd.MultiIndex.from_arrays([years, ret_tb.groupby(years).cumcount().values], names=['year', 'row'])
+    yearly_performance = native_metric(yearly_tb.unstack('year'), period)
+    year_level = yearly_performance.index.get_level_values(-1)
+    for year, size in ret_tb.groupby(years).size().items():
+        if size > 1:
+            native_performance[str(year)] = yearly_performance[year_level == year].droplevel(-1)
+        else:
+            print(f"{year} 年仅有一条数据不能计算指标")
+    native_performance["alltime"] = native_metric(ret_tb, period)
+    return native_performance
+
+def cal_portfolio_metric(price_tb_original, ret_tb, factor_tb, position_tb,benchmark,subportfolio_num,IC_lag_n,period, winlen,avgretplot=(5, 15),metric_mode='native'):
     """
     计算投资组合指标
 
@@ -345,6 +476,7 @@ def cal_portfolio_metric(price_tb_original, ret_tb, factor_tb, position_tb,bench
     IC_lag_n: int, IC滞后期数
     period: str, 期间
     winlen: int, 窗口长度
+    metric_mode: str, 绩效计算模式，'native' 只使用原生向量化指标，'compat' 额外调用 ffn、quantstats、empyrical、pyfinance 计算
 
     返回值:
     cal_metric_results: dict, 包含投资组合指标的字典
@@ -367,7 +499,11 @@ def cal_portfolio_metric(price_tb_original, ret_tb, factor_tb, position_tb,bench
     turnover_tb = cal_turnoverRate(position_tb, price_tb_original, group_tb, subportfolio_num)
     stats_tb = cal_netValue_statistics(nav_tb, period)
     if not portfolio_tb.isna().all().all():
-        ffn_performance, empyrical_performance, empyrical_performance_with_factors, qs_performance, pyf_performance, pyf_performance_other = cal_performance(portfolio_tb, benchmark, period, winlen)
+        native_performance = cal_performance_native(portfolio_tb, period)
+        if metric_mode == 'compat':
+            ffn_performance, empyrical_performance, empyrical_performance_with_factors, qs_performance, pyf_performance, pyf_performance_other = cal_performance(portfolio_tb, benchmark, period, winlen)
+        else:
+            ffn_performance = empyrical_performance = empyrical_performance_with_factors = qs_performance = pyf_performance = pyf_performance_other = None
         alphalens_perf = None
         try:
             from alphalens.utils import MaxLossExceededError
@@ -377,6 +513,7 @@ def cal_portfolio_metric(price_tb_original, ret_tb, factor_tb, position_tb,bench
             print(e)
     else:
         ffn_performance = empyrical_performance = empyrical_performance_with_factors = qs_performance = pyf_performance = pyf_performance_other = None
+        native_performance = None
         alphalens_perf = None
     cal_metric_results = {
         'portfolio_tb': portfolio_tb,
@@ -402,6 +539,7 @@ def cal_portfolio_metric(price_tb_original, ret_tb, factor_tb, position_tb,bench
         'qs_performance': qs_performance,
         'pyf_performance': pyf_performance,
         'pyf_performance_rolling': pyf_performance_other,
+        'native_performance': native_performance,
         'alphalens_perf': alphalens_perf
     }
     return cal_metric_results
@@ -1,3 +1,4 @@
+import warnings
 import pandas as pd
 import numpy as np
 from ffn.utils import fmtn, fmtp
@@ -676,6 +677,108 @@ def pyfinance_metric(df, benchmark):
     print("pyf",results_df)
     return results_df,results_df_other
 
+def native_metric(df, period):
+    """
+        一次性计算所有组合列的常用绩效指标，作为 ffn、quantstats、empyrical、pyfinance 的原生替代。
+        指标包括:
+        Total Return: 总回报
+        CAGR: 复合年增长率
+        Annual Mean: 年化均值
+        Annual Volatility: 年化波动率
+        Sharpe Ratio: 夏普比率（无风险利率为0）
+        Sortino Ratio: 索提诺比率
+        Max Drawdown: 最大回撤
+        Calmar Ratio: Calmar比率
+        Skew: 偏度
+        Kurt: 峰度
+        Best: 最佳回报
+        Worst: 最差回报
+        Win Rate: 胜率（不含收益为0的期数）
+        Avg Win: 平均盈利
+        Avg Loss: 平均亏损
+        Payoff Ratio: 盈亏比
+        Profit Factor: 利润因子
+        VaR: 风险价值（历史法，95%）
+        CVaR: 条件风险价值
+        Tail Ratio: 尾部比率
+    :param df, DataFrame: 组合收益率数据，列为组合名称。
+    :param period, str or int: 数据频率，'D'、'W'、'M'、'Q'、'Y' 或一年包含的数据条数。
+    :return: results_df, DataFrame: 行为组合名称、列为指标名称的绩效表。
+    """
+    # 一年包含的数据条数
+    if isinstance(period, (int, np.integer)) and not isinstance(period, bool):
+        ann_factor = int(period)
+    else:
+        ann_factor = {'D': 252, 'W': 52, 'M': 12, 'Q': 4, 'Y': 1}.get(period, 252)
+
+    returns = df.to_numpy(dtype=float)
+    valid = ~np.isnan(returns)
+    count = valid.sum(axis=0)
+    filled = np.where(valid, returns, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        # 全为空值的组合会触发 All-NaN 警告，结果按空值处理即可
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        # 累计净值与总回报、复合年增长率
+        nav = np.cumprod(1 + filled, axis=0)
+        total_return = nav[-1] - 1
+        cagr = (1 + total_return) ** (ann_factor / count) - 1
+        # 年化均值、波动率与夏普比率
+        mean = np.nansum(returns, axis=0) / count
+        std = np.sqrt(np.nansum((returns - mean) ** 2, axis=0) / (count - 1))
+        sharpe = mean / std * np.sqrt(ann_factor)
+        # 下行风险与索提诺比率
+        downside = np.sqrt(np.nansum(np.minimum(returns, 0) ** 2, axis=0) / count) * np.sqrt(ann_factor)
+        sortino = mean * ann_factor / downside
+        # 最大回撤：净值相对于历史最高点（含起始净值1）的最大跌幅
+        peak = np.maximum(np.maximum.accumulate(nav, axis=0), 1)
+        max_drawdown = np.min(nav / peak - 1, axis=0)
+        calmar = cagr / np.abs(max_drawdown)
+        # 盈亏统计
+        win = valid & (returns > 0)
+        loss = valid & (returns < 0)
+        win_sum = np.where(win, returns, 0).sum(axis=0)
+        loss_sum = np.where(loss, returns, 0).sum(axis=0)
+        win_rate = win.sum(axis=0) / (win.sum(axis=0) + loss.sum(axis=0))
+        avg_win = win_sum / win.sum(axis=0)
+        avg_loss = loss_sum / loss.sum(axis=0)
+        payoff_ratio = avg_win / np.abs(avg_loss)
+        profit_factor = win_sum / np.abs(loss_sum)
+        best = np.nanmax(returns, axis=0)
+        worst = np.nanmin(returns, axis=0)
+        # 尾部风险
+        quantile = np.nanpercentile(returns, [5, 95], axis=0)
+        value_at_risk = quantile[0]
+        cvar = np.nansum(np.where(returns <= value_at_risk, returns, np.nan), axis=0) / np.sum(returns <= value_at_risk, axis=0)
+        tail_ratio = np.abs(quantile[1]) / np.abs(quantile[0])
+
+    results_df = pd.DataFrame({
+        'Total Return': total_return,
+        'CAGR': cagr,
+        'Annual Mean': mean * ann_factor,
+        'Annual Volatility': std * np.sqrt(ann_factor),
+        'Sharpe Ratio': sharpe,
+        'Sortino Ratio': sortino,
+        'Max Drawdown': max_drawdown,
+        'Calmar Ratio': calmar,
+        'Skew': df.skew().to_numpy(dtype=float),
+        'Kurt': df.kurt().to_numpy(dtype=float),
+        'Best': best,
+        'Worst': worst,
+        'Win Rate': win_rate,
+        'Avg Win': avg_win,
+        'Avg Loss': avg_loss,
+        'Payoff Ratio': payoff_ratio,
+        'Profit Factor': profit_factor,
+        'VaR': value_at_risk,
+        'CVaR': cvar,
+        'Tail Ratio': tail_ratio,
+    }, index=df.columns)
+    # 无任何有效数据的组合不输出
+    results_df = results_df[count > 0]
+    # 将正负无穷统一为空值
+    results_df = results_df.replace([np.inf, -np.inf], np.nan)
+    return results_df
+
 import alphalens as al
 
 
@@ -23,6 +23,8 @@ CONFIG = {
     "output_model_dir":"../../",
     # 结果输出路径
     "output_dir": "../result/",
+    # 结果输出格式；"pickle"：整个结果字典保存为一个 pickle 文件；"feather"、"parquet"：每张表单独保存，并用 manifest.json 记录嵌套路径，可按需读取单张表；
+    "output_format": "pickle",  # "feather" "parquet"
     # 回测开始日期；支持'年-月-日'['2018-11-23']、'年-月-日 时:分:秒'['2018-11-23 11:12:13']、'年-月-日 时:分:秒.毫秒'['2018-11-23 11:12:13.12345']格式;
     "start_date": '2018-01-01',
     # 回测结束日期；支持'年-月-日'['2018-11-23']、'年-月-日 时:分:秒'['2018-11-23 11:12:13']、'年-月-日 时:分:秒.毫秒'['2018-11-23 11:12:13.12345']格式;
@@ -43,6 +45,8 @@ CONFIG = {
     "IC_types": ["IC_all_crossSection", "IC_subportfolio_crossSection", "IC_subportfolio_retRatio"],
     # IC滞后值，可以是list或者int，也可以置空；pipeline中使用；
     "IC_lag_n": [1, 2, 3],  # [1,2,3]
+    # 绩效指标计算模式；"native"：只使用原生向量化指标；"compat"：额外调用 ffn、quantstats、empyrical、pyfinance 逐个计算（兼容模式，速度较慢）；
+    "metric_mode": "native",  # "compat"
 
     # all_factor层是否并行，只在all_factor_Demo使用，pipeline、backtest中不使用；
     "multiProcess_all_factor": False,
@@ -0,0 +1,135 @@
+import os
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_bool_dtype
+
+# 进程内共享的数据缓存：{(数据类型, 绝对路径, 修改时间, 读取参数): (数据, 字节数)}，按最近使用顺序淘汰
+data_cache = OrderedDict()
+# 缓存数据的总字节数上限
+max_cache_bytes = 1024 ** 3
+
+def source_key(file_path):
+    """
+    数据文件的缓存标识，文件被修改后标识随之变化
+    :param file_path, str: 文件路径
+    :return: key, tuple: (绝对路径, 修改时间)
+    """
+    file_path = os.path.abspath(file_path)
+    return file_path, os.stat(file_path).st_mtime_ns
+
+def data_nbytes(data):
+    # 缓存数据占用的字节数（含索引和文本列中的字符串），字典按其中各项累加
+    if isinstance(data, dict):
+        return sum(data_nbytes(value) for value in data.values())
+    if isinstance(data, np.ndarray):
+        return int(data.nbytes)
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(index=True, deep=True).sum())
+    if isinstance(data, pd.Series):
+        return int(data.memory_usage(index=False, deep=True))
+    if isinstance(data, pd.Index):
+        return int(data.memory_usage(deep=True))
+    return 0
+
+def cached(key, loader):
+    """
+    从缓存中取数据，不存在时调用 loader 解析并放入缓存；超过字节上限时淘汰最久未使用的数据
+    :param key, tuple: 缓存键
+    :param loader, function: 无参数的解析函数
+    :return: data: 缓存中的数据
+    """
+    if key in data_cache:
+        data_cache.move_to_end(key)
+        return data_cache[key][0]
+    data = loader()
+    # 字节数在放入缓存时计算一次
+    data_cache[key] = (data, data_nbytes(data))
+    total = sum(nbytes for _, nbytes in data_cache.values())
+    while total > max_cache_bytes and len(data_cache) > 1:
+        _, (_, evicted) = data_cache.popitem(last=False)
+        total -= evicted
+    return data
+
+def freeze_table(tb):
+    """
+    将表拆成缓存用的只读数据：float64 列拼成一个设为不可写的二维数组，其余列（文本、整数等）各保存一份副本
+    :param tb, DataFrame: 表
+    :return: frozen, dict: {'index': 索引, 'columns': 全部列名, 'float_columns': float64 列名, 'values': 只读数组, 'other': {列名: Series}}
+    """
+    is_float = np.array([dtype == np.float64 for dtype in tb.dtypes], dtype=bool)
+    float_columns = tb.columns[is_float]
+    # 形状为 (列, 行) 且按行连续，与 pandas 数据块的布局一致，构造表时不需要复制
+    values = np.ascontiguousarray(tb.loc[:, is_float].to_numpy(dtype=np.float64).T)
+    values.setflags(write=False)
+    other = {column: tb[column].copy() for column in tb.columns[~is_float]}
+    return {'index': tb.index, 'columns': tb.columns, 'float_columns': float_columns, 'values': values, 'other': other}
+
+def table_view(frozen):
+    """
+    由 freeze_table 的结果构造表：float64 列直接包装只读数组，不复制数据，误写会直接报错而不会改动缓存；
+    其余列使用副本；各列保持原来的顺序和类型
+    :param frozen, dict: freeze_table 的结果
+    :return: tb, DataFrame: 表
+    """
+    tb = pd.DataFrame(frozen['values'].T, index=frozen['index'], columns=frozen['float_columns'], copy=False)
+    for loc, column in enumerate(frozen['columns']):
+        if column in frozen['other']:
+            tb.insert(loc, column, frozen['other'][column].copy())
+    tb.columns.name = frozen['columns'].name
+    return tb
+
+def csv_dtypes(file_path, text_columns=(), sample_rows=1000):
+    """
+    按前 sample_rows 行推断 CSV 各列的类型：数值列指定为 float64，text_columns 指定为字符串，其余文本列不指定
+    :param file_path, str: 文件路径
+    :param text_columns, list: 按字符串读取的列，如日期列、标的代码列
+    :param sample_rows, int: 用于推断类型的行数
+    :return: dtype, dict: {列名: 类型}
+    """
+    sample = pd.read_csv(file_path, nrows=sample_rows)
+    dtype = {column: 'float64' for column in sample.columns
+             if is_numeric_dtype(sample[column]) and not is_bool_dtype(sample[column])}
+    dtype.update({column: str for column in text_columns if column in sample.columns})
+    return dtype
+
+def read_csv_typed(file_path, text_columns=(), **kwargs):
+    """
+    按 csv_dtypes 推断的类型读取 CSV；样本之后出现文本导致数值列转换失败时，只指定 text_columns 的类型重新读取
+    :param file_path, str: 文件路径
+    :param text_columns, list: 按字符串读取的列
+    :return: tb, DataFrame: 读取的表
+    """
+    try:
+        return pd.read_csv(file_path, dtype=csv_dtypes(file_path, text_columns), **kwargs)
+    except ValueError:
+        return pd.read_csv(file_path, dtype={column: str for column in text_columns}, **kwargs)
+
+def parse_price_table(file_path, columns=None, index_col='Date', date_format=None):
+    # 解析价格表：CSV 的日期列为字符串，数值列为 float64，文本列保持原样；pickle 直接读取
+    if file_path.endswith('.pkl'):
+        tb = pd.read_pickle(file_path)
+        if index_col in tb.columns:
+            tb = tb.set_index(index_col)
+    else:
+        usecols = [index_col] + list(columns) if columns is not None else None
+        tb = read_csv_typed(file_path, [index_col], usecols=usecols, index_col=index_col)
+    if columns is not None:
+        tb = tb[list(columns)]
+    if date_format is not None:
+        tb.index = pd.to_datetime(tb.index, format=date_format)
+    return tb
+
+def load_price_table(file_path, columns=None, index_col='Date', date_format=None):
+    """
+    读取价格表：同一文件（路径和修改时间相同）、相同列只解析一次，之后直接使用缓存
+    :param file_path, str: 文件路径，支持 csv 和 pkl
+    :param columns, list: 需要的列（不含日期列），None 表示全部列
+    :param index_col, str: 设为索引的日期列；pickle 文件已将日期设为索引时忽略
+    :param date_format, str: 日期格式，如 '%Y/%m/%d'，按格式转换为时间索引；None 时保留原始字符串
+    :return: price_tb, DataFrame: 价格表的只读视图，数值列为 float64、文本列保持原样；可以新增列，不能修改原有数据
+    """
+    key = ('table',) + source_key(file_path) + (tuple(columns) if columns is not None else None, index_col, date_format)
+    frozen = cached(key, lambda: freeze_table(parse_price_table(file_path, columns, index_col, date_format)))
+    # 每次构造新表：共享只读数据，调用方新增列、修改索引不影响缓存
+    return table_view(frozen)
@@ -247,7 +247,7 @@ def create_app(result,CONFIG=None):
             return 'heatmap'
         if key in ['stats_tb']:
             return 'table'
-        if key in ['ffn_performance', 'empyrical_performance', 'empyrical_performance_rolling','qs_performance', 'pyf_performance', 'pyf_performance_rolling','alphalens_perf']:
+        if key in ['ffn_performance', 'empyrical_performance', 'empyrical_performance_rolling','qs_performance', 'pyf_performance', 'pyf_performance_rolling','native_performance','alphalens_perf']:
             return 'per_table'
         elif key in ['portfolio_tb', 'nav_tb','ret_tb', 'rank_ic', 'rank_ic_lag', 'normal_ic_lag', 'rank_ic_cum', 'rank_ic_ma12',
                      'normal_ic', 'normal_ic_cum', 'normal_ic_ma12', 'turnover_tb']:
@@ -286,8 +286,10 @@ def create_app(result,CONFIG=None):
             # 如果 column_name 是 'factorname'，则跳过后面的处理步骤
             if column_name == 'factorname':
                 return tb
-            # 移除百分号并除以100
-            tb[column_name] = tb[column_name].str.rstrip('%').astype('float') / 100.0
+            # 移除百分号并除以100；原生指标本身为数值，无需转换
+            percent_column = tb[column_name].dtype == object
+            if percent_column:
+                tb[column_name] = tb[column_name].str.rstrip('%').astype('float') / 100.0
             # 根据 min_value 和 max_value 进行筛选
             if min_value != sys.float_info.min and max_value != sys.float_info.max:
                 tb = tb[(tb[column_name] >= min_value) & (tb[column_name] <= max_value)]
@@ -296,7 +298,8 @@ def create_app(result,CONFIG=None):
             elif max_value != sys.float_info.max:
                 tb = tb[tb[column_name] <= max_value]
             # 将某一列数据转换为百分比形式
-            tb[column_name] = (tb[column_name] * 100).astype(str) + '%'
+            if percent_column:
+                tb[column_name] = (tb[column_name] * 100).astype(str) + '%'
 
             # 删除 'factorname' 列中不在 session['selected_factor'] 列表里面的因子名称所在行
         tb = tb[tb['factorname'].isin(session['selected_factor'])]
@@ -33,7 +33,7 @@ def merged_performance(merged_result):
     if 'performance_total' in merged_result:
         del merged_result['performance_total']
     # 遍历 ffn_performance 等绩效包
-    for performance_type in ['ffn_performance', 'empyrical_performance', 'empyrical_performance_rolling','qs_performance', 'pyf_performance','pyf_performance_rolling']:
+    for performance_type in ['ffn_performance', 'empyrical_performance', 'empyrical_performance_rolling','qs_performance', 'pyf_performance','pyf_performance_rolling','native_performance']:
         # 处理性能数据
         performance_total = process_performance_data(merged_result, performance_type)
         # 将处理后的性能数据加到 result 中
@@ -1,7 +1,175 @@
+import os
+import json
 import pickle
-def output_func(result_dir, output_file_path):
-    # 将结果字典保存到一个 pickle 文件中
-    with open(output_file_path, 'wb') as f:
-        pickle.dump(result_dir, f)
+import numpy as np
+import pandas as pd
+
+def output_func(result_dir, output_file_path, output_format='pickle'):
+    """
+    保存结果字典
+    :param result_dir, dict: 嵌套的结果字典
+    :param output_file_path, str: 输出文件路径，如 result/cal_metric_indicator.pkl
+    :param output_format, str: 输出格式，'pickle' 将整个字典保存为一个 pickle 文件；
+                               'feather' 或 'parquet' 按表分别保存到与输出文件同名的目录中，并生成 manifest.json 记录嵌套路径
+    :return: result_dir, dict: 原结果字典
+    """
+    if output_format in ('feather', 'parquet'):
+        store_dir = os.path.splitext(output_file_path)[0]
+        output_store(result_dir, store_dir, output_format)
+    else:
+        # 将结果字典保存到一个 pickle 文件中
+        with open(output_file_path, 'wb') as f:
+            pickle.dump(result_dir, f)
     return result_dir
 
+def output_store(result_dir, store_dir, output_format='feather'):
+    """
+    将嵌套结果字典按表保存为列式存储
+    :param result_dir, dict: 嵌套的结果字典
+    :param store_dir, str: 存储目录
+    :param output_format, str: 'feather' 或 'parquet'
+    :return: manifest, list: 每张表的嵌套路径、文件名和格式
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = []
+    # 深度优先遍历嵌套字典，每个叶子节点保存为一个文件
+    stack = [([], result_dir)]
+    while stack:
+        path, value = stack.pop()
+        if isinstance(value, dict) and value:
+            for key in reversed(list(value.keys())):
+                stack.append((path + [key], value[key]))
+            continue
+        file_name = f'table_{len(manifest)}'
+        entry = {'path': [json_key(key) for key in path]}
+        if value is None:
+            entry['kind'] = 'none'
+        elif isinstance(value, (pd.DataFrame, pd.Series)):
+            entry.update(write_table(value, os.path.join(store_dir, file_name), output_format))
+        else:
+            entry.update(write_pickle(value, os.path.join(store_dir, file_name)))
+        manifest.append(entry)
+    with open(os.path.join(store_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+def json_key(key):
+    # 字典键保留 JSON 可表示的原始类型，其余转换为字符串
+    return key if isinstance(key, (str, int, float, bool)) else str(key)
+
+def write_pickle(value, file_path):
+    # 非表格数据或列式格式无法表示的表使用 pickle 保存
+    with open(file_path + '.pkl', 'wb') as f:
+        pickle.dump(value, f)
+    return {'kind': 'pickle', 'file': os.path.basename(file_path) + '.pkl', 'format': 'pickle'}
+
+def write_table(tb, file_path, output_format):
+    """
+    将单张表保存为 feather 或 parquet 文件，无法列式保存时回退为 pickle
+    :param tb, DataFrame or Series: 需要保存的表
+    :param file_path, str: 不含扩展名的文件路径
+    :param output_format, str: 'feather' 或 'parquet'
+    :return: entry, dict: manifest 中该表的信息
+    """
+    kind = 'Series' if isinstance(tb, pd.Series) else 'DataFrame'
+    df = tb.to_frame() if kind == 'Series' else tb
+    columns = [c.item() if isinstance(c, np.generic) else c for c in df.columns]
+    # 列名须为 JSON 可表示的简单类型才能在读取时还原，多级列名等情况直接保存为 pickle
+    if isinstance(df.columns, pd.MultiIndex) or not all(isinstance(c, (str, int, float, bool)) for c in columns):
+        return write_pickle(tb, file_path)
+    index_names = list(df.index.names)
+    index_columns = [f'__index_level_{i}__' for i in range(len(index_names))]
+    # 列式格式要求默认索引和字符串列名：索引转为普通列，列名统一按位置命名，原始标签记录在 manifest 中
+    data = df.copy()
+    data.columns = [f'__column_{i}__' for i in range(len(columns))]
+    data.index = data.index.set_names(index_columns)
+    data = data.reset_index()
+    extension = '.feather' if output_format == 'feather' else '.parquet'
+    try:
+        if output_format == 'feather':
+            data.to_feather(file_path + extension)
+        else:
+            data.to_parquet(file_path + extension, index=False)
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        # 未安装 pyarrow 或存在混合类型的列时回退为 pickle，先删除写了一半的文件
+        if os.path.exists(file_path + extension):
+            os.remove(file_path + extension)
+        return write_pickle(tb, file_path)
+    return {
+        'kind': kind,
+        'file': os.path.basename(file_path) + extension,
+        'format': output_format,
+        'columns': columns,
+        'index_names': index_names,
+        'name': json_key(tb.name) if kind == 'Series' and tb.name is not None else None,
+    }
+
+def read_manifest(store_dir):
+    """
+    读取列式存储的 manifest
+    :param store_dir, str: 存储目录
+    :return: manifest, list: 每张表的嵌套路径、文件名和格式
+    """
+    with open(os.path.join(store_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def read_table(store_dir, path, manifest=None, columns=None):
+    """
+    按嵌套路径只读取一张表，feather 和 parquet 文件使用内存映射读取
+    :param store_dir, str: 存储目录
+    :param path, list: 嵌套路径，如 ['OBV_signal', 'nav_tb']
+    :param manifest, list: 可选，已读取的 manifest，避免重复读取
+    :param columns, list: 可选，只读取指定的列（原始列名）
+    :return: 对应的 DataFrame、Series 或其他对象
+    """
+    if manifest is None:
+        manifest = read_manifest(store_dir)
+    path = [json_key(key) for key in path]
+    for entry in manifest:
+        if entry['path'] == path:
+            return read_entry(store_dir, entry, columns)
+    raise KeyError(f"{path} not found in {store_dir}")
+
+def read_entry(store_dir, entry, columns=None):
+    # 根据 manifest 中的记录读取单个叶子节点
+    if entry['kind'] == 'none':
+        return None
+    file_path = os.path.join(store_dir, entry['file'])
+    if entry['format'] == 'pickle':
+        with open(file_path, 'rb') as f:
+            return pickle.load(f)
+    n_index = len(entry['index_names'])
+    index_columns = [f'__index_level_{i}__' for i in range(n_index)]
+    # 列名按 manifest 中的原始标签映射回存储时的位置列名
+    positions = range(len(entry['columns'])) if columns is None else [entry['columns'].index(c) for c in columns]
+    read_columns = index_columns + [f'__column_{i}__' for i in positions]
+    if entry['format'] == 'feather':
+        import pyarrow.feather as feather
+        data = feather.read_table(file_path, columns=read_columns, memory_map=True).to_pandas()
+    else:
+        import pyarrow.parquet as pq
+        data = pq.read_table(file_path, columns=read_columns, memory_map=True).to_pandas()
+    data = data.set_index(index_columns)
+    data.index = data.index.set_names(entry['index_names'])
+    data.columns = [entry['columns'][i] for i in positions]
+    if entry['kind'] == 'Series':
+        data = data.iloc[:, 0].rename(entry['name'])
+    return data
+
+def load_store(store_dir):
+    """
+    读取整个列式存储并还原为嵌套结果字典
+    :param store_dir, str: 存储目录
+    :return: result_dir, dict: 嵌套的结果字典
+    """
+    result_dir = {}
+    for entry in read_manifest(store_dir):
+        current_level = result_dir
+        for key in entry['path'][:-1]:
+            current_level = current_level.setdefault(key, {})
+        value = read_entry(store_dir, entry)
+        if entry['path']:
+            current_level[entry['path'][-1]] = value
+        else:
+            result_dir = value
+    return result_dir
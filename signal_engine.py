@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import data_loader
+
+def resolve_position(entry, exit, close=None, lossratio=None, start=0):
+    """
+    由开仓、平仓条件生成持仓序列：第 i 天满足开仓条件且空仓时，第 i+1 天持仓为 1；第 i 天满足平仓条件或触发止损且持仓时，第 i+1 天持仓为 0；
+    其余情况保持前一天的持仓。传入 日期 x 标的 的 DataFrame 时所有标的一次计算。
+    :param entry, Series or DataFrame: 开仓条件，布尔值
+    :param exit, Series or DataFrame: 平仓条件，布尔值，与 entry 同形
+    :param close, Series or DataFrame: 收盘价，止损时记录开仓价格，与 entry 同形或为所有标的共用的一列；不止损时可以为 None
+    :param lossratio, float: 最大损失率，收盘价相对开仓价格的跌幅超过该值时平仓；None 表示不止损
+    :param start, int: 从第 start 个日期开始判断条件，之前的持仓为 0
+    :return: position, Series or DataFrame: 持仓，0 或 1，索引与 entry 相同
+    """
+    entry_values = np.asarray(entry, dtype=bool).copy()
+    exit_values = np.asarray(exit, dtype=bool).copy()
+    entry_values[:start] = False
+    exit_values[:start] = False
+    # 价格为正时跌幅不会超过 100%，最大损失率不小于 1 等同于不止损
+    if lossratio is not None and lossratio >= 1:
+        lossratio = None
+    if lossratio is None and not (entry_values & exit_values).any():
+        # 开仓、平仓条件互斥且不止损时，持仓只由最近一次事件决定：向前填充事件后整体后移一天
+        event = pd.DataFrame(np.where(entry_values, 1.0, np.where(exit_values, 0.0, np.nan)).reshape(len(entry_values), -1))
+        position = event.ffill().shift(1).fillna(0).values.astype(int)
+    else:
+        position = position_kernel(entry_values, exit_values, close, lossratio)
+    if isinstance(entry, pd.DataFrame):
+        return pd.DataFrame(position.reshape(entry.shape), index=entry.index, columns=entry.columns)
+    return pd.Series(position.reshape(len(entry)), index=entry.index)
+
+def position_kernel(entry, exit, close=None, lossratio=None):
+    """
+    逐日更新持仓状态，每一步对所有标的同时计算；用于止损（依赖开仓价格）以及开仓、平仓条件同时成立的情况
+    :param entry, ndarray: 开仓条件，日期 x 标的 或一维
+    :param exit, ndarray: 平仓条件，与 entry 同形
+    :param close, Series or DataFrame or ndarray: 收盘价，止损时使用；一维时所有标的共用
+    :param lossratio, float: 最大损失率；None 表示不止损
+    :return: position, ndarray: 持仓，日期 x 标的
+    """
+    entry = entry.reshape(len(entry), -1)
+    exit = exit.reshape(len(exit), -1)
+    position = np.zeros(entry.shape, dtype=int)
+    holding = np.zeros(entry.shape[1], dtype=bool)
+    if lossratio is not None:
+        # 所有标的共用一列收盘价时按列广播
+        close = np.broadcast_to(np.asarray(close, dtype=float).reshape(len(entry), -1), entry.shape)
+        price_in = np.full(entry.shape[1], np.nan)
+    for i in range(len(entry) - 1):
+        # 空仓时开仓
+        opened = ~holding & entry[i]
+        # 持仓时平仓或止损
+        closed = holding & exit[i]
+        if lossratio is not None:
+            with np.errstate(invalid='ignore'):
+                closed |= holding & (close[i] / price_in - 1 < -lossratio)
+            price_in = np.where(opened, close[i], price_in)
+        holding = opened | (holding & ~closed)
+        position[i + 1] = holding
+    return position
+
+def wide_panel(panel, date_col='Date', asset_col='code', date_format=None):
+    """
+    将多标的行情整理为 {字段: 日期 x 标的 的 DataFrame}，日期转换为时间格式并排序
+    :param panel, DataFrame: 长表（每行为一个日期、一个标的，列为 open/high/low/close/volume 等字段）或宽表（两层列名 字段 x 标的）
+    :param date_col, str: 长表中日期所在列名，已设为索引时可以不包含该列
+    :param asset_col, str: 长表中标的代码所在列名
+    :param date_format, str: 日期格式，如 '%Y/%m/%d'；None 时自动识别
+    :return: price_panel, dict: {字段: 日期 x 标的 的 DataFrame}
+    """
+    if not isinstance(panel.columns, pd.MultiIndex):
+        # 长表：日期、标的作为索引后展开为两层列名
+        if date_col in panel.columns:
+            panel = panel.set_index(date_col)
+        panel = panel.set_index(asset_col, append=True).unstack(asset_col)
+    panel = panel.copy()
+    panel.index = pd.to_datetime(panel.index, format=date_format)
+    panel = panel.sort_index()
+    return {field: panel[field] for field in panel.columns.get_level_values(0).unique()}
+
+def parse_panel(file_path, date_col='Date', asset_col='code', date_format=None):
+    # 解析多标的行情：pickle 直接读取；CSV 包含标的列时为长表，日期、标的为字符串，数值字段为 float64，文本字段保持原样，否则按前两行为列名的宽表读取
+    if file_path.endswith('.pkl'):
+        panel = pd.read_pickle(file_path)
+    else:
+        header = pd.read_csv(file_path, nrows=0).columns
+        if asset_col in header:
+            panel = data_loader.read_csv_typed(file_path, [date_col, asset_col])
+        else:
+            panel = pd.read_csv(file_path, header=[0, 1], index_col=0)
+    return wide_panel(panel, date_col, asset_col, date_format)
+
+def load_panel(file_path, date_col='Date', asset_col='code', date_format=None):
+    """
+    读取多标的行情文件，pickle 文件保存长表或宽表 DataFrame；CSV 文件包含标的列时为长表，否则按前两行为列名的宽表读取；
+    同一文件只解析一次，之后使用 data_loader 中的缓存
+    :param file_path, str: 文件路径
+    :param date_col, str: 日期所在列名
+    :param asset_col, str: 长表中标的代码所在列名
+    :param date_format, str: 日期格式，如 '%Y/%m/%d'；None 时自动识别
+    :return: price_panel, dict: {字段: 日期 x 标的 的只读 DataFrame}
+    """
+    key = ('panel',) + data_loader.source_key(file_path) + (date_col, asset_col, date_format)
+    panel = data_loader.cached(key, lambda: {field: data_loader.freeze_table(tb) for field, tb in parse_panel(file_path, date_col, asset_col, date_format).items()})
+    return {field: data_loader.table_view(frozen) for field, frozen in panel.items()}
@@ -11,6 +11,8 @@ CONFIG = {
     "output_model_dir":"../../../../",
     # 结果输出路径
     "output_dir": "result/",
+    # 结果输出格式；"pickle"：整个结果字典保存为一个 pickle 文件；"feather"、"parquet"：每张表单独保存，并用 manifest.json 记录嵌套路径，可按需读取单张表；
+    "output_format": "pickle",  # "feather" "parquet"
     # 回测开始日期；支持'年-月-日'['2018-11-23']、'年-月-日 时:分:秒'['2018-11-23 11:12:13']、'年-月-日 时:分:秒.毫秒'['2018-11-23 11:12:13.12345']格式;
     "start_date": '2018-01-01',
     # 回测结束日期；支持'年-月-日'['2018-11-23']、'年-月-日 时:分:秒'['2018-11-23 11:12:13']、'年-月-日 时:分:秒.毫秒'['2018-11-23 11:12:13.12345']格式;
@@ -32,9 +34,13 @@ CONFIG = {
     "IC_types": ["IC_all_crossSection", "IC_subportfolio_crossSection", "IC_subportfolio_retRatio"],
     # IC滞后值，可以是list或者int，也可以置空；pipeline中使用；
     "IC_lag_n": [1, 2, 3],
+    # 绩效指标计算模式；"native"：只使用原生向量化指标；"compat"：额外调用 ffn、quantstats、empyrical、pyfinance 逐个计算（兼容模式，速度较慢）；
+    "metric_mode": "native",  # "compat"
 
     # all_factor层是否并行，只在all_factor_Demo使用，pipeline、backtest中不使用；
     "multiProcess_all_factor": False,
+    # 并行时的进程数；为 None 时使用 CPU 核数；
+    "max_workers": None,
     # multi_run层是否并行
     "multiProcess_multiRun": True,  # False
 
@@ -57,6 +63,12 @@ config_custom = {
     # 动态修改方法：可以在factor_dict中重新赋值；也可以set_option_instrument(context, conditions, ref=None)修改；
     "func_name":"择时类-技术指标类",
     "data_dir":"data",
+    # 数据文件中日期的格式，读取时按该格式转换为时间索引；None 表示不转换（pickle 数据已是时间索引）
+    "date_format": '%Y/%m/%d',
+    # 是否使用面板模式；面板模式下数据文件为多标的行情（长表含标的代码列，或 字段 x 标的 两层列名的宽表），因子函数 因子名称_panel 输出 日期 x 标的 的信号矩阵，所有标的一起回测一次
+    "panel_mode": False,
+    # 长表中标的代码所在列名
+    "panel_asset_col": "code",
     # 结果输出路径
     "output_dir": "result/",
     "func_dir": "factors",
@@ -67,6 +79,7 @@ config_custom = {
     # #                  "param_dataSrc": {"func_name_dataSrc": "read_file",    # 必须有；通用配置和此处设置，两种可都有，或至少选其一；
     # #                                    "colName_dataSrc": ['trade_date', 'close', 'ret']},  # 必须有；通用配置和此处设置，两种可都有，或至少选其一；必须是单值或单值构成的list，不能有键值对！！！
     # #                  "param_factor": {"参数1": "参数值", "参数2": "参数值"},  # 非必须；根据因子需要可选；
+    # #                  "param_grid": {"参数1": [参数值列表], "参数2": [参数值列表]},  # 非必须；设置后调用 因子名称_grid 一次计算所有参数组合，每个组合单独回测，结果名为 因子名称_参数名参数值；面板模式下不使用；
     # #                  "file_name_model": ["factor_RSJ"],  # 必须有；通用配置和此处设置，两种可都有，或至少选其一；
     # #                  # 说明：在"param_dataSrc"外部的配置项，除规定的排除项外，也会默认添加到"param_dataSrc"的list中的每个集合内，并传入dataGet中供调用；
     # #                  # # 如果想让"param_dataSrc"的list中的每个字典有特有配置项，，则需要单独在该集合中单独添加或指定；
@@ -2,91 +2,217 @@ import pandas as pd
 from config import CONFIG,config_custom
 import multiprocessing
 import sys
-from concurrent.futures import ProcessPoolExecutor,as_completed
 import os
 import importlib
 import main
 import backtest_vector
 import cal_metric_api
-
-def factor_all_pipeline_time(config_custom, CONFIG):
-    # ------------定义因子回测函数-------------
-    def process_indicator(factor, price_tb_original, CONFIG):
-        import sys
-        sys.path.append(os.path.dirname(os.path.realpath(__file__)))
-        module_name = factor["file_name_model"]
-        function_name = factor["func_name_factor"]
-        module = importlib.import_module(module_name)
-        function = getattr(module, function_name)
-
-        # 计算因子
-        price_tb_original['flag'] = function(price_tb_original)
+import signal_engine
+import data_loader
+
+# 子进程共享的价格数据，由进程池初始化函数在每个子进程中写入一次，避免每个任务重复序列化
+shared_price_tb = None
+
+def init_worker(price_tb_original, model_dir):
+    """
+    进程池初始化函数：在子进程中保存价格数据，并加入因子模块所在路径
+
+    参数:
+    price_tb_original: DataFrame, 原始价格数据表
+    model_dir: str, 因子模块所在目录
+    """
+    global shared_price_tb
+    shared_price_tb = price_tb_original
+    if model_dir not in sys.path:
+        sys.path.append(model_dir)
+
+def get_function_name(factor):
+    # 统一命名
+    function_name = factor['func_name_factor']
+    return function_name if function_name.endswith('_signal') else function_name + '_signal'
+
+def process_indicator(factor, price_tb_original, CONFIG):
+    """
+    计算单个因子并完成回测和指标计算
+
+    参数:
+    factor: dict, 因子配置
+    price_tb_original: DataFrame, 原始价格数据表
+    CONFIG: dict, 全局配置
+
+    返回值:
+    cal_metric_result: dict, 指标计算结果
+    """
+    model_dir = os.path.dirname(os.path.realpath(__file__))
+    if model_dir not in sys.path:
+        sys.path.append(model_dir)
+    module_name = factor["file_name_model"]
+    function_name = factor["func_name_factor"]
+    module = importlib.import_module(module_name)
+    function = getattr(module, function_name)
+
+    # 计算因子，在副本上添加信号列，不修改共享的价格数据
+    price_tb_original = price_tb_original.copy()
+    price_tb_original['flag'] = function(price_tb_original)
+    price_tb = price_tb_original['close'].to_frame('stock')
+    factor_tb = price_tb_original['flag'].to_frame('stock')
+    return backtest_signal(price_tb, factor_tb, CONFIG)
+
+def process_indicator_grid(factor, price_tb_original, CONFIG):
+    """
+    按参数网格一次计算因子的所有参数组合，再逐个组合完成回测和指标计算
+
+    参数:
+    factor: dict, 因子配置，param_grid 为 {参数名: 参数值列表}
+    price_tb_original: DataFrame, 原始价格数据表
+    CONFIG: dict, 全局配置
+
+    返回值:
+    cal_metric_result: dict, {因子名_参数组合: 指标计算结果}
+    """
+    model_dir = os.path.dirname(os.path.realpath(__file__))
+    if model_dir not in sys.path:
+        sys.path.append(model_dir)
+    module = importlib.import_module(factor["file_name_model"])
+    # 网格版函数名为 因子名称_grid，返回 日期 x 参数组合 的信号表
+    function = getattr(module, factor["func_name_factor"] + '_grid')
+    price_tb_original = price_tb_original.copy()
+    signal_tb = function(price_tb_original, **factor["param_grid"])
+    cal_metric_result = {}
+    for variant, signal in signal_tb.items():
+        variant = variant if isinstance(variant, tuple) else (variant,)
+        variant_name = '_'.join(f'{name}{value}' for name, value in zip(signal_tb.columns.names, variant))
+        # backtest 会改写输入表的索引，每个组合使用新的表
         price_tb = price_tb_original['close'].to_frame('stock')
-        factor_tb = price_tb_original['flag'].to_frame('stock')
-
-        # 回测
-        FREQUENCY_INTERVAL = CONFIG["FREQUENCY_INTERVAL"]
-        freq_position = CONFIG["freq_position"]
-        benchmark = CONFIG["benchmark"]
-        subportfolio_num = CONFIG["subportfolio_num"]
-        IC_lag_n = CONFIG["IC_lag_n"]
-        period = CONFIG["period"]
-        winlen = CONFIG["winlen"]
-        start_date = CONFIG["start_date"]
-        end_date = CONFIG["end_date"]
-
-
-        # 调用 backtest
-        date_range_src = price_tb.index
-        ret_tb_original, factor_tb_original, price_tb, ret_tb, factor_tb, position_tb, date_range_src, period = backtest_vector.backtest(factor_tb, price_tb, date_range_src, start_date, end_date, FREQUENCY_INTERVAL, period, freq_position)
-
-        # 调用 cal_metric
-        cal_metric_result = cal_metric_api.cal_portfolio_metric(price_tb, ret_tb, factor_tb, position_tb, benchmark, subportfolio_num, IC_lag_n, period, winlen)
-
-        return cal_metric_result
+        factor_tb = signal.reindex(price_tb_original.index).to_frame('stock')
+        cal_metric_result[f'{get_function_name(factor)}_{variant_name}'] = backtest_signal(price_tb, factor_tb, CONFIG)
+    return cal_metric_result
+
+def process_indicator_panel(factor, price_panel, CONFIG):
+    """
+    面板模式：计算所有标的的信号矩阵，整体回测一次
+
+    参数:
+    factor: dict, 因子配置
+    price_panel: dict, {字段: 日期 x 标的 的 DataFrame}
+    CONFIG: dict, 全局配置
+
+    返回值:
+    cal_metric_result: dict, 指标计算结果
+    """
+    model_dir = os.path.dirname(os.path.realpath(__file__))
+    if model_dir not in sys.path:
+        sys.path.append(model_dir)
+    module = importlib.import_module(factor["file_name_model"])
+    # 面板版函数名为 因子名称_panel，返回 日期 x 标的 的信号矩阵
+    function = getattr(module, factor["func_name_factor"] + '_panel')
+    factor_tb = function(price_panel)
+    # backtest 会改写输入表的索引，传入浅拷贝，不影响共享的行情数据
+    price_tb = price_panel['close'].copy(deep=False)
+    return backtest_signal(price_tb, factor_tb, CONFIG)
+
+def backtest_signal(price_tb, factor_tb, CONFIG):
+    """
+    单个信号回测并计算绩效指标
+
+    参数:
+    price_tb: DataFrame, 价格表
+    factor_tb: DataFrame, 信号表
+    CONFIG: dict, 全局配置
+
+    返回值:
+    cal_metric_result: dict, 指标计算结果
+    """
+    # 回测
+    FREQUENCY_INTERVAL = CONFIG["FREQUENCY_INTERVAL"]
+    freq_position = CONFIG["freq_position"]
+    benchmark = CONFIG["benchmark"]
+    subportfolio_num = CONFIG["subportfolio_num"]
+    IC_lag_n = CONFIG["IC_lag_n"]
+    period = CONFIG["period"]
+    winlen = CONFIG["winlen"]
+    metric_mode = CONFIG["metric_mode"]
+    start_date = CONFIG["start_date"]
+    end_date = CONFIG["end_date"]
+
+
+    # 调用 backtest
+    date_range_src = price_tb.index
+    ret_tb_original, factor_tb_original, price_tb, ret_tb, factor_tb, position_tb, date_range_src, period = backtest_vector.backtest(factor_tb, price_tb, date_range_src, start_date, end_date, FREQUENCY_INTERVAL, period, freq_position)
+
+    # 调用 cal_metric
+    cal_metric_result = cal_metric_api.cal_portfolio_metric(price_tb, ret_tb, factor_tb, position_tb, benchmark, subportfolio_num, IC_lag_n, period, winlen, metric_mode=metric_mode)
+
+    return cal_metric_result
+
+def process_indicator_shared(factor, CONFIG):
+    # 子进程中使用初始化时保存的价格数据
+    return process_indicator(factor, shared_price_tb, CONFIG)
+
+def process_indicator_grid_shared(factor, CONFIG):
+    # 子进程中使用初始化时保存的价格数据
+    return process_indicator_grid(factor, shared_price_tb, CONFIG)
+
+def process_indicator_panel_shared(factor, CONFIG):
+    # 子进程中使用初始化时保存的面板行情
+    return process_indicator_panel(factor, shared_price_tb, CONFIG)
 
+def factor_all_pipeline_time(config_custom, CONFIG):
     # ------------回测-------------
     # --------导入数据---------
     # 计算数据目录的绝对路径
     data_dir = os.path.abspath(config_custom["data_dir"])
     # 计算文件的绝对路径
     file_path = os.path.join(data_dir, "price_tb.csv")
-    # 读取数据文件
-    price_tb_original = pd.read_csv(file_path)
-    price_tb_original.set_index('Date', inplace=True)
+    # 读取数据文件；面板模式读取多标的行情，所有因子共用
+    if config_custom["panel_mode"]:
+        price_tb_original = signal_engine.load_panel(file_path, asset_col=config_custom["panel_asset_col"], date_format=config_custom["date_format"])
+    else:
+        price_tb_original = data_loader.load_price_table(file_path, date_format=config_custom["date_format"])
 
     # ------循环调用回测函数-----
     cal_metric_results = {}
     # 从全局配置中获取因子列表
     factor_dicts = config_custom['factor_dict']
-    # 根据全局配置决定是否使用并行计算
-    if CONFIG["multiProcess_all_factor"] == "True":
-        # 使用并行计算
-        with ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-            futures = []
+    # 根据全局配置决定是否使用并行计算，兼容布尔值和字符串两种写法
+    if CONFIG["multiProcess_all_factor"] in (True, "True"):
+        # 进程数默认为 CPU 核数，且不超过因子数量
+        max_workers = CONFIG["max_workers"] or multiprocessing.cpu_count()
+        max_workers = max(1, min(max_workers, len(factor_dicts)))
+        model_dir = os.path.dirname(os.path.realpath(__file__))
+        # 价格数据通过初始化参数只向每个子进程传递一次
+        with multiprocessing.Pool(processes=max_workers, initializer=init_worker, initargs=(price_tb_original, model_dir)) as pool:
+            # 按因子名称记录每个任务，结果按配置顺序取回；参数网格的任务不记名称，返回每个组合的结果
+            async_results = []
             for factor_dict in factor_dicts:
-                future = executor.submit(process_indicator, factor_dict, price_tb_original, CONFIG)
-                futures.append(future)
-            for future in as_completed(futures):
-                function_name = factor_dict['func_name_factor']
-                # 统一命名
-                function_name = function_name if function_name.endswith('_signal') else function_name + '_signal'
-                cal_metric_results[function_name] = future.result()
+                if config_custom["panel_mode"]:
+                    async_results.append((get_function_name(factor_dict), pool.apply_async(process_indicator_panel_shared, (factor_dict, CONFIG))))
+                elif factor_dict.get("param_grid"):
+                    async_results.append((None, pool.apply_async(process_indicator_grid_shared, (factor_dict, CONFIG))))
+                else:
+                    async_results.append((get_function_name(factor_dict), pool.apply_async(process_indicator_shared, (factor_dict, CONFIG))))
+            for function_name, async_result in async_results:
+                if function_name is None:
+                    cal_metric_results.update(async_result.get())
+                else:
+                    cal_metric_results[function_name] = async_result.get()
 
     else:
         # 使用顺序计算
         for factor_dict in factor_dicts:
-            cal_metric_result = process_indicator(factor_dict, price_tb_original, CONFIG)
-            function_name = factor_dict['func_name_factor']
-            # 统一命名
-            function_name = function_name if function_name.endswith('_signal') else function_name + '_signal'
-            cal_metric_results[function_name] = cal_metric_result
+            # 面板模式下所有标的一起回测；设置参数网格时，所有参数组合一次计算，每个组合单独回测
+            if config_custom["panel_mode"]:
+                cal_metric_results[get_function_name(factor_dict)] = process_indicator_panel(factor_dict, price_tb_original, CONFIG)
+            elif factor_dict.get("param_grid"):
+                cal_metric_results.update(process_indicator_grid(factor_dict, price_tb_original, CONFIG))
+            else:
+                cal_metric_results[get_function_name(factor_dict)] = process_indicator(factor_dict, price_tb_original, CONFIG)
 
     # ------------输出-------------
     sys.path.append(CONFIG["output_model_dir"])
     import output_file
     output_file_path = os.path.join(CONFIG['output_dir'], "cal_metric_indicator.pkl")
-    cal_metric_results = output_file.output_func(cal_metric_results, output_file_path)
+    cal_metric_results = output_file.output_func(cal_metric_results, output_file_path, CONFIG["output_format"])
 
     # web分析
     return cal_metric_results
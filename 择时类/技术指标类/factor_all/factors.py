@@ -1,5 +1,77 @@
 import pandas as pd
 import numpy as np
+from collections import deque
+import signal_engine
+from scipy.special import ndtr
+
+def rolling_sum(x, window):
+    """
+    滑动窗口求和，对应 x.rolling(window).sum()：逐行送入 RollingSumState，日期 x 标的 时所有列一次更新；
+    与逐根K线更新的结果逐位一致，Kahan 补偿使舍入误差不随序列长度累积。
+    :param x, Series or DataFrame: 输入序列；
+    :param window, int: 窗长；
+    :return: result, Series or DataFrame: 与输入同形的窗口和，窗口未满或窗口内有缺失值时为空值；
+    """
+    values = np.asarray(x, dtype='float64')
+    state = RollingSumState(window, values.shape[1:])
+    result = np.empty(values.shape)
+    for i in range(len(values)):
+        result[i] = state.update(values[i])
+    if isinstance(x, pd.DataFrame):
+        return pd.DataFrame(result, index=x.index, columns=x.columns)
+    return pd.Series(result, index=x.index, name=x.name)
+
+
+def rolling_mean(x, window):
+    """
+    滑动窗口均值，对应 x.rolling(window).mean()，即 rolling_sum 除以窗长。
+    :param x, Series or DataFrame: 输入序列；
+    :param window, int: 窗长；
+    :return: result, Series or DataFrame: 与输入同形的窗口均值；
+    """
+    return rolling_sum(x, window) / window
+
+
+def accumulation_distribution(high, low, close, volume):
+    """
+    计算累积/派发线（AD 线）：资金流量乘数整列计算，最高价等于最低价的日期记为 0，再累加；
+    传入 日期 x 标的 的 DataFrame 时，所有标的一次计算完成。
+    :param high, Series or DataFrame: 最高价；
+    :param low, Series or DataFrame: 最低价；
+    :param close, Series or DataFrame: 收盘价；
+    :param volume, Series or DataFrame: 成交量；
+    :return: ad, Series or DataFrame: AD 线，索引与 close 相同；
+    """
+    high, low, close_values, volume = (np.asarray(x, dtype='float64') for x in (high, low, close, volume))
+    price_range = high - low
+    # 资金流量 = 资金流量乘数 * 成交量
+    with np.errstate(divide='ignore', invalid='ignore'):
+        money_flow = ((close_values - low) - (high - close_values)) / price_range * volume
+    # 最高价等于最低价时当日不计入，AD 线保持上一个值
+    money_flow[price_range == 0] = 0
+    # 按日期累加，缺失值与逐行计算一样向后传递
+    ad = np.cumsum(money_flow, axis=0)
+    if isinstance(close, pd.DataFrame):
+        return pd.DataFrame(ad, index=close.index, columns=close.columns)
+    return pd.Series(ad, index=close.index)
+
+
+def chaikin_oscillator_panel(high, low, close, volume, periods_short=3, periods_long=10):
+    """
+    面板版佳庆指标：输入为 日期 x 标的 的 DataFrame，所有标的一次计算。
+    :param high, DataFrame: 最高价；
+    :param low, DataFrame: 最低价；
+    :param close, DataFrame: 收盘价；
+    :param volume, DataFrame: 成交量；
+    :param periods_short, int: 计算指数加权时短窗长；
+    :param periods_long, int: 计算指数加权时长窗长；
+    :return: ch_osc, DataFrame: 佳庆指标；
+    """
+    ac = accumulation_distribution(high, low, close, volume)
+    ema_long = ac.ewm(ignore_na=False, min_periods=0, com=periods_long, adjust=True).mean()
+    ema_short = ac.ewm(ignore_na=False, min_periods=0, com=periods_short, adjust=True).mean()
+    return ema_short - ema_long
+
 
 def chaikin_oscillator(data, periods_short=3, periods_long=10, high_col='high',
                        low_col='low', close_col='close', vol_col='volume'):
@@ -19,23 +91,8 @@ def chaikin_oscillator(data, periods_short=3, periods_long=10, high_col='high',
     :param vol_col, str: 指定列名；
     :return: data: 返回指标计算结果；
     """
-    # 初始化存储空间
-    ac = pd.Series([],dtype='float64')
-    # 先设置上一个val为0
-    val_last = 0
-    # 对每一行，日期index
-    for index, row in data.iterrows():
-        # 若最高价不等于最低价，计算val值
-        if row[high_col] != row[low_col]:
-            val = val_last + ((row[close_col] - row[low_col]) - (row[high_col] - row[close_col])) / (
-                        row[high_col] - row[low_col]) * row[vol_col]
-        # 否则指定val为上一个val值
-        else:
-            val = val_last
-        # 将当前日期的val值赋给ac对应日期
-        ac[index]=val
-        # 更新上一个val值
-        val_last = val
+    # 计算累积/派发线
+    ac = accumulation_distribution(data[high_col], data[low_col], data[close_col], data[vol_col])
     # 计算长窗长指数平均
     ema_long = ac.ewm(ignore_na=False, min_periods=0, com=periods_long, adjust=True).mean()
     # 计算短窗长指数平均
@@ -43,7 +100,7 @@ def chaikin_oscillator(data, periods_short=3, periods_long=10, high_col='high',
     # 计算佳庆指标
     data['ch_osc'] = ema_short - ema_long
     # 计算90日均线
-    data['SMA_90'] = data.close.rolling(90).mean().shift(1)
+    data['SMA_90'] = rolling_mean(data.close, 90).shift(1)
     return data
 
 
@@ -54,64 +111,154 @@ def chaikin_oscillator_signal(df, indicator_name='ch_osc',close_name='close',los
     :param df, Series: 计算的原始数据；
     :param indicator_name, str: 指定指标列名；
     :param close_name, str: 指定标的价格基准列名；
-    :return: lossratio, float: 最大损失率，超过平仓则止损；
+    :param lossratio, float: 最大损失率，收盘价相对开仓价格的跌幅超过该值时平仓止损；
+    :return: signal, Series: 基于Chaikin Oscillator计算得到的交易信号；
     """
     # 获取日期
     dfdate = df.index
-    # 增加一列日期
-    df['date'] = df.index
     # 调用因子计算指标值
     pdatas=chaikin_oscillator(df)
     # 重新设定日期索引
     pdatas.index = dfdate
-    # 记录持仓
-    pdatas['position'] = 0
+    indicator = pdatas[indicator_name]
+    # Chaikin Oscillator上穿0，且股价高于90天移动平均，做多
+    entry = (indicator.shift() < 0) & (indicator > 0) & (pdatas[close_name] > pdatas.SMA_90)
+    # Chaikin Oscillator下穿0，且股价低于90天移动平均，平仓
+    exit = (indicator.shift() > 0) & (pdatas[close_name] < pdatas.SMA_90) & (indicator < 0)
+    # 从产生90日均线后的日期开始，当天的条件决定下一天的持仓；下跌超出止损率时止损
+    pdatas['position'] = signal_engine.resolve_position(entry, exit, pdatas[close_name], lossratio, start=90)
     # 记录买卖
-    pdatas['flag'] = 0
-    # 设置索引为日期
-    dfdate = pdatas.index
-    # 记录买入价位
-    pricein = []
-    # 记录卖出价位
-    priceout = []
-    # 设置初始买入价格，足够低即可
-    price_in = 1
-    # 对产生90日均线后的每个日期
-    for i in range(90, pdatas.shape[0] - 1):
-        # 当前无仓位，Chaikin Oscillator上穿0，且股价高于90天移动平均，做多
-        if (pdatas[indicator_name][dfdate[i-1]] < 0) & (pdatas[indicator_name][dfdate[i]] > 0) & (
-                pdatas[close_name][dfdate[i]] > pdatas.SMA_90[dfdate[i]]) & (pdatas.position[dfdate[i]] == 0):
-            # 更新买卖
-            pdatas.loc[dfdate[i], 'flag'] = 1
-            # 更新持仓
-            pdatas.loc[dfdate[i+1], 'position'] = 1
-            # 存储买入日期和价格
-            pricein.append([pdatas.date[dfdate[i]], pdatas.loc[dfdate[i], close_name]])
-        # 当前持仓，下跌超出止损率，止损
-        elif (pdatas.position[dfdate[i]] == 1) & (pdatas[close_name][dfdate[i]] / price_in - 1 < -lossratio):
-            # 更新买卖
-            pdatas.loc[dfdate[i], 'flag'] = -1
-            # 更新持仓
-            pdatas.loc[dfdate[i+1], 'position'] = 0
-            # 更新卖出价位和日期
-            priceout.append([pdatas.date[dfdate[i]], pdatas.loc[dfdate[i], close_name]])
-        # 当前持仓，Chaikin Oscillator下穿0，且股价低于90天移动平均，平仓
-        elif (pdatas[indicator_name][dfdate[i-1]] > 0) & (pdatas[close_name][dfdate[i]] < pdatas.SMA_90[dfdate[i]]) & (
-                pdatas[indicator_name][dfdate[i]] < 0) & (pdatas.position[dfdate[i]] == 1):
-            # 更新买卖
-            pdatas.loc[dfdate[i], 'flag'] = -1
-            # 更新持仓
-            pdatas.loc[dfdate[i+1], 'position'] = 0
-            # 更新买卖价位和日期
-            priceout.append([pdatas.date[dfdate[i]], pdatas.loc[dfdate[i], close_name]])
-        # 其他情况，保持之前仓位不变
-        else:
-            pdatas.loc[dfdate[i+1], 'position'] = pdatas.loc[dfdate[i], 'position']
-        # 获得交易信号，统一格式为±1
-        signal = pdatas['position'].replace(0,-1)
+    pdatas['flag'] = pdatas['position'].diff().shift(-1).fillna(0).astype(int)
+    # 获得交易信号，统一格式为±1
+    signal = pdatas['position'].replace(0,-1)
     # 返回交易信号
     return signal
 
+def chaikin_oscillator_grid(data, periods_short=(3,), periods_long=(10,), high_col='high',
+                            low_col='low', close_col='close', vol_col='volume'):
+    """
+    参数网格版佳庆指标：AD线只计算一次，每个窗长的指数平均只计算一次，再组合出所有参数的指标值。
+    :param data, DataFrame: 计算的原始数据；
+    :param periods_short, list: 短窗长列表；
+    :param periods_long, list: 长窗长列表；
+    :param high_col, str: 指定列名;
+    :param low_col, str: 指定列名;
+    :param close_col, str: 指定列名;
+    :param vol_col, str: 指定列名；
+    :return: ch_osc, DataFrame: 日期 x 参数组合 的指标值，列为 (periods_short, periods_long)；
+    """
+    # 计算累积/派发线，各组参数共用
+    ac = accumulation_distribution(data[high_col], data[low_col], data[close_col], data[vol_col])
+    # 每个不同的窗长计算一次指数平均
+    ema = {com: ac.ewm(ignore_na=False, min_periods=0, com=com, adjust=True).mean() for com in set(periods_short) | set(periods_long)}
+    columns = pd.MultiIndex.from_product([periods_short, periods_long], names=['periods_short', 'periods_long'])
+    values = np.column_stack([ema[short] - ema[long] for short, long in columns])
+    return pd.DataFrame(values, index=data.index, columns=columns)
+
+
+def chaikin_oscillator_signal_grid(df, periods_short=(3,), periods_long=(10,), close_name='close', lossratio=999):
+    """
+    出处：《股票-技术指标类-Chaikin Oscillato》
+        参数网格版交易信号，规则与 chaikin_oscillator_signal 相同，所有参数组合一次计算。
+    :param df, DataFrame: 计算的原始数据；
+    :param periods_short, list: 短窗长列表；
+    :param periods_long, list: 长窗长列表；
+    :param close_name, str: 指定标的价格基准列名；
+    :param lossratio, float: 最大损失率，收盘价相对开仓价格的跌幅超过该值时平仓止损；
+    :return: signal, DataFrame: 日期 x 参数组合 的交易信号；
+    """
+    indicator = chaikin_oscillator_grid(df, periods_short, periods_long, close_col=close_name)
+    close = df[close_name]
+    # 90日均线与参数无关，按列广播
+    sma_90 = rolling_mean(close, 90).shift(1)
+    above = (close > sma_90).values[:, None]
+    below = (close < sma_90).values[:, None]
+    entry = (indicator.shift() < 0) & (indicator > 0) & above
+    exit = (indicator.shift() > 0) & below & (indicator < 0)
+    position = signal_engine.resolve_position(entry, exit, close, lossratio, start=90)
+    return position.replace(0, -1)
+
+def chaikin_oscillator_signal_panel(panel, periods_short=3, periods_long=10, close_name='close', lossratio=999):
+    """
+    出处：《股票-技术指标类-Chaikin Oscillato》
+        面板版交易信号，规则与 chaikin_oscillator_signal 相同，所有标的一次计算。
+    :param panel, dict: {字段: 日期 x 标的 的 DataFrame}，需要 high、low、close、volume；
+    :param periods_short, int: 计算指数加权时短窗长；
+    :param periods_long, int: 计算指数加权时长窗长；
+    :param close_name, str: 指定标的价格基准字段名；
+    :param lossratio, float: 最大损失率，收盘价相对开仓价格的跌幅超过该值时平仓止损；
+    :return: signal, DataFrame: 日期 x 标的 的交易信号；
+    """
+    indicator = chaikin_oscillator_panel(panel['high'], panel['low'], panel[close_name], panel['volume'], periods_short, periods_long)
+    close = panel[close_name]
+    # 计算90日均线
+    sma_90 = rolling_mean(close, 90).shift(1)
+    entry = (indicator.shift() < 0) & (indicator > 0) & (close > sma_90)
+    exit = (indicator.shift() > 0) & (close < sma_90) & (indicator < 0)
+    position = signal_engine.resolve_position(entry, exit, close, lossratio, start=90)
+    return position.replace(0, -1)
+
+def directional_movement(high, low, close):
+    """
+    计算真实波幅tr和方向变动+DM/-DM，与窗长无关，各组参数共用。
+    :param high, Series or DataFrame: 最高价；
+    :param low, Series or DataFrame: 最低价；
+    :param close, Series or DataFrame: 收盘价；
+    :return: tr, mp, mm: 真实波幅、+DM、-DM，与输入同形；
+    """
+    # 计算真实波幅tr指标，取三者最大值，缺失值向后传递
+    tr = np.maximum(np.maximum(high - low, (high - close.shift()).abs()), (low - close.shift()).abs())
+    # 计算最高价差价hd
+    hd = high - high.shift()
+    # 计算最低价差价ld
+    ld = low.shift() - low
+    # 若hd正且大于ld则取hd，否则取0
+    mp = hd.where((hd > 0) & (hd > ld), 0)
+    # 若ld正且大于hd则取ld，否则取0
+    mm = ld.where((ld > 0) & (hd < ld), 0)
+    return tr, mp, mm
+
+def DMI_panel(high, low, close, n=14, m=6):
+    """
+    整体计算DMI指标：+DM/-DM、真实波幅、ADX、ADXR均为整列运算；传入 日期 x 标的 的 DataFrame 时所有标的一次计算完成。
+    :param high, Series or DataFrame: 最高价；
+    :param low, Series or DataFrame: 最低价；
+    :param close, Series or DataFrame: 收盘价；
+    :param n, int: 计算trz指标时滑动窗口长度；
+    :param m, int: 计算adx指标时滑动窗口长度；
+    :return: result, dict: {'pdi', 'mdi', 'adx', 'adxr', 'dmi'} 对应的计算结果，与输入同形；dmi 在 adxr 缺失的日期为空值；
+    """
+    # 计算真实波幅和方向变动
+    tr, mp, mm = directional_movement(high, low, close)
+    # tr指标滑动窗口求和
+    trz = rolling_sum(tr, n)
+    # 计算pdi指标
+    pdi = 100 * rolling_sum(mp, n).div(trz)
+    # 计算mdi指标
+    mdi = 100 * rolling_sum(mm, n).div(trz)
+    # 计算adx指标
+    adx = rolling_mean((mdi - pdi).abs() / (mdi + pdi) * 100, m)
+    # 计算adxr指标
+    adxr = (adx + adx.shift(m)) / 2
+    # 计算dmi指标，只保留各项指标都有值的日期
+    dmi = (pdi - mdi).where(pdi.notna() & mdi.notna() & adxr.notna())
+    return {'pdi': pdi, 'mdi': mdi, 'adx': adx, 'adxr': adxr, 'dmi': dmi}
+
+def DMI_side(dmi):
+    """
+    根据dmi整体计算策略side：dmi正且比上一个有效日期增加时为1，其余为-1；每个标的的前两个和最后一个有效日期保持-1。
+    :param dmi, Series or DataFrame: dmi指标，缺失值所在日期不参与计算；
+    :return: side, Series or DataFrame: 策略side，dmi缺失的日期为空值；
+    """
+    valid = dmi.notna()
+    # 每个日期在各自标的有效日期中的序号，从1开始
+    order = valid.cumsum()
+    # 上一个有效日期的dmi
+    dmi_last = dmi.shift().ffill()
+    # 若dmi正且增加，购入；若dmi负且减小，卖出（与初始值-1相同）
+    buy = (dmi > 0) & (dmi > dmi_last) & (order > 2) & (order < valid.sum())
+    return buy.astype(int).where(buy, -1).where(valid)
+
 def DMI(df, n=14, m=6):
     """
     出处：《股票-技术指标类-DMI策略》
@@ -125,25 +272,8 @@ def DMI(df, n=14, m=6):
     :param n, int: 计算trz指标时滑动窗口长度；
     :return: _dmi, Series: dmi计算结果；
     """
-    # 计算真实波幅tr指标
-    tr = pd.Series(np.vstack([df['high'] - df['low'], (df['high'] - df['close'].shift()).abs(),
-                              (df['low'] - df['close'].shift()).abs()]).max(axis=0), index=df.index)
-    # tr指标滑动窗口求和
-    trz = tr.rolling(n).sum()
-    # 数据存储数据框
-    _m = pd.DataFrame()
-    # 计算最高价差价hd
-    _m['hd'] = df['high'] - df['high'].shift()
-    # 计算最低价差价ld
-    _m['ld'] = df['low'].shift() - df['low']
-    # 若hd正且大于ld则取hd，否则取0
-    _m['mp'] = _m.apply(lambda x: x.hd if x.hd > 0 and x.hd > x.ld else 0, axis=1)
-    # 若ld正且大于hd则取ld，否则取0
-    _m['mm'] = _m.apply(lambda x: x.ld if x.ld > 0 and x.hd < x.ld else 0, axis=1)
-    # 计算mp滑动窗口求和
-    _m['dmp'] = _m.mp.rolling(n).sum()
-    # 计算mm滑动窗口求和
-    _m['dmm'] = _m.mm.rolling(n).sum()
+    # 整体计算各项指标
+    result = DMI_panel(df['high'], df['low'], df['close'], n, m)
     # 结果数据框
     _dmi = pd.DataFrame()
     # 开盘价
@@ -151,13 +281,13 @@ def DMI(df, n=14, m=6):
     #收盘价
     _dmi['close'] = df['close']
     # 计算pdi指标
-    _dmi['pdi'] = 100 * _m.dmp.div(trz)
+    _dmi['pdi'] = result['pdi']
     # 计算mdi指标
-    _dmi['mdi'] = 100 * _m.dmm.div(trz)
+    _dmi['mdi'] = result['mdi']
     # 计算adx指标
-    _dmi['adx'] = ((_dmi.mdi - _dmi.pdi).abs() / (_dmi.mdi + _dmi.pdi) * 100).rolling(m).mean()
+    _dmi['adx'] = result['adx']
     # 计算adxr指标
-    _dmi['adxr'] = (_dmi.adx + _dmi.adx.shift(m)) / 2
+    _dmi['adxr'] = result['adxr']
     # 设置索引
     _dmi.index = df.index
     # 去掉nan值所在行
@@ -179,25 +309,58 @@ def DMI_signal(df):
     """
     # 调用DMI因子，计算DMI
     dmi = DMI(df)
-    # 获取dmi长度c
-    c = len(dmi)
-    # 根据dmi索引获得日期
-    dmidate = dmi.index
-    # 对每一个日期
-    for i in range(len(dmidate)):
-        # 第1天后，倒数第二天前
-        if i > 1 and i + 1 < len(dmidate):
-            # 若dmi正且增加，购入
-            if dmi.loc[dmidate[i],'dmi'] > 0 and dmi.loc[dmidate[i],'dmi'] > dmi.loc[dmidate[i-1],'dmi']:
-                dmi['side'].values[i] = 1
-            # 若dmi负且减小，卖出
-            if dmi.loc[dmidate[i],'dmi'] < 0 and dmi.loc[dmidate[i],'dmi'] < dmi.loc[dmidate[i-1],'dmi']:
-                dmi['side'].values[i] = -1
+    # 若dmi正且增加，购入；若dmi负且减小，卖出
+    dmi['side'] = DMI_side(dmi['dmi']).astype(int)
     # 获得交易信号
     signal = dmi['side']
     # 返回交易信号
     return signal
 
+def DMI_grid(df, period=(14,), smooth_period=(6,)):
+    """
+    参数网格版DMI：真实波幅和+DM/-DM只计算一次，每个period的滑动求和只计算一次，再对每个smooth_period计算adx。
+    :param df, DataFrame: 计算的原始数据,索引需要是日期；
+    :param period, list: 计算trz指标时滑动窗口长度列表；
+    :param smooth_period, list: 计算adx指标时滑动窗口长度列表；
+    :return: dmi, DataFrame: 日期 x 参数组合 的dmi，列为 (period, smooth_period)，adxr 缺失的日期为空值；
+    """
+    tr, mp, mm = directional_movement(df['high'], df['low'], df['close'])
+    # 每个period的滑动求和只计算一次，结果按 日期 x period 排列
+    trz = {n: rolling_sum(tr, n) for n in period}
+    pdi = pd.DataFrame({n: 100 * rolling_sum(mp, n).div(trz[n]) for n in period})
+    mdi = pd.DataFrame({n: 100 * rolling_sum(mm, n).div(trz[n]) for n in period})
+    dx = (mdi - pdi).abs() / (mdi + pdi) * 100
+    # 每个smooth_period对所有period一次计算adx
+    dmi = {}
+    for m in smooth_period:
+        adx = rolling_mean(dx, m)
+        adxr = (adx + adx.shift(m)) / 2
+        dmi[m] = (pdi - mdi).where(pdi.notna() & mdi.notna() & adxr.notna())
+    dmi = pd.concat(dmi, axis=1, names=['smooth_period', 'period']).swaplevel(axis=1)
+    return dmi[pd.MultiIndex.from_product([period, smooth_period], names=['period', 'smooth_period'])]
+
+def DMI_signal_grid(df, period=(14,), smooth_period=(6,)):
+    """
+    出处：《股票-技术指标类-DMI策略》
+        参数网格版交易信号，规则与 DMI_signal 相同，所有参数组合一次计算。
+    :param df, DataFrame: 计算的原始数据,索引需要是日期；
+    :param period, list: 计算trz指标时滑动窗口长度列表；
+    :param smooth_period, list: 计算adx指标时滑动窗口长度列表；
+    :return: signal, DataFrame: 日期 x 参数组合 的交易信号，dmi缺失的日期为空值；
+    """
+    return DMI_side(DMI_grid(df, period, smooth_period))
+
+def DMI_signal_panel(panel, n=14, m=6):
+    """
+    出处：《股票-技术指标类-DMI策略》
+        面板版交易信号，规则与 DMI_signal 相同，所有标的一次计算。
+    :param panel, dict: {字段: 日期 x 标的 的 DataFrame}，需要 high、low、close；
+    :param n, int: 计算trz指标时滑动窗口长度；
+    :param m, int: 计算adx指标时滑动窗口长度；
+    :return: signal, DataFrame: 日期 x 标的 的交易信号，dmi缺失的日期为空值；
+    """
+    return DMI_side(DMI_panel(panel['high'], panel['low'], panel['close'], n, m)['dmi'])
+
 def OBV(df):
     """
     出处：《股票-技术指标类-OBV策略》
@@ -239,6 +402,58 @@ def OBV_signal(df):
     signal[0] = 0
     return signal
 
+def OBV_signal_panel(panel):
+    """
+    出处：《股票-技术指标类-OBV策略》
+        面板版OBV交易信号，规则与 OBV_signal 相同，所有标的一次计算。
+    :param panel, dict: {字段: 日期 x 标的 的 DataFrame}，需要 close、volume；
+    :return: signal, DataFrame: 日期 x 标的 的交易信号，第一个日期为空值；
+    """
+    # 计算OBV
+    OBV_val = on_balance_volume(panel['close'], panel['volume'])
+    # 生成交易信号
+    signal = (2 * (OBV_val.diff() > 0) - 1).astype('float64')
+    # 差分会导致第一个日期没有信号，第二个日期设置为0
+    signal.iloc[0] = np.nan
+    signal.iloc[1] = 0
+    return signal
+
+def on_balance_volume(close, volume):
+    """
+    计算OBV，与 OBV 相同但保留原索引；传入 日期 x 标的 的 DataFrame 时所有标的一次计算。
+    :param close, Series or DataFrame: 收盘价；
+    :param volume, Series or DataFrame: 成交量；
+    :return: OBV, Series or DataFrame: OBV计算结果；
+    """
+    # 计算差分，第一个元素设置为0
+    difClose = close.diff()
+    difClose.iloc[0] = 0
+    return (((difClose >= 0) * 2 - 1) * volume).cumsum()
+
+def SMOBV_signal_grid(df, window=(9,)):
+    """
+    出处：《股票-技术指标类-OBV策略》
+        参数网格版SMOBV交易信号：OBV只计算一次，OBV高于其window日均线时为1，否则为-1。
+    :param df, DataFrame: 计算的原始数据,索引需要是日期；
+    :param window, list: OBV均线窗长列表；
+    :return: signal, DataFrame: 日期 x 窗长 的交易信号；
+    """
+    # 计算OBV，各窗长共用
+    OBV_val = on_balance_volume(df['close'], df['volume'])
+    columns = pd.Index(window, name='window')
+    values = np.column_stack([np.where(OBV_val > OBV_val.rolling(w).mean(), 1, -1) for w in window])
+    return pd.DataFrame(values, index=df.index, columns=columns)
+
+def SMOBV_signal(df, window=9):
+    """
+    出处：《股票-技术指标类-OBV策略》
+        生成SMOBV交易信号：OBV高于其均线时为1，否则为-1。
+    :param df, DataFrame: 计算的原始数据,索引需要是日期；
+    :param window, int: OBV均线窗长；
+    :return: signal, Series: 交易信号；
+    """
+    return SMOBV_signal_grid(df, [window])[window]
+
 def BSM(s, k=10, t=1, r=0.05, v=0.2):
     """
         出处：《股票-技术指标类-BSM》
@@ -258,29 +473,339 @@ def BSM(s, k=10, t=1, r=0.05, v=0.2):
     bsm_value = s * np.exp(-r * t) * np.exp(-v * np.sqrt(t) * np.random.normal())
     return bsm_value
 
-def BSM_signal(data, t=1, r=0.05, v=0.2):
+def BSM_closed_form(s, k=10, t=1, r=0.05, v=0.2, option='call'):
+    """
+        出处：《股票-技术指标类-BSM》
+        整列计算 BSM 欧式期权的解析定价，d1、d2 对所有日期一次算完；
+    :param s, float or ndarray or Series: 股票的当前价格
+    :param k, float or ndarray or Series: 行权价格
+    :param t, float: 到期时间，默认一年
+    :param r, float: 无风险利率，默认0.05
+    :param v, float: 波动率 默认0.2
+    :param option, str: 'call' 看涨期权，'put' 看跌期权
+    :return bsm_value, ndarray or Series: 与 s 同形的 BSM 定价
+    """
+    # 计算d1
+    d1 = (np.log(s / k) + (r + v**2 / 2) * t) / (v * np.sqrt(t))
+    # 计算d2
+    d2 = d1 - v * np.sqrt(t)
+    # 计算bsm价格
+    if option == 'call':
+        return s * ndtr(d1) - k * np.exp(-r * t) * ndtr(d2)
+    if option == 'put':
+        return k * np.exp(-r * t) * ndtr(-d2) - s * ndtr(-d1)
+    raise ValueError(f"option 只能为 'call' 或 'put'，实际为 {option!r}")
+
+def BSM_monte_carlo(s, t=1, r=0.05, v=0.2, n_paths=1000, seed=None, quantiles=(0.05, 0.5, 0.95), chunk_size=1000000):
+    """
+        出处：《股票-技术指标类-BSM》
+        对每个日期模拟 n_paths 条路径，用与 BSM 相同的估价公式得到 日期 x 路径 的估价矩阵，再汇总为均值和分位数；
+        随机数来自带种子的 Generator，结果可复现；
+    :param s, ndarray or Series: 每个日期的股票价格
+    :param t, float: 到期时间，默认一年
+    :param r, float: 无风险利率，默认0.05
+    :param v, float: 波动率 默认0.2
+    :param n_paths, int: 每个日期的模拟路径数
+    :param seed, int: 随机数种子，None 表示不固定
+    :param quantiles, tuple: 需要输出的分位数
+    :param chunk_size, int: 每次生成的随机数个数上限，按日期分块控制内存
+    :return estimate, DataFrame: 每个日期一行，列为 mean 和各分位数
+    """
+    rng = np.random.default_rng(seed)
+    prices = np.asarray(s, dtype=float)
+    # 按日期分块，每块生成一个 日期 x 路径 的随机数矩阵
+    rows = max(1, chunk_size // n_paths)
+    estimate = np.empty((len(prices), 1 + len(quantiles)))
+    for start in range(0, len(prices), rows):
+        block = prices[start:start + rows, None]
+        values = block * np.exp(-r * t) * np.exp(-v * np.sqrt(t) * rng.standard_normal((len(block), n_paths)))
+        estimate[start:start + rows, 0] = values.mean(axis=1)
+        if quantiles:
+            estimate[start:start + rows, 1:] = np.quantile(values, quantiles, axis=1).T
+    index = s.index if isinstance(s, pd.Series) else None
+    return pd.DataFrame(estimate, index=index, columns=['mean'] + list(quantiles))
+
+def BSM_value(close, t=1, r=0.05, v=0.2, n_paths=1, seed=0, mode='monte_carlo', k=None):
+    """
+        出处：《股票-技术指标类-BSM》
+        整列计算每个日期的 BSM 估价和与之比较的基准价，BSM_signal 和 BSM_signal_panel 共用；
+        'monte_carlo' 的估价为 BSM_monte_carlo 的模拟均值，基准价为收盘价（与原 BSM_signal 一致）；
+        'closed_form' 的估价为行权价 k 的看涨期权解析价，基准价为同一行权价的看跌期权解析价，
+        由平价关系，看涨价高于看跌价当且仅当收盘价高于贴现后的行权价；
+        看涨期权价值恒小于标的价格，若直接与收盘价比较信号恒为卖出，因此不与收盘价比较；
+    :param close, ndarray or Series: 每个日期的收盘价
+    :param mode, str: 估价方式，'monte_carlo' 或 'closed_form'
+    :param k, float or ndarray or Series: 解析定价的行权价格，'closed_form' 时必须给出，例如收盘价的滚动均值；
+        以当日收盘价为行权价时信号与价格无关，因此不提供默认值
+    :return bsm, ndarray: 与 close 同形的估价
+    :return benchmark, ndarray: 与 close 同形的基准价
+    """
+    if mode == 'closed_form':
+        if k is None:
+            raise ValueError("mode='closed_form' 需要给出行权价格 k")
+        bsm = np.asarray(BSM_closed_form(close, k, t, r, v, 'call'), dtype=float)
+        benchmark = np.asarray(BSM_closed_form(close, k, t, r, v, 'put'), dtype=float)
+        return bsm, benchmark
+    if mode == 'monte_carlo':
+        bsm = BSM_monte_carlo(close, t, r, v, n_paths, seed, quantiles=())['mean'].values
+        return bsm, np.asarray(close, dtype=float)
+    raise ValueError(f"mode 只能为 'monte_carlo' 或 'closed_form'，实际为 {mode!r}")
+
+def BSM_signal(data, t=1, r=0.05, v=0.2, n_paths=1, seed=0, mode='monte_carlo', k=None):
     """
         出处：《股票-技术指标类-BSM》
         使用收盘价数据期权价格；
         如果定价高于现在价格，认为实际价格偏高，会上涨，买入信号；
         反之发出卖出信号。
     :param data, DataFrame: 股票数据
+    :param n_paths, int: 每个日期的模拟路径数，默认与原逐日计算一样每天一条，大于 1 时使用模拟均值
+    :param seed, int: 随机数种子，None 表示不固定
+    :param mode, str: 估价方式，'monte_carlo'（默认）或 'closed_form'，见 BSM_value
+    :param k, float or Series: 解析定价的行权价格，'closed_form' 时必须给出，Series 按日期对齐
     :return signal, Series: 交易信号
     """
-    # 存储空间交易信号
-    data['signal'] = 0
-    # 存储空间bsm价格
-    data['bsm'] = 0
-    # 对每一天
-    for i in range(len(data)):
-        # 获得当日价格
-        price = data['close'][data.index[i]]
-        # 计算当日bsm
-        bsm_estimate = BSM(price, price,t,r,v)
-        # 记录bsm
-        data.loc[data.index[i], 'bsm'] = bsm_estimate
-    # 如果当日bsm估价大于实际价格，卖出，反之买入
-    data['signal'] = (data['bsm'] > data['close']) * 2 - 1
+    if isinstance(k, pd.Series):
+        k = k.reindex(data.index).values
+    # 所有日期一次估价，记录bsm
+    data['bsm'], benchmark = BSM_value(data['close'], t, r, v, n_paths, seed, mode, k)
+    # 如果当日bsm估价大于基准价，卖出，反之买入
+    data['signal'] = (data['bsm'] > benchmark) * 2 - 1
     # 存储交易信号
     signal = data['signal']
-    return signal
\ No newline at end of file
+    return signal
+def BSM_signal_panel(panel, t=1, r=0.05, v=0.2, n_paths=1, seed=0, mode='monte_carlo', k=None):
+    """
+        出处：《股票-技术指标类-BSM》
+        面板版交易信号，规则与 BSM_signal 相同，所有标的、所有日期一次估价。
+    :param panel, dict: {字段: 日期 x 标的 的 DataFrame}，需要 close
+    :param n_paths, int: 每个日期的模拟路径数
+    :param seed, int: 随机数种子，None 表示不固定
+    :param mode, str: 估价方式，'monte_carlo'（默认）或 'closed_form'，见 BSM_value
+    :param k, float or DataFrame: 解析定价的行权价格，'closed_form' 时必须给出，DataFrame 按 日期 x 标的 对齐
+    :return signal, DataFrame: 日期 x 标的 的交易信号，收盘价缺失的位置为空值
+    """
+    close = panel['close']
+    if isinstance(k, pd.DataFrame):
+        k = k.reindex(index=close.index, columns=close.columns).values.ravel()
+    bsm, benchmark = BSM_value(close.values.ravel(), t, r, v, n_paths, seed, mode, k)
+    # 如果当日bsm估价大于基准价，卖出，反之买入
+    signal = pd.DataFrame(np.where(bsm > benchmark, 1, -1).reshape(close.shape), index=close.index, columns=close.columns)
+    return signal.where(close.notna())
+
+# ------------逐根K线更新的指标状态-------------
+# 只保存计算所需的运行状态，每来一根K线 O(1) 更新；滑动窗口和与批量函数共用 RollingSumState，
+# 在同一段历史上与 chaikin_oscillator、DMI_panel、OBV 等批量函数的结果逐位一致
+
+class EWMState:
+    """
+    指数加权均值的运行状态，与 Series.ewm(com=com, adjust=True, ignore_na=False, min_periods=0).mean() 的递推一致
+    """
+    def __init__(self, com):
+        self.old_wt_factor = 1. - 1. / (1. + com)
+        self.old_wt = 1.
+        self.value = np.nan
+        self.started = False
+
+    def update(self, x):
+        x = np.float64(x)
+        if not self.started:
+            self.started = True
+            self.value = x
+        elif self.value == self.value:
+            self.old_wt *= self.old_wt_factor
+            if x == x:
+                # 与 pandas 相同，常数序列不重新计算，避免舍入误差
+                if self.value != x:
+                    self.value = (self.old_wt * self.value + x) / (self.old_wt + 1.)
+                self.old_wt += 1.
+        elif x == x:
+            self.value = x
+        return self.value
+
+
+class RollingSumState:
+    """
+    滑动窗口求和的运行状态，对应 rolling(window).sum()：窗口内的值存放在环形缓冲区中，与 pandas 的固定窗口算法相同，
+    先移出旧值、再加入新值，两步各自做 Kahan 补偿；窗口内没有有效值时从零重新累加（窗口长度为 1 时每步都是如此），
+    丢弃之前的舍入误差；窗口未满或窗口内有空值时为空值。
+    x 可以是标量，也可以是一行各标的（或各参数）的值，按元素做完全相同的浮点运算；
+    批量函数 rolling_sum 逐行调用本类，因此逐根K线更新与批量结果逐位一致
+    """
+    def __init__(self, window, shape=()):
+        self.window = window
+        self.buffer = np.full((window,) + tuple(shape), np.nan)
+        self.n_bars = 0
+        self.nobs = np.zeros(shape, dtype='int64')
+        self.total = np.zeros(shape)
+        self.compensation_add = np.zeros(shape)
+        self.compensation_remove = np.zeros(shape)
+
+    def update(self, x):
+        x = np.asarray(x, dtype='float64')
+        slot = self.n_bars % self.window
+        with np.errstate(invalid='ignore'):
+            if self.n_bars >= self.window:
+                # 移出窗口中最早的值
+                old = self.buffer[slot]
+                valid = old == old
+                y = -old - self.compensation_remove
+                total = self.total + y
+                self.compensation_remove = np.where(valid, (total - self.total) - y, self.compensation_remove)
+                self.total = np.where(valid, total, self.total)
+                self.nobs = self.nobs - valid
+                # 窗口内没有有效值时重新开始累加
+                empty = self.nobs == 0
+                self.total = np.where(empty, 0., self.total)
+                self.compensation_add = np.where(empty, 0., self.compensation_add)
+                self.compensation_remove = np.where(empty, 0., self.compensation_remove)
+            # 加入新值
+            valid = x == x
+            y = x - self.compensation_add
+            total = self.total + y
+            self.compensation_add = np.where(valid, (total - self.total) - y, self.compensation_add)
+            self.total = np.where(valid, total, self.total)
+            self.nobs = self.nobs + valid
+        self.buffer[slot] = x
+        self.n_bars += 1
+        return np.where(self.nobs == self.window, self.total, np.nan)[()]
+
+
+class OBVState:
+    """
+    OBV 及其交易信号的运行状态，与 OBV、OBV_signal 一致
+    """
+    def __init__(self):
+        self.n_bars = 0
+        self.last_close = np.nan
+        self.total = 0
+        self.obv = np.nan
+
+    def update(self, close, volume):
+        """
+        :param close, float: 收盘价；
+        :param volume, float: 成交量；
+        :return: obv, signal: OBV 值和交易信号；第一根K线没有信号（None），第二根为 0
+        """
+        # 第一根K线的差分设置为0
+        difClose = 0 if self.n_bars == 0 else close - self.last_close
+        flow = ((difClose >= 0) * 2 - 1) * volume
+        # 与 cumsum 相同，缺失值所在位置为空值，累加跳过缺失值
+        if flow == flow:
+            self.total = self.total + flow
+            obv = self.total
+        else:
+            obv = np.nan
+        if self.n_bars == 0:
+            signal = None
+        elif self.n_bars == 1:
+            signal = 0
+        else:
+            signal = 2 * (obv - self.obv > 0) - 1
+        self.n_bars += 1
+        self.last_close = close
+        self.obv = obv
+        return obv, signal
+
+
+class ChaikinOscillatorState:
+    """
+    佳庆指标及其交易信号的运行状态，与 chaikin_oscillator、chaikin_oscillator_signal 一致；
+    返回的信号为当前K线的持仓，由上一根K线的条件决定
+    """
+    def __init__(self, periods_short=3, periods_long=10, lossratio=999):
+        self.ema_short = EWMState(periods_short)
+        self.ema_long = EWMState(periods_long)
+        self.sma_90 = RollingSumState(90)
+        # 最大损失率不小于 1 时不会触发止损，与 signal_engine.resolve_position 相同
+        self.lossratio = lossratio if lossratio is not None and lossratio < 1 else None
+        self.ad = np.float64(0.)
+        self.n_bars = 0
+        self.last_osc = np.nan
+        self.last_sma_90 = np.nan
+        self.holding = False
+        self.price_in = np.nan
+
+    def update(self, high, low, close, volume):
+        """
+        :param high, float: 最高价；
+        :param low, float: 最低价；
+        :param close, float: 收盘价；
+        :param volume, float: 成交量；
+        :return: ch_osc, signal: 佳庆指标和交易信号（±1）
+        """
+        high, low, close, volume = np.float64(high), np.float64(low), np.float64(close), np.float64(volume)
+        # 更新AD线，最高价等于最低价时不计入
+        price_range = high - low
+        if price_range != 0:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.ad = self.ad + ((close - low) - (high - close)) / price_range * volume
+        osc = self.ema_short.update(self.ad) - self.ema_long.update(self.ad)
+        # 90日均线取上一根K线的值
+        sma_90 = self.last_sma_90
+        self.last_sma_90 = self.sma_90.update(close) / 90
+        signal = 1 if self.holding else -1
+        # 从第90根K线开始判断条件，决定下一根K线的持仓
+        if self.n_bars >= 90:
+            entry = (self.last_osc < 0) & (osc > 0) & (close > sma_90)
+            exit = (self.last_osc > 0) & (close < sma_90) & (osc < 0)
+            if self.holding:
+                with np.errstate(invalid='ignore'):
+                    stopped = self.lossratio is not None and close / self.price_in - 1 < -self.lossratio
+                self.holding = not (exit or stopped)
+            elif entry:
+                self.holding = True
+                self.price_in = close
+        self.n_bars += 1
+        self.last_osc = osc
+        return osc, signal
+
+
+class DMIState:
+    """
+    DMI 及其策略side的运行状态，与 DMI_panel、DMI_side 一致；
+    批量计算时每个标的最后一个有效日期的side固定为-1，逐根更新时最新K线按规则给出side，其余日期相同
+    """
+    def __init__(self, n=14, m=6):
+        self.m = m
+        self.trz = RollingSumState(n)
+        self.dmp = RollingSumState(n)
+        self.dmm = RollingSumState(n)
+        self.adx = RollingSumState(m)
+        self.adx_history = deque(maxlen=m)
+        self.last_high = np.nan
+        self.last_low = np.nan
+        self.last_close = np.nan
+        self.last_dmi = np.nan
+        self.n_valid = 0
+
+    def update(self, high, low, close):
+        """
+        :param high, float: 最高价；
+        :param low, float: 最低价；
+        :param close, float: 收盘价；
+        :return: dmi, side: dmi指标和策略side，指标不全时均为空值
+        """
+        high, low, close = np.float64(high), np.float64(low), np.float64(close)
+        # 真实波幅和方向变动，缺失值向后传递
+        tr = np.maximum(np.maximum(high - low, abs(high - self.last_close)), abs(low - self.last_close))
+        hd = high - self.last_high
+        ld = self.last_low - low
+        mp = hd if (hd > 0) & (hd > ld) else 0.
+        mm = ld if (ld > 0) & (hd < ld) else 0.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trz = self.trz.update(tr)
+            pdi = 100 * (self.dmp.update(mp) / trz)
+            mdi = 100 * (self.dmm.update(mm) / trz)
+            adx = self.adx.update(abs(mdi - pdi) / (mdi + pdi) * 100) / self.m
+        adx_before = self.adx_history[0] if len(self.adx_history) == self.m else np.nan
+        self.adx_history.append(adx)
+        adxr = (adx + adx_before) / 2
+        self.last_high, self.last_low, self.last_close = high, low, close
+        if pdi != pdi or mdi != mdi or adxr != adxr:
+            return np.nan, np.nan
+        dmi = pdi - mdi
+        self.n_valid += 1
+        # 若dmi正且比上一个有效日期增加，购入，否则为-1；前两个有效日期保持-1
+        side = 1 if (dmi > 0) & (dmi > self.last_dmi) & (self.n_valid > 2) else -1
+        self.last_dmi = dmi
+        return dmi, side
@@ -0,0 +1,62 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# factors 依赖仓库根目录下的 signal_engine
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+import factors
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'price_tb.csv')
+
+
+def load_price():
+    # 使用默认的整数索引，OBV 中按位置赋值的写法在各版本 pandas 下含义相同
+    return pd.read_csv(DATA_PATH)
+
+
+def replay(state, *columns):
+    # 按K线顺序逐根送入状态对象，返回每根K线的输出
+    return [state.update(*bar) for bar in zip(*columns)]
+
+
+def test_rolling_sum_state_matches_batch():
+    # 含缺失值、常数段和长度为 1 的窗口，逐根更新与批量结果逐位一致
+    rng = np.random.default_rng(0)
+    x = pd.Series(1e4 + rng.standard_normal(3000) * 50)
+    x[[0, 5, 6, 100]] = np.nan
+    x[200:300] = 1.1
+    for window in (1, 2, 14, 90):
+        state = factors.RollingSumState(window)
+        stream = [state.update(value) for value in x]
+        np.testing.assert_array_equal(stream, factors.rolling_sum(x, window).values)
+
+
+def test_obv_state_replay():
+    df = load_price()
+    outputs = replay(factors.OBVState(), df['close'], df['volume'])
+    np.testing.assert_array_equal([obv for obv, _ in outputs], factors.OBV(df).values)
+    # 信号与面板版 OBV_signal 一致：第一根K线没有信号，第二根为 0
+    panel = {'close': df[['close']].set_axis(['asset'], axis=1), 'volume': df[['volume']].set_axis(['asset'], axis=1)}
+    signal = factors.OBV_signal_panel(panel)['asset']
+    np.testing.assert_array_equal([s for _, s in outputs[1:]], signal.values[1:])
+
+
+def test_chaikin_oscillator_state_replay():
+    df = load_price()
+    batch = factors.chaikin_oscillator(df.copy())
+    for lossratio in (999, 0.05):
+        outputs = replay(factors.ChaikinOscillatorState(lossratio=lossratio), df['high'], df['low'], df['close'], df['volume'])
+        np.testing.assert_array_equal([osc for osc, _ in outputs], batch['ch_osc'].values)
+        signal = factors.chaikin_oscillator_signal(df.copy(), lossratio=lossratio)
+        np.testing.assert_array_equal([s for _, s in outputs], signal.values)
+
+
+def test_dmi_state_replay():
+    df = load_price()
+    outputs = replay(factors.DMIState(), df['high'], df['low'], df['close'])
+    result = factors.DMI_panel(df['high'], df['low'], df['close'])
+    side = factors.DMI_side(result['dmi'])
+    np.testing.assert_array_equal([dmi for dmi, _ in outputs], result['dmi'].values)
+    # 批量计算时最后一个有效日期的side固定为-1，逐根更新时按规则给出，比较其余日期
+    np.testing.assert_array_equal([s for _, s in outputs][:-1], side.values[:-1])
@@ -4,6 +4,8 @@ import sys
 import send_email
 import os
 import main
+import signal_engine
+import data_loader
 
 def BSM_pipeline(config_custom, CONFIG):
     # ------------数据获取/处理-------------
@@ -14,8 +16,11 @@ def BSM_pipeline(config_custom, CONFIG):
         data_dir = os.path.abspath(config_custom["data_dir"])
         # 计算文件的绝对路径
         file_path = os.path.join(data_dir, factor["param_dataSrc"][1]["func_name_dataSrc"])
-        # 读取数据文件
-        price_tb_original = pd.read_pickle(file_path)
+        # 读取数据文件；面板模式读取多标的行情
+        if config_custom["panel_mode"]:
+            price_panel = signal_engine.load_panel(file_path, asset_col=config_custom["panel_asset_col"], date_format=config_custom["date_format"])
+        else:
+            price_tb_original = data_loader.load_price_table(file_path, date_format=config_custom["date_format"])
 
         # ------------因子计算-------------
         import importlib
@@ -25,10 +30,15 @@ def BSM_pipeline(config_custom, CONFIG):
         function_name = factor["func_name_factor"]
         module = importlib.import_module(module_name)
         function = getattr(module, function_name)
-        # 计算交易信号
-        price_tb_original['flag'] = function(price_tb_original)
-        price_tb = price_tb_original['close'].to_frame('000300.XSHG')
-        factor_tb = price_tb_original['flag'].to_frame('000300.XSHG')
+        if config_custom["panel_mode"]:
+            # 面板模式：因子函数输出 日期 x 标的 的信号矩阵，所有标的一起回测一次
+            factor_tb = getattr(module, function_name + '_panel')(price_panel)
+            price_tb = price_panel['close']
+        else:
+            # 计算交易信号
+            price_tb_original['flag'] = function(price_tb_original)
+            price_tb = price_tb_original['close'].to_frame('000300.XSHG')
+            factor_tb = price_tb_original['flag'].to_frame('000300.XSHG')
 
         # ------------回测-------------
         sys.path.append(CONFIG["cal_model_dir"])
@@ -39,6 +49,7 @@ def BSM_pipeline(config_custom, CONFIG):
         IC_lag_n = CONFIG["IC_lag_n"]
         period = CONFIG["period"]
         winlen = CONFIG["winlen"]
+        metric_mode = CONFIG["metric_mode"]
         start_date = CONFIG["start_date"]
         end_date = CONFIG["end_date"]
         # 统一命名
@@ -49,13 +60,13 @@ def BSM_pipeline(config_custom, CONFIG):
         import cal_metric_api
         date_range_src = price_tb.index
         ret_tb_original, factor_tb_original, price_tb, ret_tb, factor_tb, position_tb, date_range_src, period = backtest_vector.backtest(factor_tb, price_tb, date_range_src, start_date, end_date, FREQUENCY_INTERVAL, period, freq_position)
-        cal_metric_result[function_name] = cal_metric_api.cal_portfolio_metric(price_tb, ret_tb, factor_tb, position_tb, benchmark,subportfolio_num, IC_lag_n, period, winlen)
+        cal_metric_result[function_name] = cal_metric_api.cal_portfolio_metric(price_tb, ret_tb, factor_tb, position_tb, benchmark,subportfolio_num, IC_lag_n, period, winlen, metric_mode=metric_mode)
 
     # ------------输出-------------
     sys.path.append(CONFIG["output_model_dir"])
     import output_file
     output_file_path = os.path.join(CONFIG['output_dir'], "cal_metric_indicator.pkl")
-    cal_metric_result = output_file.output_func(cal_metric_result, output_file_path)
+    cal_metric_result = output_file.output_func(cal_metric_result, output_file_path, CONFIG["output_format"])
 
     return cal_metric_result
 
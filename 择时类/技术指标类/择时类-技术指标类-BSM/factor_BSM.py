@@ -1,5 +1,7 @@
 
 import numpy as np
+import pandas as pd
+from scipy.special import ndtr
 
 
 
@@ -22,29 +24,122 @@ def BSM(s, k=10, t=1, r=0.05, v=0.2):
     bsm_value = s * np.exp(-r * t) * np.exp(-v * np.sqrt(t) * np.random.normal())
     return bsm_value
 
-def BSM_signal(data, t=1, r=0.05, v=0.2):
+def BSM_closed_form(s, k=10, t=1, r=0.05, v=0.2, option='call'):
+    """
+        出处：《股票-技术指标类-BSM》
+        整列计算 BSM 欧式期权的解析定价，d1、d2 对所有日期一次算完；
+    :param s, float or ndarray or Series: 股票的当前价格
+    :param k, float or ndarray or Series: 行权价格
+    :param t, float: 到期时间，默认一年
+    :param r, float: 无风险利率，默认0.05
+    :param v, float: 波动率 默认0.2
+    :param option, str: 'call' 看涨期权，'put' 看跌期权
+    :return bsm_value, ndarray or Series: 与 s 同形的 BSM 定价
+    """
+    # 计算d1
+    d1 = (np.log(s / k) + (r + v**2 / 2) * t) / (v * np.sqrt(t))
+    # 计算d2
+    d2 = d1 - v * np.sqrt(t)
+    # 计算bsm价格
+    if option == 'call':
+        return s * ndtr(d1) - k * np.exp(-r * t) * ndtr(d2)
+    if option == 'put':
+        return k * np.exp(-r * t) * ndtr(-d2) - s * ndtr(-d1)
+    raise ValueError(f"option 只能为 'call' 或 'put'，实际为 {option!r}")
+
+def BSM_monte_carlo(s, t=1, r=0.05, v=0.2, n_paths=1000, seed=None, quantiles=(0.05, 0.5, 0.95), chunk_size=1000000):
+    """
+        出处：《股票-技术指标类-BSM》
+        对每个日期模拟 n_paths 条路径，用与 BSM 相同的估价公式得到 日期 x 路径 的估价矩阵，再汇总为均值和分位数；
+        随机数来自带种子的 Generator，结果可复现；
+    :param s, ndarray or Series: 每个日期的股票价格
+    :param t, float: 到期时间，默认一年
+    :param r, float: 无风险利率，默认0.05
+    :param v, float: 波动率 默认0.2
+    :param n_paths, int: 每个日期的模拟路径数
+    :param seed, int: 随机数种子，None 表示不固定
+    :param quantiles, tuple: 需要输出的分位数
+    :param chunk_size, int: 每次生成的随机数个数上限，按日期分块控制内存
+    :return estimate, DataFrame: 每个日期一行，列为 mean 和各分位数
+    """
+    rng = np.random.default_rng(seed)
+    prices = np.asarray(s, dtype=float)
+    # 按日期分块，每块生成一个 日期 x 路径 的随机数矩阵
+    rows = max(1, chunk_size // n_paths)
+    estimate = np.empty((len(prices), 1 + len(quantiles)))
+    for start in range(0, len(prices), rows):
+        block = prices[start:start + rows, None]
+        values = block * np.exp(-r * t) * np.exp(-v * np.sqrt(t) * rng.standard_normal((len(block), n_paths)))
+        estimate[start:start + rows, 0] = values.mean(axis=1)
+        if quantiles:
+            estimate[start:start + rows, 1:] = np.quantile(values, quantiles, axis=1).T
+    index = s.index if isinstance(s, pd.Series) else None
+    return pd.DataFrame(estimate, index=index, columns=['mean'] + list(quantiles))
+
+def BSM_value(close, t=1, r=0.05, v=0.2, n_paths=1, seed=0, mode='monte_carlo', k=None):
+    """
+        出处：《股票-技术指标类-BSM》
+        整列计算每个日期的 BSM 估价和与之比较的基准价，BSM_signal 和 BSM_signal_panel 共用；
+        'monte_carlo' 的估价为 BSM_monte_carlo 的模拟均值，基准价为收盘价（与原 BSM_signal 一致）；
+        'closed_form' 的估价为行权价 k 的看涨期权解析价，基准价为同一行权价的看跌期权解析价，
+        由平价关系，看涨价高于看跌价当且仅当收盘价高于贴现后的行权价；
+        看涨期权价值恒小于标的价格，若直接与收盘价比较信号恒为卖出，因此不与收盘价比较；
+    :param close, ndarray or Series: 每个日期的收盘价
+    :param mode, str: 估价方式，'monte_carlo' 或 'closed_form'
+    :param k, float or ndarray or Series: 解析定价的行权价格，'closed_form' 时必须给出，例如收盘价的滚动均值；
+        以当日收盘价为行权价时信号与价格无关，因此不提供默认值
+    :return bsm, ndarray: 与 close 同形的估价
+    :return benchmark, ndarray: 与 close 同形的基准价
+    """
+    if mode == 'closed_form':
+        if k is None:
+            raise ValueError("mode='closed_form' 需要给出行权价格 k")
+        bsm = np.asarray(BSM_closed_form(close, k, t, r, v, 'call'), dtype=float)
+        benchmark = np.asarray(BSM_closed_form(close, k, t, r, v, 'put'), dtype=float)
+        return bsm, benchmark
+    if mode == 'monte_carlo':
+        bsm = BSM_monte_carlo(close, t, r, v, n_paths, seed, quantiles=())['mean'].values
+        return bsm, np.asarray(close, dtype=float)
+    raise ValueError(f"mode 只能为 'monte_carlo' 或 'closed_form'，实际为 {mode!r}")
+
+def BSM_signal(data, t=1, r=0.05, v=0.2, n_paths=1, seed=0, mode='monte_carlo', k=None):
     """
         出处：《股票-技术指标类-BSM》
         使用收盘价数据期权价格；
         如果定价高于现在价格，认为实际价格偏高，会上涨，买入信号；
         反之发出卖出信号。
     :param data, DataFrame: 股票数据
+    :param n_paths, int: 每个日期的模拟路径数，默认与原逐日计算一样每天一条，大于 1 时使用模拟均值
+    :param seed, int: 随机数种子，None 表示不固定
+    :param mode, str: 估价方式，'monte_carlo'（默认）或 'closed_form'，见 BSM_value
+    :param k, float or Series: 解析定价的行权价格，'closed_form' 时必须给出，Series 按日期对齐
     :return signal, Series: 交易信号
     """
-    # 存储空间交易信号
-    data['signal'] = 0
-    # 存储空间bsm价格
-    data['bsm'] = 0
-    # 对每一天
-    for i in range(len(data)):
-        # 获得当日价格
-        price = data['close'][data.index[i]]
-        # 计算当日bsm
-        bsm_estimate = BSM(price, price,t,r,v)
-        # 记录bsm
-        data.loc[data.index[i], 'bsm'] = bsm_estimate
-    # 如果当日bsm估价大于实际价格，卖出，反之买入
-    data['signal'] = (data['bsm'] > data['close']) * 2 - 1
+    if isinstance(k, pd.Series):
+        k = k.reindex(data.index).values
+    # 所有日期一次估价，记录bsm
+    data['bsm'], benchmark = BSM_value(data['close'], t, r, v, n_paths, seed, mode, k)
+    # 如果当日bsm估价大于基准价，卖出，反之买入
+    data['signal'] = (data['bsm'] > benchmark) * 2 - 1
     # 存储交易信号
     signal = data['signal']
-    return signal
\ No newline at end of file
+    return signal
+
+def BSM_signal_panel(panel, t=1, r=0.05, v=0.2, n_paths=1, seed=0, mode='monte_carlo', k=None):
+    """
+        出处：《股票-技术指标类-BSM》
+        面板版交易信号，规则与 BSM_signal 相同，所有标的、所有日期一次估价。
+    :param panel, dict: {字段: 日期 x 标的 的 DataFrame}，需要 close
+    :param n_paths, int: 每个日期的模拟路径数
+    :param seed, int: 随机数种子，None 表示不固定
+    :param mode, str: 估价方式，'monte_carlo'（默认）或 'closed_form'，见 BSM_value
+    :param k, float or DataFrame: 解析定价的行权价格，'closed_form' 时必须给出，DataFrame 按 日期 x 标的 对齐
+    :return signal, DataFrame: 日期 x 标的 的交易信号，收盘价缺失的位置为空值
+    """
+    close = panel['close']
+    if isinstance(k, pd.DataFrame):
+        k = k.reindex(index=close.index, columns=close.columns).values.ravel()
+    bsm, benchmark = BSM_value(close.values.ravel(), t, r, v, n_paths, seed, mode, k)
+    # 如果当日bsm估价大于基准价，卖出，反之买入
+    signal = pd.DataFrame(np.where(bsm > benchmark, 1, -1).reshape(close.shape), index=close.index, columns=close.columns)
+    return signal.where(close.notna())
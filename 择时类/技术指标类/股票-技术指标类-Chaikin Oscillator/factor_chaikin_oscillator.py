@@ -1,5 +1,47 @@
 import pandas as pd
 import numpy as np
+import signal_engine
+
+def accumulation_distribution(high, low, close, volume):
+    """
+    计算累积/派发线（AD 线）：资金流量乘数整列计算，最高价等于最低价的日期记为 0，再累加；
+    传入 日期 x 标的 的 DataFrame 时，所有标的一次计算完成。
+    :param high, Series or DataFrame: 最高价；
+    :param low, Series or DataFrame: 最低价；
+    :param close, Series or DataFrame: 收盘价；
+    :param volume, Series or DataFrame: 成交量；
+    :return: ad, Series or DataFrame: AD 线，索引与 close 相同；
+    """
+    high, low, close_values, volume = (np.asarray(x, dtype='float64') for x in (high, low, close, volume))
+    price_range = high - low
+    # 资金流量 = 资金流量乘数 * 成交量
+    with np.errstate(divide='ignore', invalid='ignore'):
+        money_flow = ((close_values - low) - (high - close_values)) / price_range * volume
+    # 最高价等于最低价时当日不计入，AD 线保持上一个值
+    money_flow[price_range == 0] = 0
+    # 按日期累加，缺失值与逐行计算一样向后传递
+    ad = np.cumsum(money_flow, axis=0)
+    if isinstance(close, pd.DataFrame):
+        return pd.DataFrame(ad, index=close.index, columns=close.columns)
+    return pd.Series(ad, index=close.index)
+
+
+def chaikin_oscillator_panel(high, low, close, volume, periods_short=3, periods_long=10):
+    """
+    面板版佳庆指标：输入为 日期 x 标的 的 DataFrame，所有标的一次计算。
+    :param high, DataFrame: 最高价；
+    :param low, DataFrame: 最低价；
+    :param close, DataFrame: 收盘价；
+    :param volume, DataFrame: 成交量；
+    :param periods_short, int: 计算指数加权时短窗长；
+    :param periods_long, int: 计算指数加权时长窗长；
+    :return: ch_osc, DataFrame: 佳庆指标；
+    """
+    ac = accumulation_distribution(high, low, close, volume)
+    ema_long = ac.ewm(ignore_na=False, min_periods=0, com=periods_long, adjust=True).mean()
+    ema_short = ac.ewm(ignore_na=False, min_periods=0, com=periods_short, adjust=True).mean()
+    return ema_short - ema_long
+
 
 def chaikin_oscillator(data, periods_short=3, periods_long=10, high_col='high',
                        low_col='low', close_col='close', vol_col='volume'):
@@ -19,23 +61,8 @@ def chaikin_oscillator(data, periods_short=3, periods_long=10, high_col='high',
     :param vol_col, str: 指定列名；
     :return: data: 返回指标计算结果；
     """
-    # 初始化存储空间
-    ac = pd.Series([],dtype='float64')
-    # 先设置上一个val为0
-    val_last = 0
-    # 对每一行，日期index
-    for index, row in data.iterrows():
-        # 若最高价不等于最低价，计算val值
-        if row[high_col] != row[low_col]:
-            val = val_last + ((row[close_col] - row[low_col]) - (row[high_col] - row[close_col])) / (
-                        row[high_col] - row[low_col]) * row[vol_col]
-        # 否则指定val为上一个val值
-        else:
-            val = val_last
-        # 将当前日期的val值赋给ac对应日期
-        ac[index]=val
-        # 更新上一个val值
-        val_last = val
+    # 计算累积/派发线
+    ac = accumulation_distribution(data[high_col], data[low_col], data[close_col], data[vol_col])
     # 计算长窗长指数平均
     ema_long = ac.ewm(ignore_na=False, min_periods=0, com=periods_long, adjust=True).mean()
     # 计算短窗长指数平均
@@ -54,60 +81,46 @@ def chaikin_oscillator_signal(df, indicator_name='ch_osc',close_name='close',los
     :param df, Series: 计算的原始数据；
     :param indicator_name, str: 指定指标列名；
     :param close_name, str: 指定标的价格基准列名；
-    :return: lossratio, float: 最大损失率，超过平仓则止损；
+    :param lossratio, float: 最大损失率，收盘价相对开仓价格的跌幅超过该值时平仓止损；
+    :return: signal, Series: 基于Chaikin Oscillator计算得到的交易信号；
     """
     # 获取日期
     dfdate = df.index
-    # 增加一列日期
-    df['date'] = df.index
     # 调用因子计算指标值
     pdatas=chaikin_oscillator(df)
     # 重新设定日期索引
     pdatas.index = dfdate
-    # 记录持仓
-    pdatas['position'] = 0
+    indicator = pdatas[indicator_name]
+    # Chaikin Oscillator上穿0，且股价高于90天移动平均，做多
+    entry = (indicator.shift() < 0) & (indicator > 0) & (pdatas[close_name] > pdatas.SMA_90)
+    # Chaikin Oscillator下穿0，且股价低于90天移动平均，平仓
+    exit = (indicator.shift() > 0) & (pdatas[close_name] < pdatas.SMA_90) & (indicator < 0)
+    # 从产生90日均线后的日期开始，当天的条件决定下一天的持仓；下跌超出止损率时止损
+    pdatas['position'] = signal_engine.resolve_position(entry, exit, pdatas[close_name], lossratio, start=90)
     # 记录买卖
-    pdatas['flag'] = 0
-    # 设置索引为日期
-    dfdate = pdatas.index
-    # 记录买入价位
-    pricein = []
-    # 记录卖出价位
-    priceout = []
-    # 设置初始买入价格，足够低即可
-    price_in = 1
-    # 对产生90日均线后的每个日期
-    for i in range(90, pdatas.shape[0] - 1):
-        # 当前无仓位，Chaikin Oscillator上穿0，且股价高于90天移动平均，做多
-        if (pdatas[indicator_name][dfdate[i-1]] < 0) & (pdatas[indicator_name][dfdate[i]] > 0) & (
-                pdatas[close_name][dfdate[i]] > pdatas.SMA_90[dfdate[i]]) & (pdatas.position[dfdate[i]] == 0):
-            # 更新买卖
-            pdatas.loc[dfdate[i], 'flag'] = 1
-            # 更新持仓
-            pdatas.loc[dfdate[i+1], 'position'] = 1
-            # 存储买入日期和价格
-            pricein.append([pdatas.date[dfdate[i]], pdatas.loc[dfdate[i], close_name]])
-        # 当前持仓，下跌超出止损率，止损
-        elif (pdatas.position[dfdate[i]] == 1) & (pdatas[close_name][dfdate[i]] / price_in - 1 < -lossratio):
-            # 更新买卖
-            pdatas.loc[dfdate[i], 'flag'] = -1
-            # 更新持仓
-            pdatas.loc[dfdate[i+1], 'position'] = 0
-            # 更新卖出价位和日期
-            priceout.append([pdatas.date[dfdate[i]], pdatas.loc[dfdate[i], close_name]])
-        # 当前持仓，Chaikin Oscillator下穿0，且股价低于90天移动平均，平仓
-        elif (pdatas[indicator_name][dfdate[i-1]] > 0) & (pdatas[close_name][dfdate[i]] < pdatas.SMA_90[dfdate[i]]) & (
-                pdatas[indicator_name][dfdate[i]] < 0) & (pdatas.position[dfdate[i]] == 1):
-            # 更新买卖
-            pdatas.loc[dfdate[i], 'flag'] = -1
-            # 更新持仓
-            pdatas.loc[dfdate[i+1], 'position'] = 0
-            # 更新买卖价位和日期
-            priceout.append([pdatas.date[dfdate[i]], pdatas.loc[dfdate[i], close_name]])
-        # 其他情况，保持之前仓位不变
-        else:
-            pdatas.loc[dfdate[i+1], 'position'] = pdatas.loc[dfdate[i], 'position']
-        # 获得交易信号，统一格式为±1
-        signal = pdatas['position'].replace(0,-1)
+    pdatas['flag'] = pdatas['position'].diff().shift(-1).fillna(0).astype(int)
+    # 获得交易信号，统一格式为±1
+    signal = pdatas['position'].replace(0,-1)
     # 返回交易信号
-    return signal
\ No newline at end of file
+    return signal
+
+
+def chaikin_oscillator_signal_panel(panel, periods_short=3, periods_long=10, close_name='close', lossratio=999):
+    """
+    出处：《股票-技术指标类-Chaikin Oscillato》
+        面板版交易信号，规则与 chaikin_oscillator_signal 相同，所有标的一次计算。
+    :param panel, dict: {字段: 日期 x 标的 的 DataFrame}，需要 high、low、close、volume；
+    :param periods_short, int: 计算指数加权时短窗长；
+    :param periods_long, int: 计算指数加权时长窗长；
+    :param close_name, str: 指定标的价格基准字段名；
+    :param lossratio, float: 最大损失率，收盘价相对开仓价格的跌幅超过该值时平仓止损；
+    :return: signal, DataFrame: 日期 x 标的 的交易信号；
+    """
+    indicator = chaikin_oscillator_panel(panel['high'], panel['low'], panel[close_name], panel['volume'], periods_short, periods_long)
+    close = panel[close_name]
+    # 计算90日均线
+    sma_90 = close.rolling(90).mean().shift(1)
+    entry = (indicator.shift() < 0) & (indicator > 0) & (close > sma_90)
+    exit = (indicator.shift() > 0) & (close < sma_90) & (indicator < 0)
+    position = signal_engine.resolve_position(entry, exit, close, lossratio, start=90)
+    return position.replace(0, -1)
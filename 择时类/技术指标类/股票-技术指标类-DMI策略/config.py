@@ -11,6 +11,8 @@ CONFIG = {
     "output_model_dir":"../../../../",
     # 结果输出路径
     "output_dir": "result/",
+    # 结果输出格式；"pickle"：整个结果字典保存为一个 pickle 文件；"feather"、"parquet"：每张表单独保存，并用 manifest.json 记录嵌套路径，可按需读取单张表；
+    "output_format": "pickle",  # "feather" "parquet"
     # 回测开始日期；支持'年-月-日'['2018-11-23']、'年-月-日 时:分:秒'['2018-11-23 11:12:13']、'年-月-日 时:分:秒.毫秒'['2018-11-23 11:12:13.12345']格式;
     "start_date": '2018-01-01',
     # 回测结束日期；支持'年-月-日'['2018-11-23']、'年-月-日 时:分:秒'['2018-11-23 11:12:13']、'年-月-日 时:分:秒.毫秒'['2018-11-23 11:12:13.12345']格式;
@@ -32,6 +34,8 @@ CONFIG = {
     "IC_types": ["IC_all_crossSection", "IC_subportfolio_crossSection", "IC_subportfolio_retRatio"],
     # IC滞后值，可以是list或者int，也可以置空；pipeline中使用；
     "IC_lag_n": [1, 2, 3],  # [1,2,3]
+    # 绩效指标计算模式；"native"：只使用原生向量化指标；"compat"：额外调用 ffn、quantstats、empyrical、pyfinance 逐个计算（兼容模式，速度较慢）；
+    "metric_mode": "native",  # "compat"
 
     # all_factor层是否并行，只在all_factor_Demo使用，pipeline、backtest中不使用；
     "multiProcess_all_factor": False,
@@ -57,6 +61,12 @@ config_custom = {
     # 动态修改方法：可以在factor_dict中重新赋值；也可以set_option_instrument(context, conditions, ref=None)修改；
     "output_dir": "result/",
     "data_dir":"data",
+    # 数据文件中日期的格式，读取时按该格式转换为时间索引；None 表示不转换（pickle 数据已是时间索引）
+    "date_format": '%Y/%m/%d',
+    # 是否使用面板模式；面板模式下数据文件为多标的行情（长表含标的代码列，或 字段 x 标的 两层列名的宽表），因子函数 因子名称_panel 输出 日期 x 标的 的信号矩阵，所有标的一起回测一次
+    "panel_mode": False,
+    # 长表中标的代码所在列名
+    "panel_asset_col": "code",
     # 因子字典集；
     # # # 每个因子必须给出的参数如下（其它参数可自行增减）：
     # # "factor_dict": [{"func_name_factor": "因子名称、因子名称_signal", # 此处必须有
@@ -2,6 +2,55 @@
 # Python 3.6
 import numpy as np
 import pandas as pd
+def DMI_panel(high, low, close, n=14, m=6):
+    """
+    整体计算DMI指标：+DM/-DM、真实波幅、ADX、ADXR均为整列运算；传入 日期 x 标的 的 DataFrame 时所有标的一次计算完成。
+    :param high, Series or DataFrame: 最高价；
+    :param low, Series or DataFrame: 最低价；
+    :param close, Series or DataFrame: 收盘价；
+    :param n, int: 计算trz指标时滑动窗口长度；
+    :param m, int: 计算adx指标时滑动窗口长度；
+    :return: result, dict: {'pdi', 'mdi', 'adx', 'adxr', 'dmi'} 对应的计算结果，与输入同形；dmi 在 adxr 缺失的日期为空值；
+    """
+    # 计算真实波幅tr指标，取三者最大值，缺失值向后传递
+    tr = np.maximum(np.maximum(high - low, (high - close.shift()).abs()), (low - close.shift()).abs())
+    # tr指标滑动窗口求和
+    trz = tr.rolling(n).sum()
+    # 计算最高价差价hd
+    hd = high - high.shift()
+    # 计算最低价差价ld
+    ld = low.shift() - low
+    # 若hd正且大于ld则取hd，否则取0
+    mp = hd.where((hd > 0) & (hd > ld), 0)
+    # 若ld正且大于hd则取ld，否则取0
+    mm = ld.where((ld > 0) & (hd < ld), 0)
+    # 计算pdi指标
+    pdi = 100 * mp.rolling(n).sum().div(trz)
+    # 计算mdi指标
+    mdi = 100 * mm.rolling(n).sum().div(trz)
+    # 计算adx指标
+    adx = ((mdi - pdi).abs() / (mdi + pdi) * 100).rolling(m).mean()
+    # 计算adxr指标
+    adxr = (adx + adx.shift(m)) / 2
+    # 计算dmi指标，只保留各项指标都有值的日期
+    dmi = (pdi - mdi).where(pdi.notna() & mdi.notna() & adxr.notna())
+    return {'pdi': pdi, 'mdi': mdi, 'adx': adx, 'adxr': adxr, 'dmi': dmi}
+
+def DMI_side(dmi):
+    """
+    根据dmi整体计算策略side：dmi正且比上一个有效日期增加时为1，其余为-1；每个标的的前两个和最后一个有效日期保持-1。
+    :param dmi, Series or DataFrame: dmi指标，缺失值所在日期不参与计算；
+    :return: side, Series or DataFrame: 策略side，dmi缺失的日期为空值；
+    """
+    valid = dmi.notna()
+    # 每个日期在各自标的有效日期中的序号，从1开始
+    order = valid.cumsum()
+    # 上一个有效日期的dmi
+    dmi_last = dmi.shift().ffill()
+    # 若dmi正且增加，购入；若dmi负且减小，卖出（与初始值-1相同）
+    buy = (dmi > 0) & (dmi > dmi_last) & (order > 2) & (order < valid.sum())
+    return buy.astype(int).where(buy, -1).where(valid)
+
 def DMI(df, n=14, m=6):
     """
     出处：《股票-技术指标类-DMI策略》
@@ -15,25 +64,8 @@ def DMI(df, n=14, m=6):
     :param n, int: 计算trz指标时滑动窗口长度；
     :return: _dmi, Series: dmi计算结果；
     """
-    # 计算真实波幅tr指标
-    tr = pd.Series(np.vstack([df['high'] - df['low'], (df['high'] - df['close'].shift()).abs(),
-                              (df['low'] - df['close'].shift()).abs()]).max(axis=0), index=df.index)
-    # tr指标滑动窗口求和
-    trz = tr.rolling(n).sum()
-    # 数据存储数据框
-    _m = pd.DataFrame()
-    # 计算最高价差价hd
-    _m['hd'] = df['high'] - df['high'].shift()
-    # 计算最低价差价ld
-    _m['ld'] = df['low'].shift() - df['low']
-    # 若hd正且大于ld则取hd，否则取0
-    _m['mp'] = _m.apply(lambda x: x.hd if x.hd > 0 and x.hd > x.ld else 0, axis=1)
-    # 若ld正且大于hd则取ld，否则取0
-    _m['mm'] = _m.apply(lambda x: x.ld if x.ld > 0 and x.hd < x.ld else 0, axis=1)
-    # 计算mp滑动窗口求和
-    _m['dmp'] = _m.mp.rolling(n).sum()
-    # 计算mm滑动窗口求和
-    _m['dmm'] = _m.mm.rolling(n).sum()
+    # 整体计算各项指标
+    result = DMI_panel(df['high'], df['low'], df['close'], n, m)
     # 结果数据框
     _dmi = pd.DataFrame()
     # 开盘价
@@ -41,13 +73,13 @@ def DMI(df, n=14, m=6):
     #收盘价
     _dmi['close'] = df['close']
     # 计算pdi指标
-    _dmi['pdi'] = 100 * _m.dmp.div(trz)
+    _dmi['pdi'] = result['pdi']
     # 计算mdi指标
-    _dmi['mdi'] = 100 * _m.dmm.div(trz)
+    _dmi['mdi'] = result['mdi']
     # 计算adx指标
-    _dmi['adx'] = ((_dmi.mdi - _dmi.pdi).abs() / (_dmi.mdi + _dmi.pdi) * 100).rolling(m).mean()
+    _dmi['adx'] = result['adx']
     # 计算adxr指标
-    _dmi['adxr'] = (_dmi.adx + _dmi.adx.shift(m)) / 2
+    _dmi['adxr'] = result['adxr']
     # 设置索引
     _dmi.index = df.index
     # 去掉nan值所在行
@@ -69,27 +101,20 @@ def DMI_signal(df):
     """
     # 调用DMI因子，计算DMI
     dmi = DMI(df)
-    # 获取dmi长度c
-    c = len(dmi)
-    # 根据dmi索引获得日期
-    dmidate = dmi.index
-    # 对每一个日期
-    for i in range(len(dmidate)):
-        # 第1天后，倒数第二天前
-        if i > 1 and i + 1 < len(dmidate):
-            # 若dmi正且增加，购入
-            if dmi.loc[dmidate[i],'dmi'] > 0 and dmi.loc[dmidate[i],'dmi'] > dmi.loc[dmidate[i-1],'dmi']:
-                dmi['side'].values[i] = 1
-            # 若dmi负且减小，卖出
-            if dmi.loc[dmidate[i],'dmi'] < 0 and dmi.loc[dmidate[i],'dmi'] < dmi.loc[dmidate[i-1],'dmi']:
-                dmi['side'].values[i] = -1
+    # 若dmi正且增加，购入；若dmi负且减小，卖出
+    dmi['side'] = DMI_side(dmi['dmi']).astype(int)
     # 获得交易信号
     signal = dmi['side']
     # 返回交易信号
     return signal
 
-
-
-
-
-
+def DMI_signal_panel(panel, n=14, m=6):
+    """
+    出处：《股票-技术指标类-DMI策略》
+        面板版交易信号，规则与 DMI_signal 相同，所有标的一次计算。
+    :param panel, dict: {字段: 日期 x 标的 的 DataFrame}，需要 high、low、close；
+    :param n, int: 计算trz指标时滑动窗口长度；
+    :param m, int: 计算adx指标时滑动窗口长度；
+    :return: signal, DataFrame: 日期 x 标的 的交易信号，dmi缺失的日期为空值；
+    """
+    return DMI_side(DMI_panel(panel['high'], panel['low'], panel['close'], n, m)['dmi'])
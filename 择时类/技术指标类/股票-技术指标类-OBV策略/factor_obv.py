@@ -41,4 +41,23 @@ def OBV_signal(df):
     signal = (2 * (OBV_val.diff() > 0) - 1)[1:]
     # 差分会导致第一个元素为nan，设置为0
     signal[0] = 0
-    return signal
\ No newline at end of file
+    return signal
+
+def OBV_signal_panel(panel):
+    """
+    出处：《股票-技术指标类-OBV策略》
+        面板版OBV交易信号，规则与 OBV_signal 相同，所有标的一次计算。
+    :param panel, dict: {字段: 日期 x 标的 的 DataFrame}，需要 close、volume；
+    :return: signal, DataFrame: 日期 x 标的 的交易信号，第一个日期为空值；
+    """
+    # 计算差分，第一个日期设置为0
+    difClose = panel['close'].diff()
+    difClose.iloc[0] = 0
+    # 计算OBV
+    OBV_val = (((difClose >= 0) * 2 - 1) * panel['volume']).cumsum()
+    # 生成交易信号
+    signal = (2 * (OBV_val.diff() > 0) - 1).astype('float64')
+    # 差分会导致第一个日期没有信号，第二个日期设置为0
+    signal.iloc[0] = np.nan
+    signal.iloc[1] = 0
+    return signal
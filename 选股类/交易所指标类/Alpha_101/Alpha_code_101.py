@@ -3,62 +3,415 @@ import pandas as pd
 from numpy import abs
 from numpy import log
 from numpy import sign
-from scipy.stats import rankdata
+from numpy.lib.stride_tricks import as_strided
+from collections import OrderedDict
+import functools
+import inspect
+
+# region Operator cache
+# 当前正在计算的 Alphas 实例的算子缓存，只在 alpha 方法执行期间生效
+active_cache = None
+
+class OperatorCache(object):
+    """
+    算子结果缓存，键为 (算子名, 输入对象 id, 窗口等参数)，超过内存上限时淘汰最近最少使用的结果
+    每条缓存同时持有输入对象的引用，保证缓存存在期间输入对象的 id 不会被复用
+    缓存的结果会被多个 alpha 共享，不能原地修改
+    """
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, inputs, value):
+        size = value.values.nbytes if isinstance(value, (pd.DataFrame, pd.Series)) else 0
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (inputs, value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.nbytes -= evicted
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+def memo_operator(func):
+    """
+    算子装饰器：在 Alphas 的 alpha 方法中调用时，相同算子、相同输入对象、相同窗口的结果只计算一次
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if any(isinstance(arg, LookbackTrace) for arg in args + tuple(kwargs.values())):
+            return trace_operator(func, args, kwargs)
+        cache = active_cache
+        if cache is None:
+            return func(*args, **kwargs)
+        is_table = lambda arg: isinstance(arg, (pd.DataFrame, pd.Series))
+        key = (func.__name__,) + tuple(('id', id(arg)) if is_table(arg) else arg for arg in args) + tuple(sorted(kwargs.items()))
+        try:
+            value = cache.get(key)
+        except TypeError:
+            # 参数不可哈希时不缓存
+            return func(*args, **kwargs)
+        if value is None:
+            value = func(*args, **kwargs)
+            cache.put(key, tuple(arg for arg in args if is_table(arg)), value)
+        return value
+    return wrapper
+
+def with_operator_cache(method):
+    """
+    alpha 方法装饰器：方法执行期间启用实例自身的算子缓存，结束后恢复
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        global active_cache
+        previous = active_cache
+        active_cache = self.cache
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            active_cache = previous
+    return wrapper
+# endregion
+
+# region Lookback trace
+# 追溯历史长度时算子向过去多取的行数：滚动窗口算子为 窗口 - 1，delay、delta 为期数
+WINDOW_OPERATORS = {'ts_sum', 'sma', 'stddev', 'correlation', 'covariance', 'ts_rank', 'product', 'ts_min', 'ts_max',
+                    'ts_argmax', 'ts_argmin'}
+SHIFT_OPERATORS = {'delay', 'delta'}
+# 面板上按行计算的截面算子，不增加历史长度；单个资产的 Series 上按整段时序计算，没有上限
+CROSS_SECTION_OPERATORS = {'rank', 'scale'}
+# 其余算子没有上限，如 decay_linear 先对输入 ffill().bfill()，空值会取到任意久之前（及之后）的数据
+
+class LookbackTrace(object):
+    """
+    代替行情字段传入 alpha 方法，不做实际计算，只记录结果的某一行最多依赖该行之前多少行的输入
+    逐元素运算（算术、比较、numpy ufunc、replace、fillna(value)、where、mask、按条件赋值）取各输入的最大值，算子按窗口增加；
+    其余写法（依赖数值的 if、按位置取值、时序填充等）抛出 TypeError 或 AttributeError，由 alpha_lookback 记为没有上限
+    :param lookback, int or None: 历史长度，None 表示依赖全部历史
+    :param panel, bool: 是否为 日期 x 资产 面板
+    """
+    def __init__(self, lookback, panel=True):
+        self.lookback = lookback
+        self.panel = panel
+
+    def __setitem__(self, key, value):
+        # alpha[cond] = value：结果同时依赖条件和赋的值
+        self.lookback = merge_traces(self, key, value).lookback
+
+    def __bool__(self):
+        raise TypeError("依赖数值的分支无法追溯历史长度")
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        # 只有逐元素调用可以追溯，reduce、accumulate 等返回 NotImplemented，numpy 抛出 TypeError
+        if method != '__call__' or 'out' in kwargs:
+            return NotImplemented
+        return merge_traces(*inputs)
+
+    def __array_function__(self, func, types, args, kwargs):
+        if func is not np.where:
+            return NotImplemented
+        return merge_traces(*args, *kwargs.values())
+
+    def replace(self, *args, **kwargs):
+        return merge_traces(self)
+
+    def fillna(self, value=None, method=None, **kwargs):
+        if method is not None or value is None:
+            raise TypeError("按时序填充空值无法追溯历史长度")
+        return merge_traces(self, value)
+
+    def where(self, cond, other=np.nan, **kwargs):
+        return merge_traces(self, cond, other)
+
+    def mask(self, cond, other=np.nan, **kwargs):
+        return merge_traces(self, cond, other)
+
+    def pow(self, other, **kwargs):
+        return merge_traces(self, other)
+
+    def abs(self):
+        return merge_traces(self)
+
+# 算术、比较、逻辑运算都是逐元素的
+for name in ['add', 'sub', 'mul', 'truediv', 'floordiv', 'mod', 'pow', 'and', 'or', 'xor']:
+    setattr(LookbackTrace, f'__{name}__', lambda self, other: merge_traces(self, other))
+    setattr(LookbackTrace, f'__r{name}__', lambda self, other: merge_traces(self, other))
+for name in ['lt', 'le', 'gt', 'ge', 'eq', 'ne']:
+    setattr(LookbackTrace, f'__{name}__', lambda self, other: merge_traces(self, other))
+for name in ['neg', 'pos', 'abs', 'invert']:
+    setattr(LookbackTrace, f'__{name}__', lambda self: merge_traces(self))
+LookbackTrace.__hash__ = None
+
+def merge_traces(*values, extra=0):
+    """
+    逐元素组合若干输入：历史长度取最大值再加 extra，任一输入没有上限时结果也没有上限；非追溯对象（常数）不影响结果
+    :param values: LookbackTrace 或常数
+    :param extra, int: 额外向过去取的行数
+    :return: LookbackTrace
+    """
+    traces = [value for value in values if isinstance(value, LookbackTrace)]
+    lookbacks = [trace.lookback for trace in traces]
+    lookback = None if None in lookbacks else max(lookbacks, default=0) + extra
+    return LookbackTrace(lookback, all(trace.panel for trace in traces))
+
+def trace_operator(func, args, kwargs):
+    """
+    按算子的窗口参数推算结果的历史长度，memo_operator 在参数中有 LookbackTrace 时调用
+    :param func, function: 算子
+    :param args, kwargs: 调用算子的参数
+    :return: LookbackTrace
+    """
+    arguments = inspect.signature(func).bind(*args, **kwargs)
+    arguments.apply_defaults()
+    values = arguments.arguments
+    name = func.__name__
+    result = merge_traces(*values.values())
+    if name in WINDOW_OPERATORS and is_count(values['window'], 1):
+        return merge_traces(result, extra=int(values['window']) - 1)
+    if name in SHIFT_OPERATORS and is_count(values['period'], 0):
+        return merge_traces(result, extra=int(values['period']))
+    if name in CROSS_SECTION_OPERATORS and result.panel:
+        return result
+    # 向未来取数（负的期数）、非整数窗口和其余算子都没有上限
+    return LookbackTrace(None, result.panel)
+
+def is_count(value, minimum):
+    # 窗口、期数为不小于 minimum 的整数
+    return isinstance(value, (int, np.integer, float, np.floating)) and value == int(value) and value >= minimum
+# endregion
 
 # region Auxiliary functions
+@memo_operator
 def ts_sum(df, window=10):
     """
     Wrapper function to estimate rolling sum.
     :param df: a pandas DataFrame.
     :param window: the rolling window.
-    :return: a pandas DataFrame with the time-series min over the past 'window' days.
+    :return: a pandas DataFrame with the time-series sum over the past 'window' days.
     """
-    return df.rolling(window).sum()
+    return window_kernel(df, window, window_sum)
 
+@memo_operator
 def sma(df, window=10):
     """
     Wrapper function to estimate SMA.
     :param df: a pandas DataFrame.
     :param window: the rolling window.
-    :return: a pandas DataFrame with the time-series min over the past 'window' days.
+    :return: a pandas DataFrame with the time-series mean over the past 'window' days.
     """
-    return df.rolling(window).mean()
+    return window_kernel(df, window, lambda windows: window_sum(windows) / windows.shape[1])
 
+@memo_operator
 def stddev(df, window=10):
     """
-    Wrapper function to estimate rolling standard deviation.
+    Wrapper function to estimate rolling standard deviation (ddof=1, as df.rolling(window).std()).
     :param df: a pandas DataFrame.
     :param window: the rolling window.
-    :return: a pandas DataFrame with the time-series min over the past 'window' days.
+    :return: a pandas DataFrame with the time-series standard deviation over the past 'window' days.
     """
-    return df.rolling(window).std()
+    return window_kernel(df, window, lambda windows: np.sqrt(window_comoment(windows, windows) / (windows.shape[1] - 1)))
 
+@memo_operator
 def correlation(x, y, window=10):
     """
     Wrapper function to estimate rolling corelations.
-    :param df: a pandas DataFrame.
+    :param x, y: pandas DataFrames (or Series) with the same labels.
     :param window: the rolling window.
-    :return: a pandas DataFrame with the time-series min over the past 'window' days.
+    :return: a pandas DataFrame with the time-series correlation over the past 'window' days;
+             NaN where either input is constant over the window.
     """
-    return x.rolling(window).corr(y)
+    return pair_window_kernel(x, y, window, window_correlation)
 
+@memo_operator
 def covariance(x, y, window=10):
     """
-    Wrapper function to estimate rolling covariance.
-    :param df: a pandas DataFrame.
+    Wrapper function to estimate rolling covariance (ddof=1, as x.rolling(window).cov(y)).
+    :param x, y: pandas DataFrames (or Series) with the same labels.
     :param window: the rolling window.
-    :return: a pandas DataFrame with the time-series min over the past 'window' days.
+    :return: a pandas DataFrame with the time-series covariance over the past 'window' days.
+    """
+    return pair_window_kernel(x, y, window, lambda wx, wy: window_comoment(wx, wy) / (wx.shape[1] - 1))
+
+def as_panel(df):
+    """
+    Auxiliary function to view a DataFrame or Series as a 2-D float array.
+    :param df: a pandas DataFrame or Series.
+    :return: a (dates, assets) numpy array.
     """
-    return x.rolling(window).cov(y)
+    values = np.asarray(df, dtype=float)
+    return values.reshape(values.shape[0], -1)
 
-def rolling_rank(na):
+def like_input(df, values):
     """
-    Auxiliary function to be used in pd.rolling_apply
-    :param na: numpy array.
-    :return: The rank of the last value in the array.
+    Auxiliary function to wrap a 2-D result back with the labels of the input.
+    :param df: the pandas DataFrame or Series the result was computed from.
+    :param values: a (dates, assets) numpy array.
+    :return: a pandas DataFrame or Series with the same index (and columns) as df.
     """
-    return rankdata(na)[-1]
+    if isinstance(df, pd.Series):
+        return pd.Series(values[:, 0], index=df.index, name=df.name)
+    return pd.DataFrame(values, index=df.index, columns=df.columns)
 
+def rolling_window(values, window):
+    """
+    Strided view of all trailing windows of a 2-D array, no data is copied.
+    :param values: a (dates, assets) numpy array.
+    :param window: the rolling window.
+    :return: a read-only view shaped (dates - window + 1, window, assets).
+    """
+    n, m = values.shape
+    s0, s1 = values.strides
+    return as_strided(values, shape=(n - window + 1, window, m), strides=(s0, s0, s1), writeable=False)
+
+def rolling_count(mask, window):
+    """
+    Number of True values in every trailing window, computed with one cumulative sum.
+    :param mask: a (dates, assets) boolean or float numpy array.
+    :param window: the rolling window.
+    :return: a (dates - window + 1, assets) numpy array.
+    """
+    total = np.cumsum(mask, axis=0, dtype=float)
+    total = np.vstack([np.zeros((1, total.shape[1])), total])
+    return total[window:] - total[:-window]
+
+def window_kernel(df, window, kernel, strided=True):
+    """
+    Apply a kernel to every full trailing window of all assets at once.
+    Windows containing NaN or inf give NaN, the same as df.rolling(window).apply().
+    :param df: a pandas DataFrame or Series.
+    :param window: the rolling window.
+    :param kernel: a function mapping the (windows, window, assets) view to a (windows, assets) array;
+                   with strided=False it maps the (dates, assets) array and the window instead.
+    :param strided: whether the kernel works on the strided window view.
+    :return: a pandas DataFrame or Series with the kernel values.
+    """
+    values = as_panel(df)
+    out = np.full(values.shape, np.nan)
+    if 0 < window <= values.shape[0]:
+        with np.errstate(invalid='ignore'):
+            result = kernel(rolling_window(values, window)) if strided else kernel(values, window)
+        result[rolling_count(~np.isfinite(values), window) > 0] = np.nan
+        out[window - 1:] = result
+    return like_input(df, out)
+
+def pair_window_kernel(x, y, window, kernel):
+    """
+    Apply a kernel to every full trailing window of two aligned inputs.
+    Windows where either input has NaN or inf give NaN, the same as x.rolling(window).corr(y).
+    :param x, y: pandas DataFrames (or Series); they are aligned on their labels first.
+    :param window: the rolling window.
+    :param kernel: a function mapping the two (windows, window, assets) views to a (windows, assets) array.
+    :return: a pandas DataFrame or Series with the kernel values.
+    """
+    if isinstance(x, type(y)) or isinstance(y, type(x)):
+        x, y = x.align(y)
+    values_x, values_y = np.broadcast_arrays(as_panel(x), as_panel(y))
+    out = np.full(values_x.shape, np.nan)
+    if 0 < window <= values_x.shape[0]:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = kernel(rolling_window(values_x, window), rolling_window(values_y, window))
+        result[rolling_count(~(np.isfinite(values_x) & np.isfinite(values_y)), window) > 0] = np.nan
+        out[window - 1:] = result
+    return like_input(y if isinstance(y, pd.DataFrame) and not isinstance(x, pd.DataFrame) else x, out)
+
+def window_sum(windows):
+    """
+    Kernel: sum of every window, adding its values one by one from the oldest to the newest.
+    Unlike the running sum of df.rolling(window).sum(), which carries rounding from every earlier row,
+    the result of a window depends only on its own values, so recomputing a tail gives the same bits.
+    O(n * window), the loop runs over the window and is vectorised over all dates and assets.
+    """
+    total = windows[:, 0, :].copy()
+    for k in range(1, windows.shape[1]):
+        total += windows[:, k, :]
+    return total
+
+def window_mean(windows):
+    """
+    Kernel: mean of every window, the first value plus the mean of the values shifted by it,
+    so a constant window gives exactly its value.
+    """
+    first = windows[:, 0, :]
+    total = np.zeros(first.shape)
+    for k in range(1, windows.shape[1]):
+        total += windows[:, k, :] - first
+    return first + total / windows.shape[1]
+
+def window_comoment(windows_x, windows_y):
+    """
+    Kernel: sum of (x - mean(x)) * (y - mean(y)) over every window, the second pass after window_mean.
+    A constant window gives exactly 0.
+    """
+    mean_x = window_mean(windows_x)
+    mean_y = mean_x if windows_y is windows_x else window_mean(windows_y)
+    total = np.zeros(mean_x.shape)
+    for k in range(windows_x.shape[1]):
+        total += (windows_x[:, k, :] - mean_x) * (windows_y[:, k, :] - mean_y)
+    return total
+
+def window_correlation(windows_x, windows_y):
+    """
+    Kernel: correlation of every pair of windows, the three co-moments of window_comoment accumulated in one pass.
+    A constant window gives 0 / 0 = NaN.
+    """
+    mean_x, mean_y = window_mean(windows_x), window_mean(windows_y)
+    sxx, syy, sxy = np.zeros(mean_x.shape), np.zeros(mean_x.shape), np.zeros(mean_x.shape)
+    for k in range(windows_x.shape[1]):
+        dx = windows_x[:, k, :] - mean_x
+        dy = windows_y[:, k, :] - mean_y
+        sxx += dx * dx
+        syy += dy * dy
+        sxy += dx * dy
+    return sxy / np.sqrt(sxx * syy)
+
+def window_rank(windows):
+    """
+    Kernel: average rank of the last value in each window, same as rankdata(na)[-1].
+    O(n * window): every value of the window is compared with the last one; no running update exists
+    for a rank, and the comparisons are vectorised over all dates and assets.
+    """
+    last = windows[:, -1:, :]
+    less = (windows < last).sum(axis=1)
+    equal = (windows == last).sum(axis=1)
+    return less + (equal + 1) / 2.0
+
+def window_argmax(values, window):
+    """
+    Kernel: 1-based position of the first maximum in every trailing window, same as np.argmax(window) + 1.
+    O(n * log(window)) by doubling: the argmax of blocks of length 2^k is built from two blocks of length 2^(k-1),
+    and each window is covered by two overlapping blocks; ties keep the earlier position.
+    :param values: a (dates, assets) numpy array.
+    :param window: the rolling window.
+    :return: a (dates - window + 1, assets) numpy array.
+    """
+    n, m = values.shape
+    # best[t] 为从第 t 行开始、长度为 size 的区间内第一个最大值的行号
+    best = np.broadcast_to(np.arange(n)[:, np.newaxis], (n, m))
+    size = 1
+    while size * 2 <= window:
+        left, right = best[:-size], best[size:]
+        best = np.where(np.take_along_axis(values, right, axis=0) > np.take_along_axis(values, left, axis=0), right, left)
+        size *= 2
+    left, right = best[:n - window + 1], best[window - size:window - size + n - window + 1]
+    position = np.where(np.take_along_axis(values, right, axis=0) > np.take_along_axis(values, left, axis=0), right, left)
+    return position - np.arange(n - window + 1)[:, np.newaxis] + 1.0
+
+@memo_operator
 def ts_rank(df, window=10):
     """
     Wrapper function to estimate rolling rank.
@@ -66,25 +419,36 @@ def ts_rank(df, window=10):
     :param window: the rolling window.
     :return: a pandas DataFrame with the time-series rank over the past window days.
     """
-    return df.rolling(window).apply(rolling_rank)
-
-def rolling_prod(na):
-    """
-    Auxiliary function to be used in pd.rolling_apply
-    :param na: numpy array.
-    :return: The product of the values in the array.
-    """
-    return np.prod(na)
+    return window_kernel(df, window, window_rank)
 
+@memo_operator
 def product(df, window=10):
     """
     Wrapper function to estimate rolling product.
+    The product is rebuilt from windowed sums of log|x| plus counts of negative and zero values.
+    The log-sum adds up each window on the strided view (window_sum), so the result depends only on the window,
+    not on the length of the history.
     :param df: a pandas DataFrame.
     :param window: the rolling window.
     :return: a pandas DataFrame with the time-series product over the past 'window' days.
     """
-    return df.rolling(window).apply(rolling_prod)
+    values = as_panel(df)
+    out = np.full(values.shape, np.nan)
+    if 0 < window <= values.shape[0]:
+        magnitude = np.abs(values)
+        valid = np.isfinite(values) & (magnitude > 0)
+        log_sum = window_sum(rolling_window(np.log(np.where(valid, magnitude, 1.0)), window))
+        negative = rolling_count(values < 0, window)
+        zero = rolling_count(values == 0, window)
+        with np.errstate(over='ignore'):
+            result = np.where(negative % 2 == 1, -1.0, 1.0) * np.exp(log_sum)
+        result[zero > 0] = 0.0
+        # 与 pandas rolling 一致，窗口内有 NaN 或 inf 时结果为 NaN
+        result[rolling_count(~np.isfinite(values), window) > 0] = np.nan
+        out[window - 1:] = result
+    return like_input(df, out)
 
+@memo_operator
 def ts_min(df, window=10):
     """
     Wrapper function to estimate rolling min.
@@ -94,6 +458,7 @@ def ts_min(df, window=10):
     """
     return df.rolling(window).min()
 
+@memo_operator
 def ts_max(df, window=10):
     """
     Wrapper function to estimate rolling min.
@@ -103,6 +468,7 @@ def ts_max(df, window=10):
     """
     return df.rolling(window).max()
 
+@memo_operator
 def delta(df, period=1):
     """
     Wrapper function to estimate difference.
@@ -112,6 +478,7 @@ def delta(df, period=1):
     """
     return df.diff(period)
 
+@memo_operator
 def delay(df, period=1):
     """
     Wrapper function to estimate lag.
@@ -121,24 +488,35 @@ def delay(df, period=1):
     """
     return df.shift(period)
 
+@memo_operator
 def rank(df):
     """
     Cross sectional rank
-    :param df: a pandas DataFrame.
-    :return: a pandas DataFrame with rank along columns.
+    :param df: a pandas DataFrame (date x asset panel) or a single asset's Series.
+    :return: a pandas DataFrame with rank along columns; a Series keeps the time-series rank.
     """
-    #return df.rank(axis=1, pct=True)
+    if isinstance(df, pd.DataFrame):
+        return df.rank(axis=1, pct=True)
     return df.rank(pct=True)
 
+@memo_operator
 def scale(df, k=1):
     """
     Scaling time serie.
-    :param df: a pandas DataFrame.
+    :param df: a pandas DataFrame (date x asset panel) or a single asset's Series.
     :param k: scaling 选股类.
-    :return: a pandas DataFrame rescaled df such that sum(abs(df)) = k
+    :return: a pandas DataFrame rescaled df such that sum(abs(df)) = k on each date
     """
+    if isinstance(df, pd.DataFrame):
+        # 每行的绝对值之和逐列累加（跳过 NaN），与 sum(axis=1) 相同，但结果只依赖该行，不随面板的行数变化
+        magnitude = np.abs(as_panel(df))
+        total = np.zeros(magnitude.shape[0])
+        for column in np.where(np.isnan(magnitude), 0.0, magnitude).T:
+            total += column
+        return df.mul(k).div(total, axis=0)
     return df.mul(k).div(np.abs(df).sum())
 
+@memo_operator
 def ts_argmax(df, window=10):
     """
     Wrapper function to estimate which day ts_max(df, window) occurred on
@@ -146,8 +524,9 @@ def ts_argmax(df, window=10):
     :param window: the rolling window.
     :return: well.. that :)
     """
-    return df.rolling(window).apply(np.argmax) + 1 
+    return window_kernel(df, window, window_argmax, strided=False)
 
+@memo_operator
 def ts_argmin(df, window=10):
     """
     Wrapper function to estimate which day ts_min(df, window) occurred on
@@ -155,32 +534,28 @@ def ts_argmin(df, window=10):
     :param window: the rolling window.
     :return: well.. that :)
     """
-    return df.rolling(window).apply(np.argmin) + 1
+    # 第一个最小值即取负后的第一个最大值
+    return window_kernel(df, window, lambda values, window: window_argmax(-values, window), strided=False)
 
+@memo_operator
 def decay_linear(df, period=10):
     """
     Linear weighted moving average implementation.
-    :param df: a pandas DataFrame.
+    :param df: a pandas DataFrame (date x asset panel) or Series.
     :param period: the LWMA period
-    :return: a pandas DataFrame with the LWMA.
+    :return: a pandas DataFrame (or Series) with the LWMA and the same labels as df.
     """
-    # Clean data
-    if df.isnull().values.any():
-        df.fillna(method='ffill', inplace=True)
-        df.fillna(method='bfill', inplace=True)
-        df.fillna(value=0, inplace=True)
-    na_lwma = np.zeros_like(df)
-    na_lwma[:period, :] = df.iloc[:period, :] 
-    na_series = df.as_matrix()
+    # Clean data, the input is left untouched
+    values = as_panel(df.ffill().bfill().fillna(value=0))
+    na_lwma = values.copy()
 
     divisor = period * (period + 1) / 2
     y = (np.arange(period) + 1) * 1.0 / divisor
     # Estimate the actual lwma with the actual close.
     # The backtest engine should assure to be snooping bias free.
-    for row in range(period - 1, df.shape[0]):
-        x = na_series[row - period + 1: row + 1, :]
-        na_lwma[row, :] = (np.dot(x.T, y))
-    return pd.DataFrame(na_lwma, index=df.index, columns=['CLOSE'])  
+    if period <= values.shape[0]:
+        na_lwma[period - 1:] = np.einsum('iwm,w->im', rolling_window(values, period), y)
+    return like_input(df, na_lwma)
 # endregion
 
 def get_alpha(df):
@@ -270,7 +645,9 @@ def get_alpha(df):
         return df
 
 class Alphas(object):
-    def __init__(self, df_data):
+    def __init__(self, df_data, cache_bytes=512 * 1024 ** 2):
+        # 算子结果缓存，同一实例的各个 alpha 共享公共子表达式；cache_bytes 为缓存内存上限（字节），0 表示不缓存
+        self.cache = OperatorCache(cache_bytes)
 
         self.open = df_data['S_DQ_OPEN'] 
         self.high = df_data['S_DQ_HIGH'] 
@@ -279,11 +656,38 @@ class Alphas(object):
         self.volume = df_data['S_DQ_VOLUME']*100 
         self.returns = df_data['S_DQ_PCTCHANGE'] 
         self.vwap = (df_data['S_DQ_AMOUNT']*1000)/(df_data['S_DQ_VOLUME']*100+1) 
+
+    @classmethod
+    def from_panel(cls, open=None, high=None, low=None, close=None, volume=None, vwap=None, returns=None, amount=None, cache_bytes=512 * 1024 ** 2):
+        """
+        面板模式：直接使用 日期 x 资产 的矩阵构造 Alphas，每个 alpha 在整个面板上只计算一次
+        rank、scale 按行做截面计算，ts_* 算子按列做时序计算
+        :param open, high, low, close, volume, vwap, returns, DataFrame: 日期 x 资产 的矩阵，未提供的字段为 None；
+                                                                         volume 不再做单位换算
+        :param amount, DataFrame: 成交额，未给出 vwap 时按 amount / volume 计算 vwap，两者单位需一致
+        :param cache_bytes, int: 算子结果缓存的内存上限（字节），0 表示不缓存
+        :return: Alphas 实例
+        """
+        alphas = cls.__new__(cls)
+        alphas.cache = OperatorCache(cache_bytes)
+        # 所有矩阵对齐到收盘价的日期和资产
+        align = lambda tb: None if tb is None else tb.reindex(index=close.index, columns=close.columns)
+        alphas.open = align(open)
+        alphas.high = align(high)
+        alphas.low = align(low)
+        alphas.close = close
+        alphas.volume = align(volume)
+        # 不向前填充缺失的收盘价，收益率只依赖当天和前一天，增量计算时历史长度可以确定
+        alphas.returns = close.pct_change(fill_method=None) if returns is None else align(returns)
+        alphas.vwap = align(vwap)
+        if alphas.vwap is None and amount is not None and volume is not None:
+            alphas.vwap = align(amount) / alphas.volume
+        return alphas
         
     # Alpha#1	 (rank(Ts_ArgMax(SignedPower(((returns < 0) ? stddev(returns, 20) : close), 2.), 5)) -0.5)
     def alpha001(self):
-        inner = self.close
-        inner[self.returns < 0] = stddev(self.returns, 20)
+        # 不修改 self.close，其它 alpha 还要使用原始收盘价
+        inner = self.close.mask(self.returns < 0, stddev(self.returns, 20))
         return rank(ts_argmax(inner ** 2, 5))
     
     # Alpha#2	 (-1 * correlation(rank(delta(log(volume), 2)), rank(((close - open) / open)), 6))
@@ -396,10 +800,11 @@ class Alphas(object):
     def alpha021(self):
         cond_1 = sma(self.close, 8) + stddev(self.close, 8) < sma(self.close, 2)
         cond_2 = sma(self.volume, 20) / self.volume < 1
-        alpha = pd.DataFrame(np.ones_like(self.close), index=self.close.index
-                             )
-#        alpha = pd.DataFrame(np.ones_like(self.close), index=self.close.index,
-#                             columns=self.close.columns)
+        if isinstance(self.close, pd.DataFrame):
+            alpha = pd.DataFrame(np.ones_like(self.close), index=self.close.index,
+                                 columns=self.close.columns)
+        else:
+            alpha = pd.Series(np.ones_like(self.close), index=self.close.index)
         alpha[cond_1 | cond_2] = -1
         return alpha
     
@@ -412,9 +817,7 @@ class Alphas(object):
     # Alpha#23	 (((sum(high, 20) / 20) < high) ? (-1 * delta(high, 2)) : 0)
     def alpha023(self):
         cond = sma(self.high, 20) < self.high
-        alpha = pd.DataFrame(np.zeros_like(self.close),index=self.close.index,columns=['close'])
-        alpha.at[cond,'close'] = -1 * delta(self.high, 2).fillna(value=0)
-        return alpha
+        return (-1 * delta(self.high, 2).fillna(value=0)).where(cond, 0)
     
     # Alpha#24	 ((((delta((sum(close, 100) / 100), 100) / delay(close, 100)) < 0.05) ||((delta((sum(close, 100) / 100), 100) / delay(close, 100)) == 0.05)) ? (-1 * (close - ts_min(close,100))) : (-1 * delta(close, 3)))
     def alpha024(self):
@@ -435,12 +838,10 @@ class Alphas(object):
         return -1 * ts_max(df, 3)
     
     # Alpha#27	 ((0.5 < rank((sum(correlation(rank(volume), rank(vwap), 6), 2) / 2.0))) ? (-1 * 1) : 1)
-    #可能存在问题，我自己的数据测试了很多次值全为1，可能需要调整6,2这些参数？
     def alpha027(self):
-        alpha = rank((sma(correlation(rank(self.volume), rank(self.vwap), 6), 2) / 2.0))
-        alpha[alpha > 0.5] = -1
-        alpha[alpha <= 0.5]=1
-        return alpha  
+        # 条件都基于原始 rank 判断，并且不原地修改（rank 结果可能来自算子缓存）；原写法先置 -1 再判断 <=0.5，导致值全为 1
+        inner = rank((sma(correlation(rank(self.volume), rank(self.vwap), 6), 2) / 2.0))
+        return inner.mask(inner > 0.5, -1).mask(inner <= 0.5, 1)
     
     # Alpha#28	 scale(((correlation(adv20, low, 5) + ((high + low) / 2)) - close))
     def alpha028(self):
@@ -464,11 +865,11 @@ class Alphas(object):
     def alpha031(self):
         adv20 = sma(self.volume, 20)
         df = correlation(adv20, self.low, 12).replace([-np.inf, np.inf], 0).fillna(value=0)         
-        p1=rank(rank(rank(decay_linear((-1 * rank(rank(delta(self.close, 10)))).to_frame(), 10)))) 
+        p1=rank(rank(rank(decay_linear((-1 * rank(rank(delta(self.close, 10)))), 10)))) 
         p2=rank((-1 * delta(self.close, 3)))
         p3=sign(scale(df))
         
-        return p1.CLOSE+p2+p3
+        return p1+p2+p3
 
     # Alpha#32	 (scale(((sum(close, 7) / 7) - close)) + (20 * scale(correlation(vwap, delay(close, 5),230))))
     def alpha032(self):
@@ -508,7 +909,7 @@ class Alphas(object):
     # Alpha#39	 ((-1 * rank((delta(close, 7) * (1 - rank(decay_linear((volume / adv20), 9)))))) * (1 +rank(sum(returns, 250))))
     def alpha039(self):
         adv20 = sma(self.volume, 20)
-        return ((-1 * rank(delta(self.close, 7) * (1 - rank(decay_linear((self.volume / adv20).to_frame(), 9).CLOSE)))) *
+        return ((-1 * rank(delta(self.close, 7) * (1 - rank(decay_linear((self.volume / adv20), 9))))) *
                 (1 + rank(sma(self.returns, 250))))
     
     # Alpha#40	 ((-1 * rank(stddev(high, 10))) * correlation(high, volume, 10))
@@ -604,7 +1005,7 @@ class Alphas(object):
     
     # Alpha#57	 (0 - (1 * ((close - vwap) / decay_linear(rank(ts_argmax(close, 30)), 2))))
     def alpha057(self):
-        return (0 - (1 * ((self.close - self.vwap) / decay_linear(rank(ts_argmax(self.close, 30)).to_frame(), 2).CLOSE)))
+        return (0 - (1 * ((self.close - self.vwap) / decay_linear(rank(ts_argmax(self.close, 30)), 2))))
     
     # Alpha#58	 (-1 * Ts_Rank(decay_linear(correlation(IndNeutralize(vwap, IndClass.sector), volume,3.92795), 7.89291), 5.50322))
      
@@ -642,7 +1043,7 @@ class Alphas(object):
       
     # Alpha#66	 ((rank(decay_linear(delta(vwap, 3.51013), 7.23052)) + Ts_Rank(decay_linear(((((low* 0.96633) + (low * (1 - 0.96633))) - vwap) / (open - ((high + low) / 2))), 11.4157), 6.72611)) * -1)
     def alpha066(self):
-        return ((rank(decay_linear(delta(self.vwap, 4).to_frame(), 7).CLOSE) + ts_rank(decay_linear(((((self.low* 0.96633) + (self.low * (1 - 0.96633))) - self.vwap) / (self.open - ((self.high + self.low) / 2))).to_frame(), 11).CLOSE, 7)) * -1)
+        return ((rank(decay_linear(delta(self.vwap, 4), 7)) + ts_rank(decay_linear(((((self.low* 0.96633) + (self.low * (1 - 0.96633))) - self.vwap) / (self.open - ((self.high + self.low) / 2))), 11), 7)) * -1)
     
     # Alpha#67	 ((rank((high - ts_min(high, 2.14593)))^rank(correlation(IndNeutralize(vwap,IndClass.sector), IndNeutralize(adv20, IndClass.subindustry), 6.02936))) * -1)
      
@@ -660,28 +1061,22 @@ class Alphas(object):
     # Alpha#71	 max(Ts_Rank(decay_linear(correlation(Ts_Rank(close, 3.43976), Ts_Rank(adv180,12.0647), 18.0175), 4.20501), 15.6948), Ts_Rank(decay_linear((rank(((low + open) - (vwap +vwap)))^2), 16.4662), 4.4388))
     def alpha071(self):
         adv180 = sma(self.volume, 180)
-        p1=ts_rank(decay_linear(correlation(ts_rank(self.close, 3), ts_rank(adv180,12), 18).to_frame(), 4).CLOSE, 16)
-        p2=ts_rank(decay_linear((rank(((self.low + self.open) - (self.vwap +self.vwap))).pow(2)).to_frame(), 16).CLOSE, 4)
-        df=pd.DataFrame({'p1':p1,'p2':p2})
-        df.at[df['p1']>=df['p2'],'max']=df['p1']
-        df.at[df['p2']>=df['p1'],'max']=df['p2']
-        return df['max']
-        #return max(ts_rank(decay_linear(correlation(ts_rank(self.close, 3), ts_rank(adv180,12), 18).to_frame(), 4).CLOSE, 16), ts_rank(decay_linear((rank(((self.low + self.open) - (self.vwap +self.vwap))).pow(2)).to_frame(), 16).CLOSE, 4))
+        p1=ts_rank(decay_linear(correlation(ts_rank(self.close, 3), ts_rank(adv180,12), 18), 4), 16)
+        p2=ts_rank(decay_linear((rank(((self.low + self.open) - (self.vwap +self.vwap))).pow(2)), 16), 4)
+        return np.maximum(p1, p2)
+        #return max(ts_rank(decay_linear(correlation(ts_rank(self.close, 3), ts_rank(adv180,12), 18), 4), 16), ts_rank(decay_linear((rank(((self.low + self.open) - (self.vwap +self.vwap))).pow(2)), 16), 4))
     
     # Alpha#72	 (rank(decay_linear(correlation(((high + low) / 2), adv40, 8.93345), 10.1519)) /rank(decay_linear(correlation(Ts_Rank(vwap, 3.72469), Ts_Rank(volume, 18.5188), 6.86671),2.95011)))
     def alpha072(self):
         adv40 = sma(self.volume, 40)
-        return (rank(decay_linear(correlation(((self.high + self.low) / 2), adv40, 9).to_frame(), 10).CLOSE) /rank(decay_linear(correlation(ts_rank(self.vwap, 4), ts_rank(self.volume, 19), 7).to_frame(),3).CLOSE))
+        return (rank(decay_linear(correlation(((self.high + self.low) / 2), adv40, 9), 10)) /rank(decay_linear(correlation(ts_rank(self.vwap, 4), ts_rank(self.volume, 19), 7),3)))
     
     # Alpha#73	 (max(rank(decay_linear(delta(vwap, 4.72775), 2.91864)),Ts_Rank(decay_linear(((delta(((open * 0.147155) + (low * (1 - 0.147155))), 2.03608) / ((open *0.147155) + (low * (1 - 0.147155)))) * -1), 3.33829), 16.7411)) * -1)
     def alpha073(self):
-        p1=rank(decay_linear(delta(self.vwap, 5).to_frame(), 3).CLOSE)
-        p2=ts_rank(decay_linear(((delta(((self.open * 0.147155) + (self.low * (1 - 0.147155))), 2) / ((self.open *0.147155) + (self.low * (1 - 0.147155)))) * -1).to_frame(), 3).CLOSE, 17)
-        df=pd.DataFrame({'p1':p1,'p2':p2})
-        df.at[df['p1']>=df['p2'],'max']=df['p1']
-        df.at[df['p2']>=df['p1'],'max']=df['p2']
-        return -1*df['max']
-        #return (max(rank(decay_linear(delta(self.vwap, 5).to_frame(), 3).CLOSE),ts_rank(decay_linear(((delta(((self.open * 0.147155) + (self.low * (1 - 0.147155))), 2) / ((self.open *0.147155) + (self.low * (1 - 0.147155)))) * -1).to_frame(), 3).CLOSE, 17)) * -1)
+        p1=rank(decay_linear(delta(self.vwap, 5), 3))
+        p2=ts_rank(decay_linear(((delta(((self.open * 0.147155) + (self.low * (1 - 0.147155))), 2) / ((self.open *0.147155) + (self.low * (1 - 0.147155)))) * -1), 3), 17)
+        return -1*np.maximum(p1, p2)
+        #return (max(rank(decay_linear(delta(self.vwap, 5), 3)),ts_rank(decay_linear(((delta(((self.open * 0.147155) + (self.low * (1 - 0.147155))), 2) / ((self.open *0.147155) + (self.low * (1 - 0.147155)))) * -1), 3), 17)) * -1)
     
     # Alpha#74	 ((rank(correlation(close, sum(adv30, 37.4843), 15.1365)) <rank(correlation(rank(((high * 0.0261661) + (vwap * (1 - 0.0261661)))), rank(volume), 11.4791)))* -1)
     def alpha074(self):
@@ -699,13 +1094,10 @@ class Alphas(object):
     # Alpha#77	 min(rank(decay_linear(((((high + low) / 2) + high) - (vwap + high)), 20.0451)),rank(decay_linear(correlation(((high + low) / 2), adv40, 3.1614), 5.64125)))
     def alpha077(self):
         adv40 = sma(self.volume, 40)
-        p1=rank(decay_linear(((((self.high + self.low) / 2) + self.high) - (self.vwap + self.high)).to_frame(), 20).CLOSE)
-        p2=rank(decay_linear(correlation(((self.high + self.low) / 2), adv40, 3).to_frame(), 6).CLOSE)
-        df=pd.DataFrame({'p1':p1,'p2':p2})
-        df.at[df['p1']>=df['p2'],'min']=df['p2']
-        df.at[df['p2']>=df['p1'],'min']=df['p1']
-        return df['min']
-        #return min(rank(decay_linear(((((self.high + self.low) / 2) + self.high) - (self.vwap + self.high)).to_frame(), 20).CLOSE),rank(decay_linear(correlation(((self.high + self.low) / 2), adv40, 3).to_frame(), 6).CLOSE))
+        p1=rank(decay_linear(((((self.high + self.low) / 2) + self.high) - (self.vwap + self.high)), 20))
+        p2=rank(decay_linear(correlation(((self.high + self.low) / 2), adv40, 3), 6))
+        return np.minimum(p1, p2)
+        #return min(rank(decay_linear(((((self.high + self.low) / 2) + self.high) - (self.vwap + self.high)), 20)),rank(decay_linear(correlation(((self.high + self.low) / 2), adv40, 3), 6)))
     
     # Alpha#78	 (rank(correlation(sum(((low * 0.352233) + (vwap * (1 - 0.352233))), 19.7428),sum(adv40, 19.7428), 6.83313))^rank(correlation(rank(vwap), rank(volume), 5.77492)))
     def alpha078(self):
@@ -750,13 +1142,10 @@ class Alphas(object):
     # Alpha#88	 min(rank(decay_linear(((rank(open) + rank(low)) - (rank(high) + rank(close))),8.06882)), Ts_Rank(decay_linear(correlation(Ts_Rank(close, 8.44728), Ts_Rank(adv60,20.6966), 8.01266), 6.65053), 2.61957))
     def alpha088(self):
         adv60 = sma(self.volume, 60)
-        p1=rank(decay_linear(((rank(self.open) + rank(self.low)) - (rank(self.high) + rank(self.close))).to_frame(),8).CLOSE)
-        p2=ts_rank(decay_linear(correlation(ts_rank(self.close, 8), ts_rank(adv60,21), 8).to_frame(), 7).CLOSE, 3)
-        df=pd.DataFrame({'p1':p1,'p2':p2})
-        df.at[df['p1']>=df['p2'],'min']=df['p2']
-        df.at[df['p2']>=df['p1'],'min']=df['p1']
-        return df['min']
-        #return min(rank(decay_linear(((rank(self.open) + rank(self.low)) - (rank(self.high) + rank(self.close))).to_frame(),8).CLOSE), ts_rank(decay_linear(correlation(ts_rank(self.close, 8), ts_rank(adv60,20.6966), 8).to_frame(), 7).CLOSE, 3))
+        p1=rank(decay_linear(((rank(self.open) + rank(self.low)) - (rank(self.high) + rank(self.close))),8))
+        p2=ts_rank(decay_linear(correlation(ts_rank(self.close, 8), ts_rank(adv60,21), 8), 7), 3)
+        return np.minimum(p1, p2)
+        #return min(rank(decay_linear(((rank(self.open) + rank(self.low)) - (rank(self.high) + rank(self.close))),8)), ts_rank(decay_linear(correlation(ts_rank(self.close, 8), ts_rank(adv60,20.6966), 8), 7), 3))
     
     # Alpha#89	 (Ts_Rank(decay_linear(correlation(((low * 0.967285) + (low * (1 - 0.967285))), adv10,6.94279), 5.51607), 3.79744) - Ts_Rank(decay_linear(delta(IndNeutralize(vwap,IndClass.industry), 3.48158), 10.1466), 15.3012))
      
@@ -768,13 +1157,10 @@ class Alphas(object):
     # Alpha#92	 min(Ts_Rank(decay_linear(((((high + low) / 2) + close) < (low + open)), 14.7221),18.8683), Ts_Rank(decay_linear(correlation(rank(low), rank(adv30), 7.58555), 6.94024),6.80584))
     def alpha092(self):
         adv30 = sma(self.volume, 30)
-        p1=ts_rank(decay_linear(((((self.high + self.low) / 2) + self.close) < (self.low + self.open)).to_frame(), 15).CLOSE,19)
-        p2=ts_rank(decay_linear(correlation(rank(self.low), rank(adv30), 8).to_frame(), 7).CLOSE,7)
-        df=pd.DataFrame({'p1':p1,'p2':p2})
-        df.at[df['p1']>=df['p2'],'min']=df['p2']
-        df.at[df['p2']>=df['p1'],'min']=df['p1']
-        return df['min']
-        #return  min(ts_rank(decay_linear(((((self.high + self.low) / 2) + self.close) < (self.low + self.open)).to_frame(), 15).CLOSE,19), ts_rank(decay_linear(correlation(rank(self.low), rank(adv30), 8).to_frame(), 7).CLOSE,7))
+        p1=ts_rank(decay_linear(((((self.high + self.low) / 2) + self.close) < (self.low + self.open)), 15),19)
+        p2=ts_rank(decay_linear(correlation(rank(self.low), rank(adv30), 8), 7),7)
+        return np.minimum(p1, p2)
+        #return  min(ts_rank(decay_linear(((((self.high + self.low) / 2) + self.close) < (self.low + self.open)), 15),19), ts_rank(decay_linear(correlation(rank(self.low), rank(adv30), 8), 7),7))
     
     # Alpha#93	 (Ts_Rank(decay_linear(correlation(IndNeutralize(vwap, IndClass.industry), adv81,17.4193), 19.848), 7.54455) / rank(decay_linear(delta(((close * 0.524434) + (vwap * (1 -0.524434))), 2.77377), 16.2664)))
      
@@ -792,13 +1178,10 @@ class Alphas(object):
     # Alpha#96	 (max(Ts_Rank(decay_linear(correlation(rank(vwap), rank(volume), 3.83878),4.16783), 8.38151), Ts_Rank(decay_linear(Ts_ArgMax(correlation(Ts_Rank(close, 7.45404),Ts_Rank(adv60, 4.13242), 3.65459), 12.6556), 14.0365), 13.4143)) * -1)
     def alpha096(self):
         adv60 = sma(self.volume, 60)
-        p1=ts_rank(decay_linear(correlation(rank(self.vwap), rank(self.volume).to_frame(), 4),4).CLOSE, 8)
-        p2=ts_rank(decay_linear(ts_argmax(correlation(ts_rank(self.close, 7),ts_rank(adv60, 4), 4), 13).to_frame(), 14).CLOSE, 13)
-        df=pd.DataFrame({'p1':p1,'p2':p2})
-        df.at[df['p1']>=df['p2'],'max']=df['p1']
-        df.at[df['p2']>=df['p1'],'max']=df['p2']
-        return -1*df['max']
-        #return (max(ts_rank(decay_linear(correlation(rank(self.vwap), rank(self.volume).to_frame(), 4),4).CLOSE, 8), ts_rank(decay_linear(ts_argmax(correlation(ts_rank(self.close, 7),ts_rank(adv60, 4), 4), 13).to_frame(), 14).CLOSE, 13)) * -1)
+        p1=ts_rank(decay_linear(correlation(rank(self.vwap), rank(self.volume), 4),4), 8)
+        p2=ts_rank(decay_linear(ts_argmax(correlation(ts_rank(self.close, 7),ts_rank(adv60, 4), 4), 13), 14), 13)
+        return -1*np.maximum(p1, p2)
+        #return (max(ts_rank(decay_linear(correlation(rank(self.vwap), rank(self.volume), 4),4), 8), ts_rank(decay_linear(ts_argmax(correlation(ts_rank(self.close, 7),ts_rank(adv60, 4), 4), 13), 14), 13)) * -1)
     
     # Alpha#97	 ((rank(decay_linear(delta(IndNeutralize(((low * 0.721001) + (vwap * (1 - 0.721001))),IndClass.industry), 3.3705), 20.4523)) - Ts_Rank(decay_linear(Ts_Rank(correlation(Ts_Rank(low,7.87871), Ts_Rank(adv60, 17.255), 4.97547), 18.5925), 15.7152), 6.71659)) * -1)
      
@@ -807,7 +1190,7 @@ class Alphas(object):
     def alpha098(self):
         adv5 = sma(self.volume, 5)
         adv15 = sma(self.volume, 15)
-        return (rank(decay_linear(correlation(self.vwap, sma(adv5, 26), 5).to_frame(), 7).CLOSE) -rank(decay_linear(ts_rank(ts_argmin(correlation(rank(self.open), rank(adv15), 21), 9),7).to_frame(), 8).CLOSE))
+        return (rank(decay_linear(correlation(self.vwap, sma(adv5, 26), 5), 7)) -rank(decay_linear(ts_rank(ts_argmin(correlation(rank(self.open), rank(adv15), 21), 9),7), 8)))
     
     # Alpha#99	 ((rank(correlation(sum(((high + low) / 2), 19.8975), sum(adv60, 19.8975), 8.8136)) <rank(correlation(low, volume, 6.28259))) * -1)
     def alpha099(self):
@@ -820,5 +1203,33 @@ class Alphas(object):
     # Alpha#101	 ((close - open) / ((high - low) + .001))
     def alpha101(self):
         return (self.close - self.open) /((self.high - self.low) + 0.001)
-     
-     
\ No newline at end of file
+
+# 所有 alpha 方法执行期间启用实例的算子缓存
+for name in [name for name in vars(Alphas) if name.startswith('alpha')]:
+    setattr(Alphas, name, with_operator_cache(getattr(Alphas, name)))
+
+def alpha_lookback(function_names, panel=True, returns_lookback=1):
+    """
+    根据算子窗口推算 alpha 方法需要的历史长度，与 alpha_expression.formula_lookback 对公式因子的推算一致：
+    某一行的结果只依赖该行及之前 lookback 行的输入；各行情字段记为 0，returns 记为 returns_lookback
+    方法中出现无法追溯的写法或没有上限的算子（如 decay_linear）时为 None
+    :param function_names, list: alpha 方法名，如 ['alpha001', 'alpha002']
+    :param panel, bool: 是否为面板模式；非面板模式下 rank、scale 按整段时序计算，没有上限
+    :param returns_lookback, int or None: returns 的历史长度，按收盘价 pct_change(fill_method=None) 计算时为 1，直接提供时为 0，
+                                          向前填充缺失值时为 None
+    :return: lookbacks, dict: {方法名: 需要的历史行数，None 表示依赖全部历史}
+    """
+    alphas = Alphas.__new__(Alphas)
+    alphas.cache = OperatorCache(0)
+    for field in ['open', 'high', 'low', 'close', 'volume', 'vwap']:
+        setattr(alphas, field, LookbackTrace(0, panel))
+    alphas.returns = LookbackTrace(returns_lookback, panel)
+    lookbacks = {}
+    for function_name in function_names:
+        try:
+            result = getattr(alphas, function_name)()
+        except (TypeError, AttributeError, ValueError, KeyError):
+            # 无法追溯的写法，按依赖全部历史处理
+            result = None
+        lookbacks[function_name] = result.lookback if isinstance(result, LookbackTrace) else None
+    return lookbacks
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+# 主要功能：解析 WorldQuant Alpha101 风格的公式字符串，合并成一张去重后的计算图（DAG），按拓扑顺序在整个 日期 x 资产 面板上计算
+# 用法：compute_formulas({"alpha_x": "(-1 * correlation(rank(open), rank(volume), 10))"}, {"open": open_tb, "volume": volume_tb})
+import re
+import numpy as np
+import pandas as pd
+from Alpha_code_101 import (ts_sum, sma, stddev, correlation, covariance, ts_rank, product, ts_min, ts_max,
+                            delta, delay, rank, scale, ts_argmax, ts_argmin, decay_linear, as_panel, like_input)
+
+# region 词法分析
+TOKEN_PATTERN = re.compile(r'\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)|([A-Za-z_][A-Za-z_0-9.]*)|(\|\||&&|<=|>=|==|!=|[-+*/^<>?:,()]))')
+
+def tokenize(text):
+    """
+    将公式字符串切分为记号
+    :param text, str: 公式字符串
+    :return: tokens, list: (类型, 值) 列表，类型为 'number'、'name'、'op'，末尾为 ('end', None)
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"无法识别的字符：{text[position:position + 10]!r}（位置 {position}）")
+        number, name, op = match.groups()
+        if number is not None:
+            tokens.append(('number', float(number)))
+        elif name is not None:
+            tokens.append(('name', name))
+        else:
+            tokens.append(('op', op))
+        position = match.end()
+    tokens.append(('end', None))
+    return tokens
+# endregion
+
+# region 语法分析（Pratt 解析）
+# 二元运算符的左结合力，数值越大优先级越高；'?' 为三元条件运算符
+BINDING_POWER = {
+    '?': 10,
+    '||': 20,
+    '&&': 30,
+    '<': 40, '>': 40, '<=': 40, '>=': 40, '==': 40, '!=': 40,
+    '+': 50, '-': 50,
+    '*': 60, '/': 60,
+    '^': 70,
+}
+# 一元负号的结合力：低于 '^'、高于 '*'，-x^2 解析为 -(x^2)
+PREFIX_POWER = 65
+
+class FormulaParser(object):
+    """
+    将记号解析为语法树，树节点为元组：
+    ('number', 值)、('name', 变量名)、('call', 函数名, (参数, ...))、('neg', 子节点)、
+    ('binary', 运算符, 左, 右)、('cond', 条件, 真值, 假值)
+    """
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position]
+
+    def advance(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def expect(self, op):
+        token = self.advance()
+        if token != ('op', op):
+            raise ValueError(f"公式 {self.text!r} 中缺少 {op!r}，遇到 {token[1]!r}")
+        return token
+
+    def parse(self):
+        tree = self.expression(0)
+        if self.peek()[0] != 'end':
+            raise ValueError(f"公式 {self.text!r} 中有多余的内容：{self.peek()[1]!r}")
+        return tree
+
+    def expression(self, min_power):
+        left = self.prefix()
+        while True:
+            kind, op = self.peek()
+            if kind != 'op' or op not in BINDING_POWER or BINDING_POWER[op] <= min_power:
+                return left
+            self.advance()
+            if op == '?':
+                # 三元条件运算符右结合：a ? b : c ? d : e 解析为 a ? b : (c ? d : e)
+                when_true = self.expression(0)
+                self.expect(':')
+                when_false = self.expression(BINDING_POWER['?'] - 1)
+                left = ('cond', left, when_true, when_false)
+            elif op == '^':
+                # 幂运算右结合
+                left = ('binary', op, left, self.expression(BINDING_POWER[op] - 1))
+            else:
+                left = ('binary', op, left, self.expression(BINDING_POWER[op]))
+
+    def prefix(self):
+        kind, value = self.advance()
+        if kind == 'number':
+            return ('number', value)
+        if kind == 'op' and value == '(':
+            tree = self.expression(0)
+            self.expect(')')
+            return tree
+        if kind == 'op' and value in ('-', '+'):
+            operand = self.expression(PREFIX_POWER)
+            return ('neg', operand) if value == '-' else operand
+        if kind == 'name':
+            if self.peek() == ('op', '('):
+                self.advance()
+                args = []
+                if self.peek() != ('op', ')'):
+                    args.append(self.expression(0))
+                    while self.peek() == ('op', ','):
+                        self.advance()
+                        args.append(self.expression(0))
+                self.expect(')')
+                return ('call', value.lower(), tuple(args))
+            return ('name', value.lower())
+        raise ValueError(f"公式 {self.text!r} 中出现意外的记号：{value!r}")
+
+def parse(text):
+    """
+    解析单个公式
+    :param text, str: 公式字符串
+    :return: 语法树（嵌套元组）
+    """
+    return FormulaParser(text).parse()
+# endregion
+
+# region 算子
+def window(d):
+    # 公式中的非整数窗口按四舍五入取整，与 Alpha_code_101 中手工翻译的写法一致
+    return max(int(round(d)), 1)
+
+def broadcast(template, values):
+    # 将 numpy 结果按模板表的标签还原为 DataFrame 或 Series
+    return like_input(template, np.array(np.broadcast_to(values, np.shape(template))).reshape(len(template), -1))
+
+def as_float(value):
+    # 比较、逻辑运算结果转为 1.0/0.0，便于继续参与算术运算
+    return value.astype(float) if hasattr(value, 'astype') else float(value)
+
+def is_table(value):
+    return isinstance(value, (pd.DataFrame, pd.Series))
+
+def is_true(value):
+    # 条件取值：非 0 且非 NaN 为真，与 Alphas 方法中 NaN 参与比较结果为 False 一致
+    if is_table(value):
+        values = as_panel(value)
+        return ~np.isnan(values) & (values != 0)
+    return not np.isnan(value) and value != 0
+
+def where(cond, when_true, when_false):
+    """
+    三元条件运算 cond ? when_true : when_false，各参数可以是表或标量
+    """
+    tables = [value for value in (cond, when_true, when_false) if is_table(value)]
+    if not tables:
+        return when_true if cond else when_false
+    template = tables[0]
+    values = np.where(is_true(cond),
+                      as_panel(when_true) if is_table(when_true) else when_true,
+                      as_panel(when_false) if is_table(when_false) else when_false)
+    return broadcast(template, values)
+
+def logical(op, x, y):
+    """
+    逻辑运算 x || y、x && y，NaN 视为假，结果为 1.0/0.0
+    """
+    tables = [value for value in (x, y) if is_table(value)]
+    if not tables:
+        return float(op(is_true(x), is_true(y)))
+    return broadcast(tables[0], op(is_true(x), is_true(y)).astype(float))
+
+def ts_or_elementwise_min(x, y):
+    # min(x, d) 中 d 为常数时是时序最小值，否则为两张表逐元素取小
+    return ts_min(x, window(y)) if np.isscalar(y) else np.minimum(x, y)
+
+def ts_or_elementwise_max(x, y):
+    return ts_max(x, window(y)) if np.isscalar(y) else np.maximum(x, y)
+
+def signedpower(x, a):
+    return np.sign(x) * np.abs(x) ** a
+
+# 函数名（小写）到算子的映射，窗口参数统一取整
+OPERATORS = {
+    'rank': rank,
+    'scale': lambda x, a=1: scale(x, a),
+    'delay': lambda x, d: delay(x, window(d)),
+    'delta': lambda x, d: delta(x, window(d)),
+    'sum': lambda x, d: ts_sum(x, window(d)),
+    'ts_sum': lambda x, d: ts_sum(x, window(d)),
+    'sma': lambda x, d: sma(x, window(d)),
+    'product': lambda x, d: product(x, window(d)),
+    'stddev': lambda x, d: stddev(x, window(d)),
+    'correlation': lambda x, y, d: correlation(x, y, window(d)),
+    'covariance': lambda x, y, d: covariance(x, y, window(d)),
+    'ts_min': lambda x, d: ts_min(x, window(d)),
+    'ts_max': lambda x, d: ts_max(x, window(d)),
+    'ts_argmin': lambda x, d: ts_argmin(x, window(d)),
+    'ts_argmax': lambda x, d: ts_argmax(x, window(d)),
+    'ts_rank': lambda x, d: ts_rank(x, window(d)),
+    'decay_linear': lambda x, d: decay_linear(x, window(d)),
+    'min': ts_or_elementwise_min,
+    'max': ts_or_elementwise_max,
+    'abs': np.abs,
+    'log': np.log,
+    'sign': np.sign,
+    'signedpower': signedpower,
+}
+
+BINARY_OPERATORS = {
+    '+': lambda x, y: x + y,
+    '-': lambda x, y: x - y,
+    '*': lambda x, y: x * y,
+    '/': lambda x, y: x / y,
+    '^': lambda x, y: x ** y,
+    '<': lambda x, y: as_float(x < y),
+    '>': lambda x, y: as_float(x > y),
+    '<=': lambda x, y: as_float(x <= y),
+    '>=': lambda x, y: as_float(x >= y),
+    '==': lambda x, y: as_float(x == y),
+    '!=': lambda x, y: as_float(x != y),
+    '||': lambda x, y: logical(np.logical_or, x, y),
+    '&&': lambda x, y: logical(np.logical_and, x, y),
+}
+# endregion
+
+# region 计算图
+ADV_PATTERN = re.compile(r'adv(\d+)$')
+
+def build_dag(formulas):
+    """
+    将多个公式合并为一张计算图，结构相同的子表达式只保留一个节点
+    :param formulas, dict: {因子名: 公式字符串}
+    :return: nodes, list: 节点列表，每个节点为 (类型, 值, 子节点编号元组)，子节点总在父节点之前，即列表顺序就是拓扑顺序
+             roots, dict: {因子名: 根节点编号}
+    """
+    nodes = []
+    node_ids = {}
+
+    def intern(node):
+        # 节点以 (类型, 值, 子节点编号) 为键去重
+        if node not in node_ids:
+            node_ids[node] = len(nodes)
+            nodes.append(node)
+        return node_ids[node]
+
+    def visit(tree):
+        kind = tree[0]
+        if kind == 'number':
+            return intern(('number', tree[1], ()))
+        if kind == 'name':
+            match = ADV_PATTERN.match(tree[1])
+            if match:
+                # advN：N 日平均成交量
+                return intern(('call', 'sma', (intern(('name', 'volume', ())), intern(('number', float(match.group(1)), ())))))
+            return intern(('name', tree[1], ()))
+        if kind == 'call':
+            if tree[1] == 'indneutralize':
+                raise ValueError("暂不支持 IndNeutralize，需要行业分类数据")
+            if tree[1] not in OPERATORS:
+                raise ValueError(f"未知的算子：{tree[1]}")
+            return intern(('call', tree[1], tuple(visit(arg) for arg in tree[2])))
+        if kind == 'neg':
+            return intern(('neg', None, (visit(tree[1]),)))
+        if kind == 'binary':
+            return intern(('binary', tree[1], (visit(tree[2]), visit(tree[3]))))
+        return intern(('cond', None, (visit(tree[1]), visit(tree[2]), visit(tree[3]))))
+
+    roots = {name: visit(parse(text)) for name, text in formulas.items()}
+    return nodes, roots
+
+def evaluate_dag(nodes, roots, data):
+    """
+    按拓扑顺序计算计算图，中间结果在最后一次被使用后立即释放
+    :param nodes, list: build_dag 返回的节点列表
+    :param roots, dict: {因子名: 根节点编号}
+    :param data, dict: {变量名: 日期 x 资产 的 DataFrame}，如 open、high、low、close、volume、vwap、returns
+    :return: results, dict: {因子名: DataFrame}
+    """
+    data = {name.lower(): value for name, value in data.items()}
+    # 只计算根节点依赖到的节点
+    needed = set(roots.values())
+    for node_id in range(len(nodes) - 1, -1, -1):
+        if node_id in needed:
+            needed.update(nodes[node_id][2])
+    # 每个节点还剩多少个父节点未计算，为 0 时释放
+    consumers = np.zeros(len(nodes), dtype=int)
+    for node_id in needed:
+        for child in nodes[node_id][2]:
+            consumers[child] += 1
+    keep = set(roots.values())
+    values = {}
+    for node_id, (kind, value, children) in enumerate(nodes):
+        if node_id not in needed:
+            continue
+        args = [values[child] for child in children]
+        if kind == 'number':
+            result = value
+        elif kind == 'name':
+            if value not in data:
+                raise KeyError(f"公式中使用了变量 {value}，但没有提供该数据")
+            result = data[value]
+        elif kind == 'call':
+            result = OPERATORS[value](*args)
+        elif kind == 'neg':
+            result = -args[0]
+        elif kind == 'binary':
+            result = BINARY_OPERATORS[value](*args)
+        else:
+            result = where(*args)
+        values[node_id] = result
+        for child in children:
+            consumers[child] -= 1
+            if consumers[child] == 0 and child not in keep:
+                del values[child]
+    template = next(iter(data.values()))
+    return {name: values[node_id] if is_table(values[node_id]) else broadcast(template, values[node_id])
+            for name, node_id in roots.items()}
+
+def compute_formulas(formulas, data):
+    """
+    解析并计算一组公式因子，所有公式共享相同的子表达式
+    :param formulas, dict: {因子名: 公式字符串}
+    :param data, dict: {变量名: 日期 x 资产 的 DataFrame}
+    :return: results, dict: {因子名: DataFrame}
+    """
+    nodes, roots = build_dag(formulas)
+    return evaluate_dag(nodes, roots, data)
+
+# 向过去取 d 期数据的算子：delay、delta 需要 d 期，滚动窗口算子需要 d - 1 期
+SHIFT_OPERATORS = {'delay', 'delta'}
+ROLLING_OPERATORS = {'sum', 'ts_sum', 'sma', 'product', 'stddev', 'correlation', 'covariance', 'ts_min', 'ts_max',
+                     'ts_argmin', 'ts_argmax', 'ts_rank', 'min', 'max'}
+# 历史长度无上限的算子：decay_linear 先对输入 ffill().bfill()，空值会取到任意久之前的数据
+UNBOUNDED_OPERATORS = {'decay_linear'}
+
+def formula_lookback(formulas):
+    """
+    根据计算图结构推算每个公式需要的历史长度：某一行的结果只依赖该行及之前 lookback 行的输入
+    returns 按收益率（pct_change）计，需要 1 期；rank、scale 等截面算子不增加历史长度；包含 decay_linear 的公式没有上限，为 None
+    :param formulas, dict: {因子名: 公式字符串}
+    :return: lookbacks, dict: {因子名: 需要的历史行数，None 表示依赖全部历史}
+    """
+    nodes, roots = build_dag(formulas)
+    lookbacks = []
+    # 节点列表已按拓扑顺序排列，子节点先于父节点计算
+    for kind, value, children in nodes:
+        child_lookbacks = [lookbacks[child] for child in children]
+        if None in child_lookbacks or (kind == 'call' and value in UNBOUNDED_OPERATORS):
+            lookbacks.append(None)
+            continue
+        child_lookback = max(child_lookbacks, default=0)
+        if kind == 'name':
+            lookback = 1 if value == 'returns' else 0
+        elif kind == 'call' and value in SHIFT_OPERATORS:
+            lookback = child_lookback + window(nodes[children[-1]][1])
+        elif kind == 'call' and value in ROLLING_OPERATORS and nodes[children[-1]][0] == 'number':
+            lookback = child_lookback + window(nodes[children[-1]][1]) - 1
+        else:
+            lookback = child_lookback
+        lookbacks.append(lookback)
+    return {name: lookbacks[node_id] for name, node_id in roots.items()}
+# endregion
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# 主要功能：Alpha 因子增量更新。保存上一次的因子面板和输入数据的哈希，新增交易日时只在 历史长度 + 校验行 + 新增行 的尾部数据上重算
+# 每个因子的历史长度由调用方根据算子窗口推算（公式因子见 alpha_expression.formula_lookback，方法因子见 Alpha_code_101.alpha_lookback），
+# 滚动算子逐个窗口计算，结果只依赖窗口内的数据，因此尾部重算的结果与全量重算逐位相同；
+# 有因子的历史长度未知或没有上限、校验行与上一次结果不完全相同、历史数据被修改或资产变化时回退为全量重算
+import os
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+
+def load_state(state_path):
+    """
+    读取上一次增量计算保存的状态
+    :param state_path, str: 状态文件路径
+    :return: state, dict or None: 状态字典，文件不存在时为 None
+    """
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, 'rb') as f:
+        return pickle.load(f)
+
+def history_hash(price_tb, inputs, n_rows):
+    """
+    前 n_rows 行输入数据（含日期、资产标签）的哈希，用来确认全部历史数据没有被修改
+    :param price_tb, DataFrame: 价格面板
+    :param inputs, dict: 其余输入 {字段名: DataFrame}，按价格面板的日期截取
+    :param n_rows, int: 参与哈希的行数
+    :return: digest, str: 哈希值
+    """
+    digest = hashlib.sha1()
+    dates = price_tb.index[:n_rows]
+    tbs = [price_tb.iloc[:n_rows]] + [inputs[name].reindex(index=dates) for name in sorted(inputs)]
+    for tb in tbs:
+        digest.update(str(list(tb.columns)).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(tb).values.tobytes())
+    return digest.hexdigest()
+
+def save_state(state_path, price_tb, inputs, factor_tbs, lookbacks):
+    """
+    保存因子面板、历史长度和输入数据的哈希
+    :param state_path, str: 状态文件路径
+    :param price_tb, DataFrame: 本次使用的完整价格面板
+    :param inputs, dict: 其余输入 {字段名: DataFrame}
+    :param factor_tbs, dict: {因子名: 因子面板}
+    :param lookbacks, dict: {因子名: 历史长度}，None 表示依赖全部历史
+    """
+    state_dir = os.path.dirname(state_path)
+    if state_dir:
+        os.makedirs(state_dir, exist_ok=True)
+    state = {
+        'factor_tbs': factor_tbs,
+        'lookbacks': lookbacks,
+        'n_rows': len(price_tb),
+        'columns': list(price_tb.columns),
+        # 下次更新时用来确认全部历史数据没有被修改
+        'price_hash': history_hash(price_tb, inputs, len(price_tb)),
+    }
+    with open(state_path, 'wb') as f:
+        pickle.dump(state, f)
+
+def same_values(tb_a, tb_b):
+    # 两张表标签相同，数值完全相等（NaN 的位置相同）
+    if tb_a.shape != tb_b.shape or not tb_a.index.equals(tb_b.index) or not tb_a.columns.equals(tb_b.columns):
+        return False
+    values_a, values_b = np.asarray(tb_a, dtype=float), np.asarray(tb_b, dtype=float)
+    return bool(((values_a == values_b) | (np.isnan(values_a) & np.isnan(values_b))).all())
+
+def full_update(compute, price_tb, inputs, state_path, known_lookbacks):
+    # 全量计算，并为后续增量更新保存状态；没有给出历史长度的因子记为 None，下次仍全量计算
+    factor_tbs = compute(price_tb)
+    lookbacks = {name: known_lookbacks.get(name) for name in factor_tbs}
+    save_state(state_path, price_tb, inputs, factor_tbs, lookbacks)
+    return factor_tbs
+
+def incremental_update(compute, price_tb, state_path, known_lookbacks=None, verify_rows=5, inputs=None):
+    """
+    增量计算因子：只在尾部数据上重算新增的行，结果与全量重算逐位相同
+    :param compute, function: compute(price_tb) -> {因子名: 因子面板}，如 alpha_pipeline 中的 Alpha_101
+    :param price_tb, DataFrame: 包含新增交易日的完整价格面板
+    :param state_path, str: 状态文件路径
+    :param known_lookbacks, dict: {因子名: 历史长度}，由算子窗口推算，如 alpha_expression.formula_lookback、Alpha_code_101.alpha_lookback；
+                                  未给出或为 None 的因子依赖全部历史，此时所有因子全量计算
+    :param verify_rows, int: 校验行数，重算的尾部中与上一次结果重叠、必须完全相同的行数
+    :param inputs, dict: compute 还会用到的其余输入 {字段名: DataFrame}，如 open、volume，与价格面板一起检查历史是否被修改
+    :return: factor_tbs, dict: {因子名: 完整的因子面板}
+    """
+    known_lookbacks = known_lookbacks or {}
+    inputs = inputs or {}
+    state = load_state(state_path)
+    if state is None or 'price_hash' not in state:
+        return full_update(compute, price_tb, inputs, state_path, known_lookbacks)
+    # 使用本次推算的历史长度，算子或公式修改后不沿用旧值
+    lookbacks = {name: known_lookbacks.get(name) for name in state['factor_tbs']}
+    n_old = state['n_rows']
+    # 资产变化、数据变短、有因子依赖全部历史时全量重算
+    if list(price_tb.columns) != state['columns'] or len(price_tb) < n_old or None in lookbacks.values():
+        return full_update(compute, price_tb, inputs, state_path, known_lookbacks)
+    # 任意历史数据被修改时全量重算
+    if history_hash(price_tb, inputs, n_old) != state['price_hash']:
+        return full_update(compute, price_tb, inputs, state_path, known_lookbacks)
+    lookback = max(lookbacks.values(), default=0)
+    start = n_old - lookback - verify_rows
+    if start < 0:
+        return full_update(compute, price_tb, inputs, state_path, known_lookbacks)
+    tail_tbs = compute(price_tb.iloc[start:])
+    if set(tail_tbs) != set(state['factor_tbs']):
+        return full_update(compute, price_tb, inputs, state_path, known_lookbacks)
+    factor_tbs = {}
+    for name, tail_tb in tail_tbs.items():
+        old_tb = state['factor_tbs'][name]
+        # 校验行与上一次结果不完全相同时全量重算
+        if not same_values(tail_tb.iloc[lookback:lookback + verify_rows], old_tb.iloc[len(old_tb) - verify_rows:]):
+            return full_update(compute, price_tb, inputs, state_path, known_lookbacks)
+        factor_tbs[name] = pd.concat([old_tb, tail_tb.iloc[lookback + verify_rows:]])
+    save_state(state_path, price_tb, inputs, factor_tbs, lookbacks)
+    return factor_tbs
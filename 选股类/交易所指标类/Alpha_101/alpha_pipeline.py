@@ -1,22 +1,166 @@
 import pandas as pd
+import numpy as np
 from config import CONFIG,config_custom
+import multiprocessing
+import importlib
+import tempfile
+import shutil
 import sys
 import os
 import main
+import data_loader
+
+# 子进程共享的价格面板和 Alphas 实例，由进程池初始化函数在每个子进程中创建一次；同一子进程内的 alpha 共享算子缓存
+shared_price_tb = None
+shared_alphas = None
+# 日期 x 资产 的明细表，并行模式下不从子进程传回
+PANEL_METRIC_KEYS = ('ret_tb', 'nav_tb')
+
+def get_function_name(function_name):
+    # 统一命名
+    return function_name if function_name.endswith('_signal') else function_name + '_signal'
+
+def share_panel(price_tb, file_path):
+    """
+    将价格面板写入内存映射文件，子进程只读映射同一份数据，不再逐个复制
+    :param price_tb, DataFrame: 日期 x 资产 的价格面板
+    :param file_path, str: 内存映射文件路径
+    :return: panel_handle, dict: 子进程重建面板所需的信息（文件路径、形状、类型、索引和列名）
+    """
+    values = np.ascontiguousarray(price_tb.values, dtype=float)
+    mapped = np.memmap(file_path, dtype=values.dtype, mode='w+', shape=values.shape)
+    mapped[:] = values
+    mapped.flush()
+    del mapped
+    return {'path': file_path, 'shape': values.shape, 'dtype': values.dtype.str, 'index': price_tb.index, 'columns': price_tb.columns}
+
+def attach_panel(panel_handle):
+    """
+    在子进程中以只读方式映射价格面板
+    :param panel_handle, dict: share_panel 返回的信息
+    :return: price_tb, DataFrame: 基于内存映射数据的价格面板
+    """
+    values = np.memmap(panel_handle['path'], dtype=panel_handle['dtype'], mode='r', shape=panel_handle['shape'])
+    return pd.DataFrame(values, index=panel_handle['index'], columns=panel_handle['columns'], copy=False)
+
+def init_alpha_worker(panel_handles, model_dir, module_name, cal_model_dir):
+    """
+    进程池初始化函数：映射共享的行情面板，并构造该子进程使用的 Alphas 实例
+    :param panel_handles, dict: {字段名: share_panel 返回的信息}，必须包含 close
+    :param model_dir, str: Alpha 模块所在目录
+    :param module_name, str: Alpha 模块名
+    :param cal_model_dir, str: 回测、指标模块所在目录
+    """
+    global shared_price_tb, shared_alphas
+    for path in (model_dir, cal_model_dir):
+        if path not in sys.path:
+            sys.path.append(path)
+    panel_fields = {field: attach_panel(panel_handle) for field, panel_handle in panel_handles.items()}
+    shared_price_tb = panel_fields['close']
+    module = importlib.import_module(module_name)
+    shared_alphas = module.Alphas.from_panel(**alpha_fields(shared_price_tb, panel_fields))
+
+def alpha_fields(price_tb, price_fields):
+    """
+    整理 Alphas.from_panel 和公式因子使用的行情字段：收盘价为 price_tb，其余字段对齐到收盘价的日期和资产，
+    未提供 returns 时按收盘价计算，不向前填充缺失值，收益率只依赖当天和前一天
+    :param price_tb, DataFrame: 日期 x 资产 的收盘价
+    :param price_fields, dict: {字段名: 日期 x 资产 的 DataFrame}，如 open、high、low、volume、vwap、amount
+    :return: fields, dict: {字段名: DataFrame}
+    """
+    fields = {field: tb.reindex(index=price_tb.index, columns=price_tb.columns) for field, tb in price_fields.items() if field != 'close'}
+    fields['close'] = price_tb
+    if 'returns' not in fields:
+        fields['returns'] = price_tb.pct_change(fill_method=None)
+    return fields
+
+def backtest_factor(factor_tb, price_tb_original, CONFIG):
+    """
+    单个因子回测并计算绩效指标
+    :param factor_tb, DataFrame: 日期 x 资产 的因子值
+    :param price_tb_original, DataFrame: 原始价格面板
+    :param CONFIG, dict: 全局配置
+    :return: cal_metric_result, dict: 指标计算结果
+    """
+    if CONFIG["cal_model_dir"] not in sys.path:
+        sys.path.append(CONFIG["cal_model_dir"])
+    FREQUENCY_INTERVAL = CONFIG["FREQUENCY_INTERVAL"]
+    freq_position = CONFIG["freq_position"]
+    benchmark = CONFIG["benchmark"]
+    subportfolio_num = CONFIG["subportfolio_num"]
+    IC_lag_n = CONFIG["IC_lag_n"]
+    period = CONFIG["period"]
+    winlen = CONFIG["winlen"]
+    metric_mode = CONFIG["metric_mode"]
+    start_date = CONFIG["start_date"]
+    end_date = CONFIG["end_date"]
+    # 调用 backtest
+    import backtest_vector
+    # 调用 cal_metric
+    import cal_metric_api
+    # backtest 会改写输入表的索引，传入浅拷贝（不复制数据），避免影响共享的价格面板和算子缓存中的结果
+    price_tb_original = price_tb_original.copy(deep=False)
+    factor_tb = factor_tb.copy(deep=False)
+    date_range_src = price_tb_original.index
+    ret_tb_original, factor_tb_original, price_tb, ret_tb, factor_tb, position_tb, date_range_src, period = backtest_vector.backtest(factor_tb, price_tb_original, date_range_src, start_date, end_date, FREQUENCY_INTERVAL, period, freq_position)
+    return cal_metric_api.cal_portfolio_metric(price_tb_original, ret_tb, factor_tb, position_tb, benchmark,subportfolio_num, IC_lag_n, period, winlen, metric_mode=metric_mode)
+
+def compact_metric(cal_metric_result):
+    """
+    去掉指标结果中 日期 x 资产 的明细表（PANEL_METRIC_KEYS），保留分组收益、IC、换手率、净值统计和绩效汇总
+    :param cal_metric_result, dict: cal_portfolio_metric 的结果
+    :return: cal_metric_result, dict: 精简后的指标结果
+    """
+    return {key: value for key, value in cal_metric_result.items() if key not in PANEL_METRIC_KEYS}
+
+def run_alpha_shared(function_name, CONFIG):
+    # 子进程中计算单个 alpha 并回测，只返回精简后的指标结果，明细表不经进程池传回
+    factor_tb = getattr(shared_alphas, function_name)()
+    return compact_metric(backtest_factor(factor_tb, shared_price_tb, CONFIG))
+
+def alpha_parallel(factor_dict, price_tb_original, CONFIG, price_fields=None):
+    """
+    并行计算 func_name_factor 中的 alpha：行情面板放入共享的内存映射文件，每个子进程计算一部分 alpha 并完成回测和指标计算
+    :param factor_dict, dict: 因子配置
+    :param price_tb_original, DataFrame: 原始价格面板
+    :param price_fields, dict: 其余行情字段 {字段名: 日期 x 资产 的 DataFrame}
+    :param CONFIG, dict: 全局配置
+    :return: cal_metric_result, dict: {因子名: 精简后的指标计算结果}，按配置顺序排列；不含 ret_tb、nav_tb 等 日期 x 资产 的明细表
+    """
+    function_names = factor_dict["func_name_factor"]
+    # 进程数默认为 CPU 核数，且不超过 alpha 数量
+    max_workers = CONFIG["max_workers"] or multiprocessing.cpu_count()
+    max_workers = max(1, min(max_workers, len(function_names)))
+    model_dir = os.path.dirname(os.path.realpath(__file__))
+    store_dir = tempfile.mkdtemp()
+    try:
+        price_fields = dict(price_fields or {}, close=price_tb_original)
+        panel_handles = {field: share_panel(tb, os.path.join(store_dir, f'{field}.dat')) for field, tb in price_fields.items()}
+        initargs = (panel_handles, model_dir, factor_dict["file_name_model"], CONFIG["cal_model_dir"])
+        with multiprocessing.Pool(processes=max_workers, initializer=init_alpha_worker, initargs=initargs) as pool:
+            # 每个 alpha 一个任务，空闲的子进程领取下一个，结果按配置顺序取回
+            async_results = {}
+            for function_name in function_names:
+                async_results[get_function_name(function_name)] = pool.apply_async(run_alpha_shared, (function_name, CONFIG))
+            return {function_name: async_result.get() for function_name, async_result in async_results.items()}
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
 
 def alpha_pipeline(config_custom, CONFIG):
     # ------------数据获取/处理-------------
     factor_dicts = config_custom['factor_dict']
     cal_metric_result = {}
 
-    for factor_dict in factor_dicts:
+    for factor_index, factor_dict in enumerate(factor_dicts):
         # 计算数据目录的绝对路径
         data_dir = os.path.abspath(config_custom["data_dir"])
         # 计算文件的绝对路径
         file_path = os.path.join(data_dir, factor_dict["param_dataSrc"]["func_name_dataSrc"])
-        # 读取数据文件
-        price_tb_original = pd.read_csv(file_path)
-        price_tb_original.set_index('Date', inplace=True)
+        # 读取数据文件；同一文件只解析一次，各因子共用缓存中的只读数据
+        price_tb_original = data_loader.load_price_table(file_path, date_format=config_custom["date_format"])
+        # 其余行情字段，每个字段一个 日期 x 资产 的文件，面板模式下与收盘价一起传给 Alphas.from_panel
+        field_dataSrc = factor_dict["param_dataSrc"].get("field_dataSrc", {})
+        price_fields = {field: data_loader.load_price_table(os.path.join(data_dir, file_name), date_format=config_custom["date_format"]) for field, file_name in field_dataSrc.items()}
 
         # ------------因子计算-------------
         def Alpha_101(factor, price_tb):
@@ -26,52 +170,75 @@ def alpha_pipeline(config_custom, CONFIG):
             sys.path.append(os.path.dirname(os.path.realpath(__file__)))
             module_name = factor["file_name_model"]
             module = importlib.import_module(module_name)
-            for function_name in factor["func_name_factor"]:
-                results = pd.DataFrame(index=price_tb.index)
-                for fund in price_tb.columns:
-                    df_fund = pd.DataFrame(index=price_tb.index)
-                    df_fund['S_DQ_OPEN'] = None
-                    df_fund['S_DQ_CLOSE'] = price_tb[fund]
-                    df_fund['S_DQ_HIGH'] = None
-                    df_fund['S_DQ_LOW'] = None
-                    df_fund['S_DQ_VOLUME'] = None
-                    df_fund['S_DQ_PCTCHANGE'] = price_tb[fund].pct_change()
-                    df_fund['S_DQ_AMOUNT'] = None
-                    alphas_instance = module.Alphas(df_fund)
-                    result = getattr(alphas_instance, function_name)()
-                    results[fund] = result
-                #统一命名
-                function_name = function_name if function_name.endswith('_signal') else function_name + '_signal'
-                factor_tb[function_name] = results
+            if config_custom["panel_mode"]:
+                # 面板模式：整个 日期 x 资产 矩阵只构造一个 Alphas，每个 alpha 只计算一次，rank 为真正的截面排序
+                alphas_instance = module.Alphas.from_panel(**alpha_fields(price_tb, price_fields))
+                for function_name in factor["func_name_factor"]:
+                    results = getattr(alphas_instance, function_name)()
+                    #统一命名
+                    function_name = function_name if function_name.endswith('_signal') else function_name + '_signal'
+                    factor_tb[function_name] = results
+            else:
+                for function_name in factor["func_name_factor"]:
+                    results = pd.DataFrame(index=price_tb.index)
+                    for fund in price_tb.columns:
+                        df_fund = pd.DataFrame(index=price_tb.index)
+                        df_fund['S_DQ_OPEN'] = None
+                        df_fund['S_DQ_CLOSE'] = price_tb[fund]
+                        df_fund['S_DQ_HIGH'] = None
+                        df_fund['S_DQ_LOW'] = None
+                        df_fund['S_DQ_VOLUME'] = None
+                        df_fund['S_DQ_PCTCHANGE'] = price_tb[fund].pct_change()
+                        df_fund['S_DQ_AMOUNT'] = None
+                        alphas_instance = module.Alphas(df_fund)
+                        result = getattr(alphas_instance, function_name)()
+                        results[fund] = result
+                    #统一命名
+                    function_name = function_name if function_name.endswith('_signal') else function_name + '_signal'
+                    factor_tb[function_name] = results
+            # 公式因子：所有公式合并为一张计算图，相同子表达式只计算一次
+            if factor.get("formula_factor"):
+                import alpha_expression
+                panel_data = alpha_fields(price_tb, price_fields)
+                for function_name, results in alpha_expression.compute_formulas(factor["formula_factor"], panel_data).items():
+                    #统一命名
+                    function_name = function_name if function_name.endswith('_signal') else function_name + '_signal'
+                    factor_tb[function_name] = results
             return factor_tb
 
-        factor_tb = Alpha_101(factor_dict, price_tb_original)
+        # 根据全局配置决定是否并行计算，兼容布尔值和字符串两种写法；并行只支持面板模式，增量模式优先；
+        # 在 all_factor 的子进程（守护进程）中不能再创建进程池，改为顺序计算
+        parallel = CONFIG["multiProcess_alpha"] in (True, "True") and not multiprocessing.current_process().daemon
+        if config_custom["panel_mode"] and parallel and factor_dict["func_name_factor"] and not config_custom["incremental"]:
+            # 方法因子在子进程中计算并回测，剩余的公式因子在主进程中计算
+            cal_metric_result.update(alpha_parallel(factor_dict, price_tb_original, CONFIG, price_fields))
+            factor_dict = dict(factor_dict, func_name_factor=[])
+        if config_custom["incremental"]:
+            # 增量模式：保存上一次的因子面板，新增交易日时只在尾部数据上计算，结果与全量重算逐位相同；
+            # 公式因子和方法因子的历史长度都由算子窗口推算，有因子推算不出上限时全量计算
+            import alpha_incremental
+            import alpha_expression
+            sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+            module = importlib.import_module(factor_dict["file_name_model"])
+            # 面板模式下提供了 returns 时直接使用，历史长度为 0，否则按收盘价计算为 1；非面板模式的收益率向前填充缺失值，没有上限
+            returns_lookback = (0 if 'returns' in price_fields else 1) if config_custom["panel_mode"] else None
+            method_lookbacks = module.alpha_lookback(factor_dict["func_name_factor"], panel=config_custom["panel_mode"], returns_lookback=returns_lookback)
+            formula_lookbacks = alpha_expression.formula_lookback(factor_dict.get("formula_factor", {}))
+            known_lookbacks = {get_function_name(name): lookback for name, lookback in list(method_lookbacks.items()) + list(formula_lookbacks.items())}
+            state_path = os.path.join(config_custom["incremental_dir"], f'{factor_dict["file_name_model"]}_{factor_index}_state.pkl')
+            factor_tb = alpha_incremental.incremental_update(lambda price_tb: Alpha_101(factor_dict, price_tb), price_tb_original, state_path, known_lookbacks, inputs=price_fields)
+        else:
+            factor_tb = Alpha_101(factor_dict, price_tb_original)
 
         # ------------回测-------------
-        sys.path.append(CONFIG["cal_model_dir"])
-        FREQUENCY_INTERVAL = CONFIG["FREQUENCY_INTERVAL"]
-        freq_position = CONFIG["freq_position"]
-        benchmark = CONFIG["benchmark"]
-        subportfolio_num = CONFIG["subportfolio_num"]
-        IC_lag_n = CONFIG["IC_lag_n"]
-        period = CONFIG["period"]
-        winlen = CONFIG["winlen"]
-        start_date = CONFIG["start_date"]
-        end_date = CONFIG["end_date"]
-        # 调用 backtest
-        import backtest_vector
-        # 调用 cal_metric
-        import cal_metric_api
         for factor_name, factor_tb in factor_tb.items():
-            date_range_src = price_tb_original.index
-            ret_tb_original, factor_tb_original, price_tb, ret_tb, factor_tb, position_tb, date_range_src, period = backtest_vector.backtest(factor_tb, price_tb_original, date_range_src, start_date, end_date, FREQUENCY_INTERVAL, period, freq_position)
-            cal_metric_result[factor_name] = cal_metric_api.cal_portfolio_metric(price_tb_original, ret_tb, factor_tb, position_tb, benchmark,subportfolio_num, IC_lag_n, period, winlen)
+            cal_metric_result[factor_name] = backtest_factor(factor_tb, price_tb_original, CONFIG)
 
     # ------------输出-------------
     sys.path.append(CONFIG["output_model_dir"])
     import output_file
     output_file_path = os.path.join(CONFIG['output_dir'], "cal_metric_indicator.pkl")
-    cal_metric_result = output_file.output_func(cal_metric_result, output_file_path)
+    cal_metric_result = output_file.output_func(cal_metric_result, output_file_path, CONFIG["output_format"])
 
     return cal_metric_result
 
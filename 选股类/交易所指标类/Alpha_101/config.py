@@ -12,6 +12,8 @@ CONFIG = {
     "output_model_dir":"../../../../",
     # 结果输出路径
     "output_dir": "result/",
+    # 结果输出格式；"pickle"：整个结果字典保存为一个 pickle 文件；"feather"、"parquet"：每张表单独保存，并用 manifest.json 记录嵌套路径，可按需读取单张表；
+    "output_format": "pickle",  # "feather" "parquet"
     # 回测开始日期；支持'年-月-日'['2018-11-23']、'年-月-日 时:分:秒'['2018-11-23 11:12:13']、'年-月-日 时:分:秒.毫秒'['2018-11-23 11:12:13.12345']格式;
     "start_date": '2018-01-01',
     # 回测结束日期；支持'年-月-日'['2018-11-23']、'年-月-日 时:分:秒'['2018-11-23 11:12:13']、'年-月-日 时:分:秒.毫秒'['2018-11-23 11:12:13.12345']格式;
@@ -33,9 +35,15 @@ CONFIG = {
     "IC_types": ["IC_all_crossSection", "IC_subportfolio_crossSection", "IC_subportfolio_retRatio"],
     # IC滞后值，可以是list或者int，也可以置空；pipeline中使用；
     "IC_lag_n": [1, 2, 3],  # [1,2,3]
+    # 绩效指标计算模式；"native"：只使用原生向量化指标；"compat"：额外调用 ffn、quantstats、empyrical、pyfinance 逐个计算（兼容模式，速度较慢）；
+    "metric_mode": "native",  # "compat"
 
     # all_factor层是否并行，只在all_factor_Demo使用，pipeline、backtest中不使用；
     "multiProcess_all_factor": False,
+    # alpha层是否并行：价格面板放入共享内存映射文件，每个子进程计算一部分 alpha 并完成回测，只返回精简的指标结果（不含 ret_tb、nav_tb 明细表）；只在面板模式下生效
+    "multiProcess_alpha": False,
+    # 并行进程数，None 表示使用 CPU 核数
+    "max_workers": None,
     # multi_run层是否并行
     "multiProcess_multiRun": True,  # False
 
@@ -57,10 +65,23 @@ config_custom = {
     # 自定义配置项说明：因子自有配置项，只能在因子空间主动使用，不进backtest，不一定出现在远端config中。
     # 动态修改方法：可以在factor_dict中重新赋值；也可以set_option_instrument(context, conditions, ref=None)修改；
     "data_dir":"data",
+    # 数据文件中日期的格式，读取时按该格式转换为时间索引；None 表示不转换（pickle 数据已是时间索引）
+    "date_format": '%Y/%m/%d',
     "output_dir": "result/",
+    # 是否使用面板模式计算 Alpha；True：所有资产组成 日期 x 资产 矩阵，每个 alpha 只计算一次，rank 为截面排序；False：逐个资产单独计算（旧模式）
+    "panel_mode": False,
+    # 是否增量计算 Alpha；True：保存上一次的因子面板和输入尾部数据，新增交易日时只重算新增的行，结果与全量重算逐位相同；
+    # 有因子推算不出历史长度上限（如使用 decay_linear）或校验不通过时自动全量重算
+    "incremental": False,
+    # 增量计算状态的保存目录
+    "incremental_dir": "result/alpha_state/",
     "factor_dict": [{"func_name_factor": ['alpha009', 'alpha010', 'alpha019'],
-               "param_dataSrc": {"func_name_dataSrc": 'price_tb.csv', "colName_dataSrc": ['date', 'ret']},
+               "param_dataSrc": {"func_name_dataSrc": 'price_tb.csv', "colName_dataSrc": ['date', 'ret'],
+                                 # 面板模式下其余行情字段的数据文件，{字段名: 文件名}，每个文件为 日期 x 资产 的表；可用字段 open、high、low、volume、vwap、amount、returns
+                                 "field_dataSrc": {}},  # {"open": 'open_tb.csv', "high": 'high_tb.csv', "low": 'low_tb.csv', "volume": 'volume_tb.csv', "amount": 'amount_tb.csv'}
                "file_name_model":"Alpha_code_101" ,
+               # 公式因子，{因子名: WorldQuant 风格公式}；由 alpha_expression 解析，无需手写 Alphas 方法；可用变量为 close、returns 和 field_dataSrc 中的字段
+               "formula_factor": {},  # {"alpha_custom_001": "(-1 * correlation(rank(close), rank(returns), 10))"}
                },]
 }
 
@@ -0,0 +1,89 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import Alpha_code_101
+import alpha_expression
+import alpha_incremental
+
+FUNCTION_NAMES = ['alpha001', 'alpha007', 'alpha019', 'alpha060', 'alpha101']
+FORMULAS = {'formula_1': 'rank(correlation(open, volume, 10)) * -1',
+            'formula_2': 'ts_rank(stddev(returns, 20), 5) + covariance(rank(high), rank(volume), 5)'}
+
+
+def make_fields(n_rows=400, n_assets=6):
+    # 随机游走的 日期 x 资产 行情面板，含缺失值
+    rng = np.random.default_rng(0)
+    index = pd.date_range('2015-01-01', periods=n_rows, freq='B')
+    columns = [f'asset_{i}' for i in range(n_assets)]
+    close = pd.DataFrame(100 * np.exp(np.cumsum(rng.standard_normal((n_rows, n_assets)) * 0.02, axis=0)), index=index, columns=columns)
+    fields = {
+        'open': close * (1 + rng.standard_normal(close.shape) * 0.005),
+        'high': close * (1 + np.abs(rng.standard_normal(close.shape)) * 0.01),
+        'low': close * (1 - np.abs(rng.standard_normal(close.shape)) * 0.01),
+        'volume': pd.DataFrame(rng.integers(1000, 5000, close.shape).astype(float), index=index, columns=columns),
+    }
+    close.iloc[100:104, 2] = np.nan
+    fields['volume'].iloc[200, 1] = np.nan
+    return close, fields
+
+
+def compute(close, fields):
+    fields = {name: tb.reindex(index=close.index) for name, tb in fields.items()}
+    alphas = Alpha_code_101.Alphas.from_panel(close=close, vwap=(fields['high'] + fields['low'] + close) / 3, **fields)
+    factor_tbs = {name: getattr(alphas, name)() for name in FUNCTION_NAMES}
+    data = dict(fields, close=close, returns=close.pct_change(fill_method=None))
+    factor_tbs.update(alpha_expression.compute_formulas(FORMULAS, data))
+    return factor_tbs
+
+
+def test_operators_start_independent():
+    # 量级差异大的数据，缺失值只在前几行；从任意起点重算，窗口填满之后的结果与全量计算逐位相同
+    rng = np.random.default_rng(1)
+    x = pd.DataFrame(np.exp(rng.standard_normal((800, 12)) * 3) * 1e3)
+    y = pd.DataFrame(rng.standard_normal((800, 12)))
+    x.iloc[10:14, 2] = np.nan
+    operators = [
+        (lambda x, y: Alpha_code_101.ts_sum(x, 20), 20),
+        (lambda x, y: Alpha_code_101.sma(x, 20), 20),
+        (lambda x, y: Alpha_code_101.stddev(x, 20), 20),
+        (lambda x, y: Alpha_code_101.correlation(x, y, 10), 10),
+        (lambda x, y: Alpha_code_101.covariance(x, y, 10), 10),
+        (lambda x, y: Alpha_code_101.product(y, 10), 10),
+        (lambda x, y: Alpha_code_101.scale(Alpha_code_101.rank(x)), 1),
+    ]
+    for operator, window in operators:
+        full = operator(x, y).values
+        for start in (37, 500, 701):
+            tail = operator(x.iloc[start:], y.iloc[start:]).values
+            np.testing.assert_array_equal(tail[window - 1:], full[start + window - 1:])
+
+
+def test_alpha_lookback():
+    lookbacks = Alpha_code_101.alpha_lookback(['alpha001', 'alpha019', 'alpha031', 'alpha101'])
+    # returns 1 + stddev(20) 19 + ts_argmax(5) 4；decay_linear 没有上限
+    assert lookbacks == {'alpha001': 24, 'alpha019': 250, 'alpha031': None, 'alpha101': 0}
+    assert Alpha_code_101.alpha_lookback(['alpha001'], panel=False) == {'alpha001': None}
+
+
+def test_incremental_matches_full(tmp_path):
+    close, fields = make_fields()
+    lookbacks = dict(Alpha_code_101.alpha_lookback(FUNCTION_NAMES), **alpha_expression.formula_lookback(FORMULAS))
+    state_path = str(tmp_path / 'state.pkl')
+    tail_rows = []
+
+    def compute_tail(price_tb):
+        tail_rows.append(len(price_tb))
+        return compute(price_tb, fields)
+
+    n_old = len(close) - 3
+    alpha_incremental.incremental_update(compute_tail, close.iloc[:n_old], state_path, lookbacks, inputs=fields)
+    for n_rows in range(n_old + 1, len(close) + 1):
+        factor_tbs = alpha_incremental.incremental_update(compute_tail, close.iloc[:n_rows], state_path, lookbacks, inputs=fields)
+        for name, full_tb in compute(close.iloc[:n_rows], fields).items():
+            assert full_tb.index.equals(factor_tbs[name].index)
+            np.testing.assert_array_equal(factor_tbs[name].values, full_tb.values)
+    # 首次全量计算，之后每次只重算 历史长度 + 校验行 + 新增行
+    assert tail_rows == [n_old] + [max(lookbacks.values()) + 5 + 1] * 3